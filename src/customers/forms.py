@@ -5,10 +5,12 @@ from django.forms.models import (
     inlineformset_factory,
     BaseInlineFormSet,
 )
+from django.db.transaction import atomic
 from django.utils.translation import gettext_lazy as _
 
 from customers.models import Customer, NotificationGroup, Email
-from products.models import Product
+from products.forms import ProductMultipleChoiceField
+from utils.formsets import ExistingObjectsMixin, register_formset
 
 
 def is_empty_form(form):
@@ -36,8 +38,13 @@ def is_adding_nested_inlines_to_empty_form(form):
     return False
 
 
-class EmailFormSetBase(BaseInlineFormSet):
-    pass
+class EmailFormSetBase(ExistingObjectsMixin, BaseInlineFormSet):
+    def get_queryset(self):
+        # Groups come with their emails prefetched, so a formset of many groups doesn't query once per group.
+        prefetched = getattr(self.instance, "_prefetched_objects_cache", {})
+        if "emails" in prefetched:
+            return sorted(prefetched["emails"], key=lambda email: email.pk)
+        return super().get_queryset()
 
 
 EmailFormSet = inlineformset_factory(
@@ -47,9 +54,10 @@ EmailFormSet = inlineformset_factory(
     fields=("address",),
     extra=0,
 )
+register_formset("emails", EmailFormSet)
 
 
-class NotificationGroupWithEmailsFormSet(BaseInlineFormSet):
+class NotificationGroupWithEmailsFormSet(ExistingObjectsMixin, BaseInlineFormSet):
     def add_fields(self, form, index):
         super().add_fields(form, index)
 
@@ -83,23 +91,78 @@ class NotificationGroupWithEmailsFormSet(BaseInlineFormSet):
                     ),
                 )
 
+    def get_queryset(self):
+        if not hasattr(self, "_queryset"):
+            self._queryset = super().get_queryset().prefetch_related("emails")
+        return self._queryset
+
     def save(self, commit=True):
+        """
+        Collects the creates, updates and deletes of groups and their emails, then applies them with one query per
+        model and operation in a single transaction. Deletes run first, so an address removed from a group can be
+        added back in the same submission.
+        """
+        self.new_objects = []
+        self.changed_objects = []
+        self.deleted_objects = []
+        new_emails = []
+        changed_emails = []
+        deleted_emails = []
         result = []
 
         for form in self.forms:
+            group = form.instance
             if form.cleaned_data.get("DELETE"):
-                if form.instance.pk and commit:
-                    form.instance.delete()
+                # Its emails are deleted with it.
+                if is_form_persisted(form):
+                    self.deleted_objects.append(group)
                 continue
 
-            instance = form.save(commit=commit)
-            result.append(instance)
-
-            if hasattr(form, "nested") and not is_adding_nested_inlines_to_empty_form(
-                form
-            ):
-                for formset in form.nested:
-                    formset.save(commit=commit)
+            if not is_form_persisted(form):
+                if not form.has_changed():
+                    continue
+                setattr(group, self.fk.name, self.instance)
+                self.new_objects.append(group)
+            elif form.has_changed():
+                self.changed_objects.append((group, form.changed_data))
+            result.append(group)
+
+            for formset in getattr(form, "nested", ()):
+                for nested_form in formset.forms:
+                    email = nested_form.instance
+                    if nested_form.cleaned_data.get("DELETE"):
+                        if is_form_persisted(nested_form):
+                            deleted_emails.append(email)
+                    elif not is_form_persisted(nested_form):
+                        if nested_form.has_changed():
+                            # The group may not be saved yet, bulk_create takes its id once it is.
+                            email.group = group
+                            new_emails.append(email)
+                    elif nested_form.has_changed():
+                        changed_emails.append(email)
+
+        if not commit:
+            return result
+
+        with atomic():
+            if deleted_emails:
+                Email.objects.filter(
+                    pk__in=[email.pk for email in deleted_emails]
+                ).delete()
+            if self.deleted_objects:
+                NotificationGroup.objects.filter(
+                    pk__in=[group.pk for group in self.deleted_objects]
+                ).delete()
+            if self.changed_objects:
+                NotificationGroup.objects.bulk_update(
+                    [group for group, _ in self.changed_objects], self.form._meta.fields
+                )
+            NotificationGroup.objects.bulk_create(self.new_objects)
+            if changed_emails:
+                Email.objects.bulk_update(
+                    changed_emails, EmailFormSet.form._meta.fields
+                )
+            Email.objects.bulk_create(new_emails)
 
         return result
 
@@ -111,16 +174,13 @@ NotificationGroupFormSet = inlineformset_factory(
     fields=("name",),
     extra=0,
 )
+register_formset("notification_groups", NotificationGroupFormSet)
 
 
 class CreateCustomerForm(UserCreationForm):
     display_name = forms.CharField(max_length=250)
     phone_number = forms.CharField(max_length=250, required=False)
-    products = forms.ModelMultipleChoiceField(
-        queryset=Product.objects.all(),
-        widget=forms.CheckboxSelectMultiple,
-        required=False,
-    )
+    products = ProductMultipleChoiceField(required=False)
 
     class Meta:
         model = get_user_model()
@@ -150,11 +210,7 @@ class CreateCustomerForm(UserCreationForm):
 class UpdateCustomerForm(forms.ModelForm):
     display_name = forms.CharField(max_length=250)
     phone_number = forms.CharField(max_length=250, required=False)
-    products = forms.ModelMultipleChoiceField(
-        queryset=Product.objects.all(),
-        widget=forms.CheckboxSelectMultiple,
-        required=False,
-    )
+    products = ProductMultipleChoiceField(required=False)
     email = forms.EmailField(max_length=250, required=False)
 
     class Meta:
@@ -179,3 +235,8 @@ class UpdateCustomerForm(forms.ModelForm):
             customer.save()
             customer.products.set(self.cleaned_data.get("products", []))
         return customer
+
+
+class ApiPageForm(forms.Form):
+    cursor = forms.CharField(required=False)
+    limit = forms.IntegerField(required=False, min_value=1, max_value=1000)
@@ -1,11 +1,22 @@
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.db.models import F
+from django.db.models.functions import Upper
 
 from products.models import Product
 
 User = get_user_model()
 
 
+class CustomerManager(models.Manager):
+    def bump_stock_version(self, customer_ids) -> None:
+        """
+        Marks the stock and products of customers as changed, so API clients holding their ETag fetch them again.
+        Called in the database transaction making the change, so the new version is visible exactly when the change is.
+        """
+        self.filter(pk__in=customer_ids).update(stock_version=F("stock_version") + 1)
+
+
 class Customer(models.Model):
     """
     Represents a customer with an associated user account.
@@ -19,6 +30,23 @@ class Customer(models.Model):
     phone_number = models.CharField(blank=True, max_length=255)
     status = models.CharField(blank=False, default="Active", max_length=255)
     products = models.ManyToManyField("products.Product", blank=True)
+    stock_version = models.PositiveBigIntegerField(
+        default=0,
+        editable=False,
+        help_text="Incremented whenever the customer's stock or products change, the API derives its ETags from it.",
+    )
+
+    objects = CustomerManager()
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of the customer list
+            models.Index(
+                fields=["display_name", "id"], name="customer_name_keyset_idx"
+            ),
+            # Case-insensitive prefix search on the customer list
+            models.Index(Upper("display_name"), name="customer_upper_name_idx"),
+        ]
 
     def __str__(self) -> str:
         return f"{self.user} ({self.phone_number}) {self.status}"
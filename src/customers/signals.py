@@ -0,0 +1,88 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from customers.models import Customer
+from inventory.models import StockBalance, StorageLocation
+from products.models import (
+    Product,
+    ProductFieldValue,
+    ProductTemplate,
+    ProductTemplateField,
+)
+
+
+def bump_product_customers(product_id: int) -> None:
+    Customer.objects.bump_stock_version(
+        Customer.objects.filter(products=product_id).values("pk")
+    )
+
+
+def bump_template_customers(template_id: int) -> None:
+    Customer.objects.bump_stock_version(
+        Customer.objects.filter(products__template=template_id).values("pk")
+    )
+
+
+@receiver(m2m_changed, sender=Customer.products.through)
+def bump_assigned_customers(
+    sender, instance, action, reverse, pk_set, **kwargs
+) -> None:
+    """
+    Bumps the stock version of customers gaining or losing products, from either side of the relation.
+    """
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if not reverse:
+        Customer.objects.bump_stock_version([instance.pk])
+    elif action == "pre_clear":
+        bump_product_customers(instance.pk)
+    elif pk_set:
+        Customer.objects.bump_stock_version(pk_set)
+
+
+@receiver(post_save, sender=Product)
+@receiver(pre_delete, sender=Product)
+def bump_product_change(sender, instance, **kwargs) -> None:
+    """
+    Bumps the stock version of customers holding a changed product. Before a delete, while the product is still
+    assigned to them.
+    """
+    bump_product_customers(instance.pk)
+
+
+@receiver(post_save, sender=ProductFieldValue)
+@receiver(post_delete, sender=ProductFieldValue)
+def bump_product_value_change(sender, instance, origin=None, **kwargs) -> None:
+    if isinstance(origin, Product) or getattr(origin, "model", None) is Product:
+        return
+    bump_product_customers(instance.product_id)
+
+
+@receiver(post_save, sender=ProductTemplate)
+def bump_template_change(sender, instance, created, **kwargs) -> None:
+    """
+    Bumps the stock version of customers holding products of a changed template. Its save rebuilds their attributes
+    with bulk_update, which sends no signals.
+    """
+    if not created:
+        bump_template_customers(instance.pk)
+
+
+@receiver(post_save, sender=ProductTemplateField)
+def bump_template_field_change(sender, instance, created, **kwargs) -> None:
+    if not created:
+        bump_template_customers(instance.template_id)
+
+
+@receiver(post_save, sender=StorageLocation)
+@receiver(pre_delete, sender=StorageLocation)
+def bump_location_change(sender, instance, created=False, **kwargs) -> None:
+    """
+    Bumps the stock version of customers with stock at a renamed location. Before a delete, while their balances at
+    it still exist.
+    """
+    if created:
+        return
+    Customer.objects.bump_stock_version(
+        StockBalance.objects.filter(location=instance.pk).values("customer_id")
+    )
@@ -1,3 +1,215 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from django.urls import reverse
+
+from customers.models import Customer, Email, NotificationGroup
+from customers.views import CustomerListView
+from inventory.models import StockBalance, StorageLocation
+from inventory.tests import make_customer, make_product, post_lines
+from products.models import ProductTemplateField
+from utils.pagination import encode_cursor
+
+
+def formset_data(formset) -> dict:
+    """
+    Returns the POST data of a formset as rendered, with the formsets nested in its forms.
+    """
+    data = {field.html_name: field.value() for field in formset.management_form}
+    for form in formset.forms:
+        data.update(
+            {
+                field.html_name: field.value()
+                for field in form
+                if field.value() is not None
+            }
+        )
+        for nested in getattr(form, "nested", ()):
+            data.update(formset_data(nested))
+    return data
+
+
+# Cursors that decode to lists of the right length, but hold values the ordering fields can't take.
+MALFORMED_CURSORS = [
+    "WyJ4IiwgIngiXQ==",
+    encode_cursor(["x"]),
+    encode_cursor([None, None]),
+    encode_cursor([10**30, 10**30]),
+    encode_cursor([[1], {"a": 1}]),
+    "not base64!",
+]
+
+
+class CustomerListTests(TestCase):
+    def setUp(self):
+        self.customers = [make_customer(f"Customer {i:02}") for i in range(5)]
+
+    @mock.patch.object(CustomerListView, "per_page", 2)
+    def test_pages_follow_cursor(self):
+        url = reverse("customers:customer_list")
+        names = []
+        cursor = ""
+        for _ in range(3):
+            response = self.client.get(url, {"cursor": cursor})
+            page = response.context["page"]
+            names += [customer.display_name for customer in page]
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        self.assertEqual(names, sorted(c.display_name for c in self.customers))
+
+    def test_malformed_cursor_returns_first_page(self):
+        url = reverse("customers:customer_list")
+        for cursor in MALFORMED_CURSORS:
+            with self.subTest(cursor):
+                response = self.client.get(url, {"cursor": cursor})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.context["page"]), 5)
+
+
+class CustomerApiTests(TestCase):
+    def setUp(self):
+        staff = get_user_model().objects.create_user(username="staff", is_staff=True)
+        self.client.force_login(staff)
+        self.customer = make_customer()
+        self.product = make_product()
+        self.customer.products.add(self.product)
+        for name in ["Rack 1", "Rack 2", "Rack 3"]:
+            location = StorageLocation.objects.create(name=name)
+            post_lines(self.customer, self.product, location, 2)
+
+    def test_stock_pages(self):
+        url = reverse("customers:customer_stock_api", args=[self.customer.pk])
+        response = self.client.get(url, {"limit": 2})
+        first = response.json()
+        self.assertEqual(
+            [row["location__name"] for row in first["results"]], ["Rack 1", "Rack 2"]
+        )
+        second = self.client.get(first["next"]).json()
+        self.assertEqual(
+            [row["location__name"] for row in second["results"]], ["Rack 3"]
+        )
+        self.assertIsNone(second["next"])
+        self.assertEqual(StockBalance.objects.filter(customer=self.customer).count(), 3)
+
+    def test_malformed_cursor_returns_first_page(self):
+        for name in ["customer_stock_api", "customer_products_api"]:
+            url = reverse(f"customers:{name}", args=[self.customer.pk])
+            for cursor in MALFORMED_CURSORS:
+                with self.subTest(name, cursor=cursor):
+                    response = self.client.get(url, {"cursor": cursor})
+                    self.assertEqual(response.status_code, 200)
+                    self.assertTrue(response.json()["results"])
+
+    def assertBumps(self, change, url_name: str = "customer_products_api"):
+        """
+        Asserts the change bumps the customer's stock version, so polls with the ETag from before it get the new
+        page, and leaves other customers alone.
+        """
+        other = make_customer("Other")
+        url = reverse(f"customers:{url_name}", args=[self.customer.pk])
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        change()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        other.refresh_from_db()
+        self.assertEqual(other.stock_version, 0)
+        return response.json()["results"]
+
+    def test_location_rename_changes_etag(self):
+        location = StorageLocation.objects.get(name="Rack 1")
+        location.name = "Bay 1"
+        results = self.assertBumps(location.save, "customer_stock_api")
+        self.assertIn("Bay 1", [row["location__name"] for row in results])
+
+    def test_location_delete_changes_etag(self):
+        location = StorageLocation.objects.create(name="Rack 4")
+        StockBalance.objects.create(
+            customer=self.customer, product=self.product, location=location
+        )
+        self.assertBumps(location.delete, "customer_stock_api")
+
+    def test_template_rename_changes_etag(self):
+        template = self.product.template
+        template.name = "Tubing"
+        results = self.assertBumps(template.save)
+        self.assertEqual(results[0]["template"], "Tubing")
+
+    def test_template_field_change_changes_etag(self):
+        field = ProductTemplateField.objects.create(
+            template=self.product.template,
+            name="OD",
+            field_type=ProductTemplateField.TEXT,
+        )
+        field.name = "Outer diameter"
+        self.assertBumps(field.save)
+
+    def test_unknown_customer(self):
+        url = reverse(
+            "customers:customer_stock_api",
+            args=[Customer.objects.order_by("pk").last().pk + 1],
+        )
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class CustomerUpdateTests(TestCase):
+    prefix = "notification_group_formset"
+
+    def setUp(self):
+        self.customer = make_customer()
+        groups = NotificationGroup.objects.bulk_create(
+            NotificationGroup(customer=self.customer, name=f"Group {i}")
+            for i in range(30)
+        )
+        Email.objects.bulk_create(
+            Email(group=group, address=f"user{j}@group{i}.example.com")
+            for i, group in enumerate(groups)
+            for j in range(10)
+        )
+        self.url = reverse("customers:customer_update", args=[self.customer.pk])
+
+    def edited_data(self) -> dict:
+        """
+        Renames every group, adds an address to every group, edits and deletes one address of every group, and
+        deletes the last group.
+        """
+        response = self.client.get(self.url)
+        form = response.context["form"]
+        (formset,) = response.context["formsets"]
+        data = {
+            field.html_name: field.value()
+            for field in form
+            if field.value() is not None
+        }
+        data.update(formset_data(formset))
+
+        for i, group_form in enumerate(formset.forms):
+            data[f"{group_form.prefix}-name"] = f"Renamed {i}"
+            emails = group_form.nested[0]
+            data[f"{emails.prefix}-0-address"] = f"edited@group{i}.example.com"
+            data[f"{emails.prefix}-1-DELETE"] = "on"
+            data[f"{emails.prefix}-10-address"] = f"new@group{i}.example.com"
+            data[f"{emails.prefix}-10-group"] = group_form.instance.pk
+            data[f"{emails.prefix}-TOTAL_FORMS"] = 11
+        data[f"{self.prefix}-29-DELETE"] = "on"
+        return data
+
+    def test_saves_formset_in_constant_queries(self):
+        data = self.edited_data()
+
+        # One query per model and operation however many groups and addresses are posted, and three more to store
+        # the session's replica pin, see utils.db_routing.
+        with self.assertNumQueries(24):
+            response = self.client.post(self.url, data)
 
-# Create your tests here.
+        self.assertEqual(response.status_code, 302)
+        groups = NotificationGroup.objects.filter(customer=self.customer)
+        self.assertEqual(groups.count(), 29)
+        self.assertFalse(groups.exclude(name__startswith="Renamed").exists())
+        emails = Email.objects.filter(group__customer=self.customer)
+        self.assertEqual(emails.count(), 29 * 10)
+        self.assertEqual(emails.filter(address__startswith="edited@").count(), 29)
+        self.assertEqual(emails.filter(address__startswith="new@").count(), 29)
+        self.assertFalse(emails.filter(address__startswith="user1@").exists())
@@ -1,7 +1,7 @@
 from django.urls import path
 
 from customers.views import CustomerCreateView, add_form, CustomerUpdateView, CustomerListView, CustomerDeleteView, \
-    CustomerDetailView
+    CustomerDetailView, customer_products_api, customer_stock_api
 
 app_name = "customers"
 
@@ -12,4 +12,6 @@ urlpatterns = [
     path("<int:pk>/delete/", CustomerDeleteView.as_view(), name="customer_delete"),
     path("", CustomerListView.as_view(), name="customer_list"),
     path("partials/add_form/", add_form, name="add_form"),
+    path("<int:pk>/api/products/", customer_products_api, name="customer_products_api"),
+    path("<int:pk>/api/stock/", customer_stock_api, name="customer_stock_api"),
 ]
@@ -1,69 +1,80 @@
+import hashlib
+from urllib.parse import urlencode
+
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import get_user_model
-from django.views.decorators.http import require_POST
+from django.db.transaction import atomic
+from django.db.models.functions import Upper
+from django.views.decorators.http import condition, require_GET, require_POST
 from django.urls.base import reverse_lazy
 from django.views.generic import ListView, DeleteView, DetailView
 from django.views.generic.edit import CreateView, UpdateView
-from django.utils.module_loading import import_string
-from django.template.loader import render_to_string
-from django.http import HttpResponse
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseBadRequest,
+    HttpResponseRedirect,
+    JsonResponse,
+)
 
 from customers.forms import (
+    ApiPageForm,
     CreateCustomerForm,
     NotificationGroupFormSet,
     UpdateCustomerForm,
 )
 from customers.models import Customer
+from inventory.models import StockBalance
+from products.models import Product
+from utils.db_routing import replica_reads
+from utils.format_string import render_format_string
+from utils.formsets import assign_formset_names, render_empty_form
+from utils.pagination import keyset_paginate
 
 
 User = get_user_model()
 
 
-def assign_class(formset):
-    formset.formset_class = (
-        f"{formset.__class__.__bases__[0].__module__}.{formset.__class__.__name__}"
-    )
-
-    for form in formset.forms:
-        if hasattr(form, "nested"):
-            for nested in form.nested:
-                assign_class(nested)
-
-    if hasattr(formset.empty_form, "nested"):
-        for nested in formset.empty_form.nested:
-            assign_class(nested)
+class NotificationGroupFormSetMixin:
+    """
+    Edits a customer's notification groups alongside the customer, building the nested formset once per request.
+    The customer and its groups are only saved if both are valid, in a single transaction.
+    """
 
+    formset_prefix = "notification_group_formset"
 
-class CustomerCreateView(CreateView):
-    model = Customer
-    template_name = "customers/customer_create.html"
-    form_class = CreateCustomerForm
-    success_url = reverse_lazy("customers:customer_list")
+    def get_formset(self):
+        if not hasattr(self, "_formset"):
+            self._formset = NotificationGroupFormSet(
+                self.request.POST or None,
+                instance=self.object,
+                prefix=self.formset_prefix,
+            )
+            assign_formset_names(self._formset)
+        return self._formset
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-
-        notification_group_formset = NotificationGroupFormSet(
-            self.request.POST or None,
-            prefix="notification_group_formset",
-        )
-        assign_class(notification_group_formset)
-
-        context["formsets"] = (notification_group_formset,)
+        context["formsets"] = (self.get_formset(),)
         return context
 
     def form_valid(self, form):
-        response = super().form_valid(form)
+        formset = self.get_formset()
+        if not formset.is_valid():
+            return self.form_invalid(form)
 
-        notification_group_formset = NotificationGroupFormSet(
-            self.request.POST,
-            instance=self.object,
-            prefix="notification_group_formset",
-        )
+        with atomic():
+            self.object = form.save()
+            formset.instance = self.object
+            formset.save()
+        return HttpResponseRedirect(self.get_success_url())
 
-        if notification_group_formset.is_valid():
-            notification_group_formset.save()
 
-        return response
+class CustomerCreateView(NotificationGroupFormSetMixin, CreateView):
+    model = Customer
+    template_name = "customers/customer_create.html"
+    form_class = CreateCustomerForm
+    success_url = reverse_lazy("customers:customer_list")
 
 
 class CustomerDetailView(DetailView):
@@ -71,39 +82,12 @@ class CustomerDetailView(DetailView):
     template_name = "customers/customer_detail.html"
 
 
-class CustomerUpdateView(UpdateView):
+class CustomerUpdateView(NotificationGroupFormSetMixin, UpdateView):
     model = Customer
     template_name = "customers/customer_update.html"
     form_class = UpdateCustomerForm
     success_url = reverse_lazy("customers:customer_list")
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-
-        notification_group_formset = NotificationGroupFormSet(
-            self.request.POST or None,
-            instance=self.object,
-            prefix="notification_group_formset",
-        )
-        assign_class(notification_group_formset)
-
-        context["formsets"] = (notification_group_formset,)
-        return context
-
-    def form_valid(self, form):
-        response = super().form_valid(form)
-
-        notification_group_formset = NotificationGroupFormSet(
-            self.request.POST,
-            instance=self.object,
-            prefix="notification_group_formset",
-        )
-
-        if notification_group_formset.is_valid():
-            notification_group_formset.save()
-
-        return response
-
     def get_initial(self):
         initial = super().get_initial()
 
@@ -132,25 +116,143 @@ class CustomerDeleteView(DeleteView):
 class CustomerListView(ListView):
     model = Customer
     template_name = "customers/customer_list.html"
+    rows_template_name = "customers/partials/customer_rows.html"
+    per_page = 50
+    ordering = ("display_name", "pk")
+
+    def get_queryset(self):
+        queryset = Customer.objects.select_related("user")
+
+        query = self.request.GET.get("q", "").strip().upper()
+        if query:
+            # A range on the indexed upper case name, so prefix search doesn't scan the table.
+            queryset = queryset.alias(upper_name=Upper("display_name")).filter(
+                upper_name__gte=query, upper_name__lt=query + "\uffff"
+            )
+        return queryset
+
+    def get_context_data(self, **kwargs):
+        page = keyset_paginate(
+            self.object_list,
+            self.ordering,
+            self.request.GET.get("cursor"),
+            self.per_page,
+        )
+        context = super().get_context_data(object_list=page.object_list, **kwargs)
+        context["page"] = page
+        context["query"] = self.request.GET.get("q", "")
+        return context
+
+    def get_template_names(self):
+        # htmx searches and "Load more" clicks only need the rows.
+        if self.request.headers.get("HX-Request"):
+            return [self.rows_template_name]
+        return super().get_template_names()
 
 
 @require_POST
 def add_form(request):
-    class_path = request.POST.get("formset_class")
-    prefix = request.POST.get("formset_prefix")
-    total_forms = int(request.POST.get(f"{prefix}-TOTAL_FORMS", 0))
+    name = request.POST.get("formset_class", "")
+    prefix = request.POST.get("formset_prefix", "")
+    try:
+        total_forms = int(request.POST.get(f"{prefix}-TOTAL_FORMS", 0))
+        form_html = render_empty_form(name, prefix, total_forms)
+    except (LookupError, ValueError) as e:
+        return HttpResponseBadRequest(str(e))
+
+    return HttpResponse(form_html)
+
 
-    FormSetClass = import_string(class_path)
-    formset = FormSetClass(prefix=prefix)
-    empty_form = formset.empty_form
+# Rows per API page, unless the limit query parameter asks for fewer or more
+API_PAGE_SIZE = 200
 
-    if hasattr(empty_form, "nested"):
-        for nested_fs in empty_form.nested:
-            assign_class(nested_fs)
 
-    form_html = render_to_string(
-        "base/partials/form.html", {"form": empty_form}, request=request
+def stock_etag(request, pk: int) -> str | None:
+    """
+    Derives the ETag of a customer's API pages from their stock version and the page asked for, so an unchanged poll
+    is answered with 304 Not Modified after reading a single customer row.
+    """
+    version = (
+        Customer.objects.filter(pk=pk).values_list("stock_version", flat=True).first()
+    )
+    if version is None:
+        return None
+    query = urlencode(sorted(request.GET.lists()), doseq=True)
+    digest = hashlib.md5(f"{request.path}?{query}".encode()).hexdigest()[:16]
+    return f"{pk}-{version}-{digest}"
+
+
+def api_response(request, pk: int, queryset, ordering: tuple[str, ...], row=dict):
+    """
+    Returns a keyset paginated page of a customer's rows as JSON, with the cursor and URL of the next page. Rows are
+    plain dicts from values(), converted by the row function.
+    """
+    form = ApiPageForm(request.GET)
+    if not form.is_valid():
+        return HttpResponseBadRequest(form.errors.as_text())
+    if not Customer.objects.filter(pk=pk).exists():
+        raise Http404("No customer found matching the query.")
+
+    page = keyset_paginate(
+        queryset,
+        ordering,
+        form.cleaned_data["cursor"],
+        form.cleaned_data["limit"] or API_PAGE_SIZE,
+    )
+    next_url = None
+    if page.has_next:
+        query = request.GET.copy()
+        query["cursor"] = page.next_cursor
+        next_url = f"{request.path}?{query.urlencode()}"
+    return JsonResponse(
+        {
+            "results": [row(values) for values in page],
+            "next_cursor": page.next_cursor,
+            "next": next_url,
+        }
     )
-    form_html = form_html.replace("__prefix__", str(total_forms))
 
-    return HttpResponse(form_html)
+
+def product_row(values: dict) -> dict:
+    return {
+        "id": values["id"],
+        "name": render_format_string(
+            values["template__format_string"], values["attributes"]
+        ),
+        "template_id": values["template_id"],
+        "template": values["template__name"],
+        "attributes": values["attributes"],
+    }
+
+
+@staff_member_required
+@require_GET
+@replica_reads()
+@condition(etag_func=stock_etag)
+def customer_products_api(request, pk: int):
+    """
+    Returns the products assigned to a customer as JSON, a page at a time, followed with the cursor query parameter.
+    """
+    rows = Product.objects.filter(customer=pk).values(
+        "id", "template_id", "template__name", "template__format_string", "attributes"
+    )
+    return api_response(request, pk, rows, ("id",), product_row)
+
+
+@staff_member_required
+@require_GET
+@replica_reads()
+@condition(etag_func=stock_etag)
+def customer_stock_api(request, pk: int):
+    """
+    Returns a customer's stock balances as JSON, by product and location, a page at a time like products. A product
+    only ever uses one of the quantity columns.
+    """
+    rows = StockBalance.objects.filter(customer=pk).values(
+        "product_id",
+        "location_id",
+        "location__name",
+        "quantity_int",
+        "quantity_decimal",
+    )
+    return api_response(request, pk, rows, ("product_id", "location_id"))
@@ -7,6 +7,11 @@ from inventory.models import (
     InventoryTransaction,
     InventoryChangeLine,
     InventoryChangeFieldValue,
+    StockBalance,
+    StockCheckpoint,
+    TransactionNotification,
+    DailyMovement,
+    ArchivedChangeLine,
 )
 
 admin.site.register(StorageLocation)
@@ -15,3 +20,8 @@ admin.site.register(InventoryChangeTemplateField)
 admin.site.register(InventoryTransaction)
 admin.site.register(InventoryChangeLine)
 admin.site.register(InventoryChangeFieldValue)
+admin.site.register(StockBalance)
+admin.site.register(StockCheckpoint)
+admin.site.register(TransactionNotification)
+admin.site.register(DailyMovement)
+admin.site.register(ArchivedChangeLine)
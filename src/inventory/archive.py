@@ -0,0 +1,292 @@
+import gzip
+import json
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import IO, Iterator
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.db.models import Prefetch, Q, QuerySet, Sum
+from django.db.transaction import atomic
+from django.utils.dateparse import parse_datetime
+
+from inventory.models import (
+    ArchivedChangeLine,
+    InventoryChangeFieldValue,
+    InventoryChangeLine,
+    InventoryTransaction,
+    StockCheckpoint,
+    TransactionNotification,
+)
+from utils.model_commons import quantize_sum
+
+
+# Lines deleted per statement, below the query parameter limits of every backend
+DELETE_BATCH_SIZE = 500
+
+
+@dataclass
+class ArchiveResult:
+    customers: int = 0
+    transactions: int = 0
+    lines: int = 0
+    opening_lines: int = 0
+
+
+def delete_lines(pks: list[int]) -> None:
+    """
+    Deletes change lines with plain SQL DELETE statements, whose stock was already moved into the opening balance.
+    QuerySet.delete() would send post_delete for every line, taking it out of the balances a second time. Their
+    field values must be deleted first, nothing cascades.
+    """
+    table = connection.ops.quote_name(InventoryChangeLine._meta.db_table)
+    column = connection.ops.quote_name(InventoryChangeLine._meta.pk.column)
+    with connection.cursor() as cursor:
+        for start in range(0, len(pks), DELETE_BATCH_SIZE):
+            batch = pks[start : start + DELETE_BATCH_SIZE]
+            placeholders = ", ".join(["%s"] * len(batch))
+            cursor.execute(
+                f"DELETE FROM {table} WHERE {column} IN ({placeholders})", batch
+            )
+
+
+def archive_record(line: InventoryChangeLine) -> dict:
+    return {
+        "line_id": line.pk,
+        "transaction_id": line.transaction_id,
+        "customer_id": line.transaction.customer_id,
+        "date": line.transaction.date,
+        "product_id": line.product_id,
+        "location_id": line.location_id,
+        "quantity_int": line.quantity_int,
+        "quantity_decimal": line.quantity_decimal,
+        "values": {
+            field_value.field.name: field_value.json_value
+            for field_value in line.values.all()
+        },
+    }
+
+
+def carry_forward(customer_id: int, opening_date: datetime, records: list[dict]) -> int:
+    """
+    Adds archived lines to the customer's opening balance transaction, creating it if needed, so the ledger keeps
+    adding up to the same stock. Each product and location gets one opening line per quantity column.
+
+    :return: The number of opening lines created.
+    """
+    totals = {}
+    for record in records:
+        for column in ("quantity_int", "quantity_decimal"):
+            if record[column] is not None:
+                key = (record["product_id"], record["location_id"], column)
+                totals[key] = totals.get(key, 0) + record[column]
+
+    opening = InventoryTransaction.objects.filter(
+        customer_id=customer_id, is_opening_balance=True
+    ).first()
+    if opening is None:
+        # Created without save(), an opening balance isn't news to notify anyone about.
+        (opening,) = InventoryTransaction.objects.bulk_create(
+            [
+                InventoryTransaction(
+                    customer_id=customer_id,
+                    date=opening_date,
+                    is_opening_balance=True,
+                )
+            ]
+        )
+    elif opening.date < opening_date:
+        # Updated without save(), moving the opening balance doesn't change any stock.
+        InventoryTransaction.objects.filter(pk=opening.pk).update(date=opening_date)
+
+    existing = []
+    for line in opening.lines.all():
+        column = "quantity_int" if line.quantity_int is not None else "quantity_decimal"
+        key = (line.product_id, line.location_id, column)
+        if key in totals:
+            setattr(line, column, getattr(line, column) + totals.pop(key))
+            existing.append(line)
+    InventoryChangeLine.objects.bulk_update(
+        existing, ["quantity_int", "quantity_decimal"]
+    )
+    InventoryChangeLine.objects.bulk_create(
+        InventoryChangeLine(
+            transaction=opening,
+            product_id=product_id,
+            location_id=location_id,
+            **{column: total},
+        )
+        for (product_id, location_id, column), total in totals.items()
+    )
+    delete_lines(
+        list(
+            opening.lines.filter(Q(quantity_int=0) | Q(quantity_decimal=0)).values_list(
+                "pk", flat=True
+            )
+        )
+    )
+    return len(totals)
+
+
+def archive_customer(
+    customer_id: int,
+    cutoff: datetime,
+    batch_size: int = 500,
+    output: IO[str] | None = None,
+    result: ArchiveResult | None = None,
+) -> ArchiveResult:
+    """
+    Archives a customer's transactions dated before the cutoff, a batch of transactions per database transaction.
+    Every batch carries its stock forward into the opening balance in the same database transaction, so balances,
+    checkpoints after the cutoff and the ledger keep agreeing even if archiving is interrupted.
+
+    Archived lines are written to the output file if given, as JSON lines, else to the ArchivedChangeLine table. The
+    file is written before each batch commits, so an interrupted run may leave lines in it twice, read_archive_file
+    skips the repeats.
+    """
+    result = result or ArchiveResult()
+    # Just before the cutoff, so checkpoints at the cutoff include the opening balance like the lines it replaces.
+    opening_date = cutoff - timedelta(microseconds=1)
+    archived = False
+    while True:
+        with atomic():
+            transaction_ids = list(
+                InventoryTransaction.objects.filter(
+                    customer_id=customer_id,
+                    date__lt=cutoff,
+                    is_opening_balance=False,
+                )
+                .order_by("date", "pk")
+                .values_list("pk", flat=True)[:batch_size]
+            )
+            if not transaction_ids:
+                break
+
+            lines = InventoryChangeLine.objects.filter(
+                transaction_id__in=transaction_ids
+            )
+            records = [
+                archive_record(line)
+                for line in lines.select_related("transaction").prefetch_related(
+                    Prefetch(
+                        "values",
+                        queryset=InventoryChangeFieldValue.objects.select_related(
+                            "field"
+                        ),
+                    )
+                )
+            ]
+            if output is not None:
+                for record in records:
+                    output.write(json.dumps(record, cls=DjangoJSONEncoder) + "\n")
+                output.flush()
+            else:
+                ArchivedChangeLine.objects.bulk_create(
+                    (ArchivedChangeLine(**record) for record in records),
+                    batch_size=batch_size,
+                    ignore_conflicts=True,
+                )
+
+            # Checkpoints before the cutoff would count the opening balance on top of the stock they hold.
+            StockCheckpoint.objects.filter(
+                customer_id=customer_id, date__lt=cutoff
+            ).delete()
+            result.opening_lines += carry_forward(customer_id, opening_date, records)
+
+            # Nothing references field values and no signal handles them, so this is a single DELETE.
+            InventoryChangeFieldValue.objects.filter(
+                line__transaction_id__in=transaction_ids
+            ).delete()
+            delete_lines([record["line_id"] for record in records])
+            TransactionNotification.objects.filter(
+                transaction_id__in=transaction_ids
+            ).delete()
+            InventoryTransaction.objects.filter(pk__in=transaction_ids).delete()
+
+            archived = True
+            result.transactions += len(transaction_ids)
+            result.lines += len(records)
+
+    if archived:
+        result.customers += 1
+    return result
+
+
+def open_archive_file(path: str, mode: str = "rt") -> IO[str]:
+    """
+    Opens a gzipped JSON lines archive. Append mode adds a gzip member, which readers see as one stream.
+    """
+    return gzip.open(path, mode, encoding="utf-8")
+
+
+def read_archive_file(
+    path: str,
+    customer_id: int | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+) -> Iterator[dict]:
+    """
+    Yields the archived lines of a file written by archive_customer, filtered by customer and date range [start,
+    end), with dates and decimals parsed back.
+    """
+    seen = set()
+    with open_archive_file(path) as stream:
+        for text in stream:
+            record = json.loads(text)
+            if record["line_id"] in seen:
+                continue
+            seen.add(record["line_id"])
+            record["date"] = parse_datetime(record["date"])
+            if record["quantity_decimal"] is not None:
+                record["quantity_decimal"] = Decimal(record["quantity_decimal"])
+            if customer_id is not None and record["customer_id"] != customer_id:
+                continue
+            if start is not None and record["date"] < start:
+                continue
+            if end is not None and record["date"] >= end:
+                continue
+            yield record
+
+
+def archived_lines(
+    customer=None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    product=None,
+) -> QuerySet:
+    """
+    Returns archived lines in date order, filtered by customer, date range [start, end) and product.
+    """
+    lines = ArchivedChangeLine.objects.select_related(
+        "customer", "product__template", "location"
+    )
+    if customer is not None:
+        lines = lines.filter(customer=customer)
+    if start is not None:
+        lines = lines.filter(date__gte=start)
+    if end is not None:
+        lines = lines.filter(date__lt=end)
+    if product is not None:
+        lines = lines.filter(product=product)
+    return lines.order_by("date", "transaction_id", "line_id")
+
+
+def archived_stock_as_of(
+    customer, when: datetime
+) -> dict[tuple[int, int], int | Decimal]:
+    """
+    Returns what a customer held at a point in time before their archive cutoff, keyed by (product id, location
+    id). StockCheckpoint.objects.stock_as_of answers for times after it.
+    """
+    rows = (
+        ArchivedChangeLine.objects.filter(customer=customer, date__lte=when)
+        .values("product_id", "location_id")
+        .annotate(total_int=Sum("quantity_int"), total_decimal=Sum("quantity_decimal"))
+    )
+    stock = {}
+    for row in rows:
+        quantity = quantize_sum(row["total_decimal"]) or row["total_int"]
+        if quantity:
+            stock[(row["product_id"], row["location_id"])] = quantity
+    return stock
@@ -0,0 +1,197 @@
+import statistics
+import time
+from typing import Callable
+
+from django.db import connection
+from django.db.models import Count
+from django.db.transaction import atomic, set_rollback
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from customers.models import Customer
+from inventory.models import (
+    InventoryChangeLine,
+    InventoryTransaction,
+    StockBalance,
+)
+from products.models import Product, ProductTemplate
+
+# Benchmarks by name, each runs one iteration of a key path given the shared context.
+BENCHMARKS: dict[str, Callable[[dict], None]] = {}
+
+
+def benchmark(name: str):
+    def register(function):
+        BENCHMARKS[name] = function
+        return function
+
+    return register
+
+
+def build_context() -> dict:
+    """
+    Picks the sample objects benchmarks run against, preferring the busiest customer, the one with the most stock
+    balances, so results reflect the worst case rather than an empty account. Balances are counted rather than lines
+    since the ledger is far larger.
+    """
+    busiest = (
+        StockBalance.objects.values("customer")
+        .annotate(balances=Count("pk"))
+        .order_by("-balances", "customer")
+        .values_list("customer", flat=True)
+        .first()
+    )
+    balance = StockBalance.objects.filter(customer=busiest).order_by("pk").first()
+    if balance is not None:
+        customer = balance.customer
+    else:
+        customer = Customer.objects.order_by("pk").first()
+    if customer is None:
+        raise ValueError("No customers to benchmark, run generate_demo_data first.")
+
+    return {
+        "client": Client(SERVER_NAME="localhost"),
+        "customer": customer,
+        "balance": balance,
+        "products": list(customer.products.values_list("pk", flat=True)[:20]),
+        "template": ProductTemplate.objects.filter(product__isnull=False).first(),
+        "location_id": balance.location_id if balance else None,
+    }
+
+
+def get(context: dict, url: str, **headers) -> None:
+    response = context["client"].get(url, headers=headers)
+    if response.status_code != 200:
+        raise AssertionError(f"GET {url} returned {response.status_code}.")
+
+
+@benchmark("customer_list")
+def customer_list(context: dict) -> None:
+    get(context, reverse("customers:customer_list"))
+
+
+@benchmark("customer_list_search")
+def customer_list_search(context: dict) -> None:
+    query = context["customer"].display_name[:4]
+    get(context, f"{reverse('customers:customer_list')}?q={query}", HX_Request="true")
+
+
+@benchmark("customer_detail")
+def customer_detail(context: dict) -> None:
+    get(context, reverse("customers:customer_detail", args=[context["customer"].pk]))
+
+
+@benchmark("customer_update_get")
+def customer_update_get(context: dict) -> None:
+    get(context, reverse("customers:customer_update", args=[context["customer"].pk]))
+
+
+@benchmark("customer_update_post")
+def customer_update_post(context: dict) -> None:
+    customer = context["customer"]
+    data = {
+        "display_name": customer.display_name,
+        "phone_number": customer.phone_number,
+        "email": customer.user.email,
+        "products": context["products"],
+        "notification_group_formset-TOTAL_FORMS": 0,
+        "notification_group_formset-INITIAL_FORMS": 0,
+    }
+    with atomic():
+        response = context["client"].post(
+            reverse("customers:customer_update", args=[customer.pk]), data
+        )
+        set_rollback(True)
+    if response.status_code != 302:
+        raise AssertionError(f"Customer update returned {response.status_code}.")
+
+
+@benchmark("stock_lookup")
+def stock_lookup(context: dict) -> None:
+    balance = context["balance"]
+    if balance is None:
+        return
+    StockBalance.objects.get_quantity(
+        balance.customer_id, balance.product_id, balance.location_id
+    )
+
+
+@benchmark("transaction_create")
+def transaction_create(context: dict) -> None:
+    if not context["products"] or context["location_id"] is None:
+        return
+    products = Product.objects.select_related("template").filter(
+        pk__in=context["products"]
+    )
+    with atomic():
+        transaction = InventoryTransaction.objects.create(
+            customer=context["customer"], date=timezone.now()
+        )
+        for product in products:
+            line = InventoryChangeLine(
+                transaction=transaction,
+                product=product,
+                location_id=context["location_id"],
+            )
+            if product.template.counting_type == ProductTemplate.DISCRETE:
+                line.quantity_int = 1
+            else:
+                line.quantity_decimal = 1
+            line.save()
+        set_rollback(True)
+
+
+@benchmark("add_form")
+def add_form(context: dict) -> None:
+    response = context["client"].post(
+        reverse("customers:add_form"),
+        {
+            "formset_class": "notification_groups",
+            "formset_prefix": "notification_group_formset",
+            "notification_group_formset-TOTAL_FORMS": 3,
+        },
+    )
+    if response.status_code != 200:
+        raise AssertionError(f"add_form returned {response.status_code}.")
+
+
+@benchmark("product_labels")
+def product_labels(context: dict) -> None:
+    Product.objects.filter(pk__in=context["products"]).labels()
+
+
+@benchmark("product_attribute_filter")
+def product_attribute_filter(context: dict) -> None:
+    template = context["template"]
+    if template is None:
+        return
+    list(
+        Product.objects.filter_attrs(template, od__gte='4 1/2"')
+        .order_by_attr("-weight")
+        .values_list("pk", flat=True)[:50]
+    )
+
+
+def run_benchmark(function: Callable[[dict], None], context: dict, repeat: int) -> dict:
+    """
+    Runs a benchmark once to warm caches, then times it repeat times.
+
+    :return: Timings in milliseconds and the number of queries of one iteration.
+    """
+    function(context)
+
+    timings = []
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            function(context)
+            timings.append((time.perf_counter() - start) * 1000)
+
+    return {
+        "median_ms": round(statistics.median(timings), 3),
+        "min_ms": round(min(timings), 3),
+        "max_ms": round(max(timings), 3),
+        "queries": len(queries),
+    }
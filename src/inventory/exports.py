@@ -0,0 +1,146 @@
+import csv
+from datetime import datetime
+from typing import Iterable, Iterator
+
+from django.db.models import Prefetch, QuerySet
+from django.utils import timezone
+
+from inventory.models import (
+    InventoryChangeFieldValue,
+    InventoryChangeLine,
+    InventoryChangeTemplateField,
+    StockBalance,
+)
+
+# Rows fetched per database round trip. Rows are streamed as they're fetched, so memory is bounded by this.
+CHUNK_SIZE = 2000
+
+LEDGER_COLUMNS = [
+    "transaction",
+    "date",
+    "customer",
+    "product",
+    "template",
+    "location",
+    "quantity",
+]
+
+STOCK_COLUMNS = ["customer", "product", "template", "location", "quantity"]
+
+
+class Echo:
+    """
+    A file-like object that hands back what's written to it, so csv.writer can produce rows for a streaming response.
+    """
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def stream_csv(header: list[str], rows: Iterable[list]) -> Iterator[str]:
+    writer = csv.writer(Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def ledger_lines(
+    customer=None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    template=None,
+) -> QuerySet:
+    """
+    Returns the ledger lines to export in date order, filtered by customer, date range [start, end) and product
+    template.
+    """
+    lines = InventoryChangeLine.objects.select_related(
+        "transaction__customer", "product__template", "location"
+    ).prefetch_related(
+        Prefetch(
+            "values",
+            queryset=InventoryChangeFieldValue.objects.select_related("field"),
+        )
+    )
+    if customer is not None:
+        lines = lines.filter(transaction__customer=customer)
+    if start is not None:
+        lines = lines.filter(transaction__date__gte=start)
+    if end is not None:
+        lines = lines.filter(transaction__date__lt=end)
+    if template is not None:
+        lines = lines.filter(product__template=template)
+    return lines.order_by("transaction__date", "transaction_id", "pk")
+
+
+def ledger_field_names() -> list[str]:
+    """
+    Returns the names of the inventory change template fields, which each get a column after the built-in ones.
+    """
+    return list(
+        InventoryChangeTemplateField.objects.exclude(
+            field_type=InventoryChangeTemplateField.STATIC
+        )
+        .order_by("name")
+        .values_list("name", flat=True)
+        .distinct()
+    )
+
+
+def ledger_rows(lines: QuerySet, field_names: list[str]) -> Iterator[list]:
+    """
+    Yields one CSV row per line. The lines are iterated in chunks, each chunk's field values prefetched in one query.
+    """
+    for line in lines.iterator(chunk_size=CHUNK_SIZE):
+        values = {
+            field_value.field.name: field_value.value
+            for field_value in line.values.all()
+        }
+        yield [
+            line.transaction_id,
+            timezone.localtime(line.transaction.date).isoformat(),
+            line.transaction.customer.display_name,
+            line.product.display_name,
+            line.product.template.name,
+            line.location.name,
+            line.quantity,
+            *(values.get(name, "") for name in field_names),
+        ]
+
+
+def export_ledger(**filters) -> Iterator[str]:
+    """
+    Streams the ledger as CSV. Accepts the filters of ledger_lines.
+    """
+    field_names = ledger_field_names()
+    return stream_csv(
+        LEDGER_COLUMNS + field_names, ledger_rows(ledger_lines(**filters), field_names)
+    )
+
+
+def export_stock(customer=None, template=None) -> Iterator[str]:
+    """
+    Streams the current stock positions as CSV, skipping empty ones.
+    """
+    balances = StockBalance.objects.select_related(
+        "customer", "product__template", "location"
+    ).exclude(quantity_int=0, quantity_decimal=0)
+    if customer is not None:
+        balances = balances.filter(customer=customer)
+    if template is not None:
+        balances = balances.filter(product__template=template)
+    balances = balances.order_by("customer_id", "product_id", "location_id")
+
+    return stream_csv(
+        STOCK_COLUMNS,
+        (
+            [
+                balance.customer.display_name,
+                balance.product.display_name,
+                balance.product.template.name,
+                balance.location.name,
+                balance.quantity,
+            ]
+            for balance in balances.iterator(chunk_size=CHUNK_SIZE)
+        ),
+    )
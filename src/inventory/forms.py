@@ -0,0 +1,48 @@
+from django import forms
+
+from customers.models import Customer
+from inventory.importers import READERS
+from inventory.models import InventoryChangeTemplate
+from inventory.reports import MOVEMENT_GROUPS, STOCK_GROUPS
+from products.models import ProductTemplate
+
+
+class TransactionImportForm(forms.Form):
+    file = forms.FileField()
+    file_format = forms.ChoiceField(
+        choices=[(name, name.upper()) for name in READERS], initial="csv"
+    )
+    change_template = forms.ModelChoiceField(
+        queryset=InventoryChangeTemplate.objects.all(),
+        required=False,
+        help_text="Template whose fields extra columns map to.",
+    )
+
+
+class StockExportForm(forms.Form):
+    customer = forms.ModelChoiceField(queryset=Customer.objects.all(), required=False)
+    template = forms.ModelChoiceField(
+        queryset=ProductTemplate.objects.all(), required=False
+    )
+
+
+class LedgerExportForm(StockExportForm):
+    start = forms.DateTimeField(required=False)
+    end = forms.DateTimeField(required=False, help_text="Exclusive.")
+
+
+class StockReportForm(forms.Form):
+    group_by = forms.MultipleChoiceField(
+        choices=[(name, name) for name in STOCK_GROUPS], required=False
+    )
+    customer_id = forms.IntegerField(required=False)
+    template_id = forms.IntegerField(required=False)
+    location_id = forms.IntegerField(required=False)
+
+
+class MovementReportForm(StockReportForm):
+    group_by = forms.MultipleChoiceField(
+        choices=[(name, name) for name in MOVEMENT_GROUPS], required=False
+    )
+    start = forms.DateField(required=False)
+    end = forms.DateField(required=False, help_text="Inclusive.")
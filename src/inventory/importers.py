@@ -0,0 +1,389 @@
+import codecs
+import csv
+import json
+import time
+from dataclasses import dataclass
+from datetime import datetime, time as datetime_time
+from typing import IO, Iterable, Iterator
+
+from django.core.exceptions import ValidationError
+from django.db.transaction import atomic
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from customers.models import Customer
+from inventory.ledger import LedgerChanges
+from inventory.models import (
+    InventoryChangeTemplate,
+    InventoryTransaction,
+    InventoryChangeLine,
+    InventoryChangeFieldValue,
+    StorageLocation,
+    TransactionNotification,
+)
+from inventory.validation import LineValidator
+from products.models import Product
+
+# Columns of a CSV import that aren't inventory change template fields.
+CSV_COLUMNS = ("transaction", "customer", "date", "product", "location", "quantity")
+
+# Stop collecting after this many errors, the import is rolled back either way.
+MAX_ERRORS = 100
+
+
+@dataclass
+class ImportResult:
+    transactions: int = 0
+    lines: int = 0
+    values: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.lines / self.seconds if self.seconds else 0.0
+
+
+def decode_lines(stream: IO[bytes]) -> Iterator[str]:
+    """
+    Decodes an uploaded file a line at a time, skipping a byte order mark, so text that isn't UTF-8 raises
+    UnicodeDecodeError when the line holding it is read.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    for line in stream:
+        yield decoder.decode(line)
+    decoder.decode(b"", final=True)
+
+
+def undecodable(row: int) -> dict:
+    # The rest of the stream can't be read reliably once decoding failed, so reading stops at the first error.
+    return {"row": row, "error": "The file is not valid UTF-8 text."}
+
+
+def read_csv(stream: Iterable[str]) -> Iterator[dict]:
+    """
+    Streams transactions from CSV rows. Consecutive rows sharing a "transaction" reference form one transaction, any
+    column not in CSV_COLUMNS is read as an inventory change template field value. Rows that can't be read are
+    streamed as records with an "error".
+    """
+    reader = csv.DictReader(stream)
+    try:
+        missing = [
+            column for column in CSV_COLUMNS if column not in (reader.fieldnames or [])
+        ]
+    except UnicodeDecodeError:
+        yield undecodable(1)
+        return
+    if missing:
+        yield {"row": 1, "error": f"Missing columns: {', '.join(missing)}."}
+        return
+
+    reference = None
+    record = None
+    row_number = 1
+    rows = enumerate(reader, start=2)
+    while True:
+        try:
+            row_number, row = next(rows)
+        except StopIteration:
+            break
+        except UnicodeDecodeError:
+            yield undecodable(row_number + 1)
+            return
+        except csv.Error as e:
+            yield {"row": row_number + 1, "error": f"Invalid CSV: {e}."}
+            return
+        if record is None or row["transaction"] != reference:
+            if record is not None:
+                yield record
+            reference = row["transaction"]
+            record = {
+                "row": row_number,
+                "customer": row["customer"],
+                "date": row["date"],
+                "lines": [],
+            }
+        record["lines"].append(
+            {
+                "row": row_number,
+                "product": row["product"],
+                "location": row["location"],
+                "quantity": row["quantity"],
+                "values": {
+                    name: value
+                    for name, value in row.items()
+                    if name not in CSV_COLUMNS and value not in (None, "")
+                },
+            }
+        )
+    if record is not None:
+        yield record
+
+
+def read_jsonl(stream: Iterable[str]) -> Iterator[dict]:
+    """
+    Streams transactions from JSON lines, one transaction per line:
+    {"customer": 1, "date": "2025-01-01T08:00", "lines": [{"product": 1, "location": 1, "quantity": 5, "values": {}}]}
+
+    Lines that can't be read are streamed as records with an "error".
+    """
+    row_number = 0
+    lines = iter(stream)
+    while True:
+        try:
+            text = next(lines)
+        except StopIteration:
+            return
+        except UnicodeDecodeError:
+            yield undecodable(row_number + 1)
+            return
+        row_number += 1
+        if not text.strip():
+            continue
+
+        try:
+            record = json.loads(text)
+        except ValueError as e:
+            yield {"row": row_number, "error": f"Invalid JSON: {e}."}
+            continue
+        if not isinstance(record, dict):
+            yield {"row": row_number, "error": "A transaction must be a JSON object."}
+            continue
+        if not isinstance(record.get("lines", []), list) or not all(
+            isinstance(line, dict) for line in record.get("lines", [])
+        ):
+            yield {"row": row_number, "error": '"lines" must be a list of objects.'}
+            continue
+
+        record["row"] = row_number
+        for line in record.get("lines", []):
+            line.setdefault("row", row_number)
+        yield record
+
+
+READERS = {
+    "csv": read_csv,
+    "jsonl": read_jsonl,
+}
+
+
+def parse_date_value(value: str) -> datetime:
+    """
+    :raises ValueError: If the value isn't an ISO date or datetime.
+    """
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"{value!r} is not a date.")
+        parsed = datetime.combine(day, datetime_time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class TransactionImporter:
+    """
+    Writes inventory transactions in bulk. Lines and field values are validated against preloaded product counting
+    types and template fields, then inserted in chunks with bulk_create, all inside a single atomic block.
+    """
+
+    def __init__(
+        self,
+        change_template: InventoryChangeTemplate | None = None,
+        chunk_size: int = 1000,
+    ):
+        self.chunk_size = chunk_size
+        self.validator = LineValidator(change_template)
+
+        self.location_ids = set(StorageLocation.objects.values_list("pk", flat=True))
+        # (template id, template name, counting type) by product id
+        self.product_templates = {}
+        self.customer_ids = set()
+
+        self.errors = []
+        self.changes = LedgerChanges()
+        self.pending = []
+        self.result = ImportResult()
+
+    def run(self, records: Iterable[dict]) -> ImportResult:
+        """
+        Imports every transaction, rolling back all of them if any row is invalid.
+
+        :raises ValidationError: With every error found, if any row is invalid.
+        """
+        start = time.perf_counter()
+        with atomic():
+            pending_lines = 0
+            for record in records:
+                self.pending.append(record)
+                pending_lines += len(record.get("lines", []))
+                if pending_lines >= self.chunk_size:
+                    self.flush()
+                    pending_lines = 0
+            self.flush()
+
+            if self.errors:
+                raise ValidationError(self.errors)
+            self.changes.apply()
+
+        self.result.seconds = time.perf_counter() - start
+        return self.result
+
+    def error(self, row: int, message: str) -> None:
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append(f"Row {row}: {message}")
+
+    def preload(self, records: list[dict]) -> None:
+        """
+        Loads the templates of products and customers referenced by a chunk that haven't been seen yet, one query
+        each.
+        """
+        product_ids = {
+            int(line["product"])
+            for record in records
+            for line in record.get("lines", [])
+            if str(line.get("product", "")).isdigit()
+        }
+        missing = product_ids - self.product_templates.keys()
+        if missing:
+            self.product_templates.update(
+                (pk, template)
+                for pk, *template in Product.objects.filter(pk__in=missing).values_list(
+                    "pk", "template_id", "template__name", "template__counting_type"
+                )
+            )
+
+        customer_ids = {
+            int(record["customer"])
+            for record in records
+            if str(record.get("customer", "")).isdigit()
+        }
+        missing = customer_ids - self.customer_ids
+        if missing:
+            self.customer_ids.update(
+                Customer.objects.filter(pk__in=missing).values_list("pk", flat=True)
+            )
+
+    def build_transaction(self, record: dict) -> InventoryTransaction | None:
+        row = record["row"]
+        try:
+            customer_id = int(record["customer"])
+        except (KeyError, TypeError, ValueError):
+            self.error(row, f"{record.get('customer')!r} is not a customer id.")
+            return None
+        if customer_id not in self.customer_ids:
+            self.error(row, f"Customer {customer_id} does not exist.")
+            return None
+
+        try:
+            date = parse_date_value(str(record.get("date", "")))
+        except ValueError as e:
+            self.error(row, str(e))
+            return None
+
+        return InventoryTransaction(customer_id=customer_id, date=date)
+
+    def build_line(
+        self, line: dict, transaction: InventoryTransaction
+    ) -> InventoryChangeLine | None:
+        row = line["row"]
+        try:
+            product_id = int(line["product"])
+            location_id = int(line["location"])
+        except (KeyError, TypeError, ValueError):
+            self.error(row, "Product and location must be ids.")
+            return None
+        if product_id not in self.product_templates:
+            self.error(row, f"Product {product_id} does not exist.")
+            return None
+        if location_id not in self.location_ids:
+            self.error(row, f"Storage location {location_id} does not exist.")
+            return None
+
+        template_id, template_name, counting_type = self.product_templates[product_id]
+        errors = self.validator.check_product_template(template_id, template_name)
+        instance = InventoryChangeLine(
+            transaction=transaction, product_id=product_id, location_id=location_id
+        )
+        instance.quantity_int, instance.quantity_decimal, quantity_errors = (
+            self.validator.parse_quantity(counting_type, line.get("quantity", ""))
+        )
+        errors += quantity_errors
+        for message in errors:
+            self.error(row, message)
+        return None if errors else instance
+
+    def build_values(self, line: dict) -> list[InventoryChangeFieldValue]:
+        values, errors = self.validator.parse_values(line.get("values"))
+        for message in errors:
+            self.error(line["row"], message)
+        return [InventoryChangeFieldValue(**value) for value in values]
+
+    def flush(self) -> None:
+        """
+        Validates and inserts the pending chunk of transactions.
+        """
+        if not self.pending:
+            return
+        records, self.pending = self.pending, []
+        self.preload(records)
+
+        transactions = []
+        lines = []
+        values = []
+        for record in records:
+            if "error" in record:
+                self.error(record["row"], record["error"])
+                continue
+            transaction = self.build_transaction(record)
+            for line in record.get("lines", []):
+                instance = self.build_line(line, transaction)
+                line_values = self.build_values(line)
+                if instance is None or transaction is None:
+                    continue
+                for value in line_values:
+                    value.line = instance
+                lines.append(instance)
+                values.extend(line_values)
+            if transaction is not None:
+                transactions.append(transaction)
+
+        # Nothing is written once an error is found, but the rest of the input is still validated.
+        if self.errors:
+            return
+
+        # bulk_create fills in the foreign keys of children from their freshly inserted parents.
+        InventoryTransaction.objects.bulk_create(
+            transactions, batch_size=self.chunk_size
+        )
+        TransactionNotification.objects.bulk_create(
+            (
+                TransactionNotification(transaction=transaction)
+                for transaction in transactions
+            ),
+            batch_size=self.chunk_size,
+        )
+        InventoryChangeLine.objects.bulk_create(lines, batch_size=self.chunk_size)
+        InventoryChangeFieldValue.objects.bulk_create(
+            values, batch_size=self.chunk_size
+        )
+
+        self.changes.add(lines)
+        self.result.transactions += len(transactions)
+        self.result.lines += len(lines)
+        self.result.values += len(values)
+
+
+def import_transactions(
+    stream: Iterable[str],
+    file_format: str,
+    change_template: InventoryChangeTemplate | None = None,
+    chunk_size: int = 1000,
+) -> ImportResult:
+    """
+    Imports inventory transactions from a CSV or JSON lines stream.
+
+    :raises ValidationError: If any row is invalid, nothing is imported.
+    """
+    reader = READERS[file_format]
+    return TransactionImporter(change_template, chunk_size).run(reader(stream))
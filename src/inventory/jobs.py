@@ -0,0 +1,77 @@
+import csv
+
+from inventory.exports import (
+    LEDGER_COLUMNS,
+    ledger_field_names,
+    ledger_lines,
+    ledger_rows,
+)
+from inventory.importers import parse_date_value
+from inventory.replay import replay_ledger
+from jobs.registry import register, register_command
+
+register_command("rebuild_stock_balances")
+register_command("rebuild_daily_movements")
+register_command("create_stock_checkpoints")
+
+# Rows written between progress reports
+EXPORT_PROGRESS_ROWS = 1000
+
+
+@register("export_ledger")
+def export_ledger(
+    job,
+    customer: int | None = None,
+    template: int | None = None,
+    start: str | None = None,
+    end: str | None = None,
+) -> dict:
+    """
+    Writes the ledger export to a CSV file, for ranges too large to stream within a request. Takes the filters of
+    ledger_lines as ids and ISO dates.
+    """
+    lines = ledger_lines(
+        customer=customer,
+        template=template,
+        start=parse_date_value(start) if start else None,
+        end=parse_date_value(end) if end else None,
+    )
+    total = lines.count()
+    field_names = ledger_field_names()
+    path = job.output_path(".csv")
+    with open(path, "w", newline="", encoding="utf-8") as output:
+        writer = csv.writer(output)
+        writer.writerow(LEDGER_COLUMNS + field_names)
+        for count, row in enumerate(ledger_rows(lines, field_names), start=1):
+            writer.writerow(row)
+            if count % EXPORT_PROGRESS_ROWS == 0:
+                job.progress(count, total, "Writing rows")
+    return {"file": path.name, "rows": total}
+
+
+@register("replay_ledger")
+def replay_ledger_job(
+    job,
+    shard_by: str = "customer",
+    customer: int | None = None,
+    rebuild: bool = False,
+    workers: int | None = None,
+) -> dict:
+    """
+    Diffs or rebuilds the state derived from the ledger, see the replay_ledger command.
+    """
+    result = replay_ledger(
+        shard_by=shard_by,
+        customer_id=customer,
+        rebuild=rebuild,
+        workers=workers,
+        progress=job.progress,
+    )
+    return {
+        "shards": result.shards,
+        "lines": result.lines,
+        "mismatches": result.mismatches,
+        "rewritten_shards": result.rewritten,
+        "lines_per_second": round(result.lines_per_second),
+        "described": result.described,
+    }
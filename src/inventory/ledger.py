@@ -0,0 +1,261 @@
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Iterable
+
+from django.db.models import F
+from django.utils import timezone
+
+from customers.models import Customer
+from inventory.models import (
+    ArchivedChangeLine,
+    DailyMovement,
+    InventoryChangeLine,
+    StockBalance,
+    StockCheckpoint,
+)
+from products.models import Product
+
+# (customer_id, product_id, location_id)
+BalanceKey = tuple[int, int, int]
+
+# (customer_id, product_id, location_id, day)
+MovementKey = tuple[int, int, int, date]
+
+MOVEMENT_COLUMNS = [
+    "inbound_int",
+    "outbound_int",
+    "inbound_decimal",
+    "outbound_decimal",
+]
+
+
+class LedgerChanges:
+    """
+    Accumulates the effect of lines entering or leaving the ledger on the state derived from it, then applies it in
+    one go. Must be applied inside the same database transaction that changed the ledger, so derived state and
+    lines are committed or rolled back together.
+    """
+
+    def __init__(self):
+        # Net change of each balance, as [quantity_int, quantity_decimal]
+        self.balances: dict[BalanceKey, list] = {}
+        # Net change of each day's movement, as [inbound_int, outbound_int, inbound_decimal, outbound_decimal]
+        self.movements: dict[MovementKey, list] = {}
+        # Earliest transaction date touched for each customer
+        self.earliest: dict[int, datetime] = {}
+
+    def add(
+        self,
+        lines: Iterable[InventoryChangeLine],
+        customer_id: int | None = None,
+        date: datetime | None = None,
+    ) -> "LedgerChanges":
+        """
+        Records lines entering the ledger. customer_id and date override those of the lines' transactions.
+        """
+        self._collect(lines, 1, customer_id, date)
+        return self
+
+    def remove(
+        self,
+        lines: Iterable[InventoryChangeLine],
+        customer_id: int | None = None,
+        date: datetime | None = None,
+    ) -> "LedgerChanges":
+        """
+        Records lines leaving the ledger. customer_id and date override those of the lines' transactions.
+        """
+        self._collect(lines, -1, customer_id, date)
+        return self
+
+    def _collect(self, lines, sign, customer_id, date) -> None:
+        for line in lines:
+            line_customer_id = customer_id or line.transaction.customer_id
+            line_date = date or line.transaction.date
+
+            key = (line_customer_id, line.product_id, line.location_id)
+            delta = self.balances.setdefault(key, [0, Decimal(0)])
+            # Opening balances carry archived stock forward, it didn't move on their date.
+            movement = [0, 0, Decimal(0), Decimal(0)]
+            if not line.transaction.is_opening_balance:
+                movement = self.movements.setdefault(
+                    (*key, timezone.localdate(line_date)),
+                    [0, 0, Decimal(0), Decimal(0)],
+                )
+            if line.quantity_int is not None:
+                delta[0] += sign * line.quantity_int
+                if line.quantity_int >= 0:
+                    movement[0] += sign * line.quantity_int
+                else:
+                    movement[1] -= sign * line.quantity_int
+            if line.quantity_decimal is not None:
+                quantity = Decimal(line.quantity_decimal)
+                delta[1] += sign * quantity
+                if quantity >= 0:
+                    movement[2] += sign * quantity
+                else:
+                    movement[3] -= sign * quantity
+
+            earliest = self.earliest.get(line_customer_id)
+            if earliest is None or line_date < earliest:
+                self.earliest[line_customer_id] = line_date
+
+    def apply(self) -> None:
+        self.apply_balances()
+        self.apply_movements()
+        self.invalidate_checkpoints()
+        self.bump_stock_versions()
+
+    def apply_balances(self) -> None:
+        """
+        Keys are applied in sorted order, so concurrent writers always lock balance rows in the same order.
+        """
+        for key in sorted(self.balances):
+            quantity_int, quantity_decimal = self.balances[key]
+            if not quantity_int and not quantity_decimal:
+                continue
+
+            customer_id, product_id, location_id = key
+            balances = StockBalance.objects.filter(
+                customer_id=customer_id, product_id=product_id, location_id=location_id
+            )
+            updated = balances.update(
+                quantity_int=F("quantity_int") + quantity_int,
+                quantity_decimal=F("quantity_decimal") + quantity_decimal,
+            )
+            if not updated:
+                _, created = StockBalance.objects.get_or_create(
+                    customer_id=customer_id,
+                    product_id=product_id,
+                    location_id=location_id,
+                    defaults={
+                        "quantity_int": quantity_int,
+                        "quantity_decimal": quantity_decimal,
+                    },
+                )
+                if not created:
+                    # Another writer created the row between our update and insert.
+                    balances.update(
+                        quantity_int=F("quantity_int") + quantity_int,
+                        quantity_decimal=F("quantity_decimal") + quantity_decimal,
+                    )
+
+    def apply_movements(self) -> None:
+        """
+        Folds the movements of products into their templates' daily rollups, then applies them in sorted order like
+        balances.
+        """
+        product_ids = {key[1] for key in self.movements}
+        templates = dict(
+            Product.objects.filter(pk__in=product_ids).values_list("pk", "template_id")
+        )
+
+        rollups = {}
+        for (
+            customer_id,
+            product_id,
+            location_id,
+            day,
+        ), delta in self.movements.items():
+            key = (customer_id, templates[product_id], location_id, day)
+            total = rollups.setdefault(key, [0, 0, Decimal(0), Decimal(0)])
+            for index, value in enumerate(delta):
+                total[index] += value
+
+        apply_rollups(rollups)
+
+    def invalidate_checkpoints(self) -> None:
+        """
+        Drops checkpoints taken after a backdated change, the next create_stock_checkpoints run takes them again.
+        """
+        for customer_id, earliest in self.earliest.items():
+            StockCheckpoint.objects.filter(
+                customer_id=customer_id, date__gt=earliest
+            ).delete()
+
+    def bump_stock_versions(self) -> None:
+        """
+        Changes the ETags of the stock API for every customer whose ledger changed. Customers are locked in sorted
+        order, after their balances.
+        """
+        for customer_id in sorted(self.earliest):
+            Customer.objects.bump_stock_version([customer_id])
+
+
+def apply_rollups(rollups: dict[tuple, list]) -> None:
+    """
+    Adds deltas to the daily movement rollups, as [inbound_int, outbound_int, inbound_decimal, outbound_decimal] by
+    (customer_id, template_id, location_id, day), in sorted order so concurrent writers lock rows in the same order.
+    """
+    for key in sorted(rollups):
+        delta = dict(zip(MOVEMENT_COLUMNS, rollups[key]))
+        if not any(delta.values()):
+            continue
+
+        customer_id, template_id, location_id, day = key
+        movements = DailyMovement.objects.filter(
+            customer_id=customer_id,
+            template_id=template_id,
+            location_id=location_id,
+            day=day,
+        )
+        increments = {column: F(column) + value for column, value in delta.items()}
+        if not movements.update(**increments):
+            _, created = DailyMovement.objects.get_or_create(
+                customer_id=customer_id,
+                template_id=template_id,
+                location_id=location_id,
+                day=day,
+                defaults=delta,
+            )
+            if not created:
+                # Another writer created the row between our update and insert.
+                movements.update(**increments)
+
+
+def move_product_template(
+    product_id: int, old_template_id: int, new_template_id: int
+) -> None:
+    """
+    Moves a product's share of the daily movements from its old template's rollups to its new one's, recomputed from
+    its ledger and archived lines. Must run in the transaction changing the product's template.
+    """
+    # [inbound_int, outbound_int, inbound_decimal, outbound_decimal] by (customer_id, location_id, day)
+    moved: dict[tuple, list] = {}
+    # Opening balances carry archived stock forward, the archived lines hold its movements.
+    ledger = InventoryChangeLine.objects.filter(
+        product_id=product_id, transaction__is_opening_balance=False
+    ).values_list(
+        "transaction__customer_id",
+        "location_id",
+        "transaction__date",
+        "quantity_int",
+        "quantity_decimal",
+    )
+    archived = ArchivedChangeLine.objects.filter(product_id=product_id).values_list(
+        "customer_id", "location_id", "date", "quantity_int", "quantity_decimal"
+    )
+    for lines in (ledger, archived):
+        for customer_id, location_id, date, quantity_int, quantity_decimal in lines:
+            movement = moved.setdefault(
+                (customer_id, location_id, timezone.localdate(date)),
+                [0, 0, Decimal(0), Decimal(0)],
+            )
+            if quantity_int is not None:
+                if quantity_int >= 0:
+                    movement[0] += quantity_int
+                else:
+                    movement[1] -= quantity_int
+            if quantity_decimal is not None:
+                if quantity_decimal >= 0:
+                    movement[2] += quantity_decimal
+                else:
+                    movement[3] -= quantity_decimal
+
+    rollups = {}
+    for (customer_id, location_id, day), movement in moved.items():
+        rollups[(customer_id, old_template_id, location_id, day)] = [
+            -value for value in movement
+        ]
+        rollups[(customer_id, new_template_id, location_id, day)] = movement
+    apply_rollups(rollups)
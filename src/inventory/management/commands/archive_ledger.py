@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from customers.models import Customer
+from inventory.archive import ArchiveResult, archive_customer, open_archive_file
+from inventory.importers import parse_date_value
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves transactions dated before a cutoff out of the ledger, into the archived line table or a gzipped JSON "
+        "lines file. Each customer's archived stock is carried forward by an opening balance transaction, so "
+        "balances and stock reports are unchanged."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--before",
+            required=True,
+            help="Archive transactions dated before this date, ex: 2024-01-01.",
+        )
+        parser.add_argument(
+            "--customer",
+            type=int,
+            help="Only archive transactions of the customer with this id.",
+        )
+        parser.add_argument(
+            "--output",
+            help=(
+                "Append archived lines to this .jsonl.gz file instead of the archived line table. Daily movements "
+                "of those days are kept, but rebuild_daily_movements can no longer rebuild them."
+            ),
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Transactions archived per database transaction.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            cutoff = parse_date_value(options["before"])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        customers = Customer.objects.order_by("pk")
+        if options["customer"]:
+            customers = customers.filter(pk=options["customer"])
+        customer_ids = list(customers.values_list("pk", flat=True))
+
+        result = ArchiveResult()
+        output = None
+        if options["output"]:
+            output = open_archive_file(options["output"], "at")
+        try:
+            for customer_id in customer_ids:
+                archive_customer(
+                    customer_id, cutoff, options["batch_size"], output, result
+                )
+        finally:
+            if output is not None:
+                output.close()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Archived {result.transactions} transactions ({result.lines} lines) of {result.customers} "
+                f"customers before {cutoff:%Y-%m-%d %H:%M}, {result.opening_lines} opening balance lines created."
+            )
+        )
@@ -0,0 +1,156 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db.models import Sum
+from django.db.models.functions import Trunc
+from django.db.transaction import atomic
+from django.utils import timezone
+
+from customers.models import Customer
+from inventory.importers import parse_date_value
+from inventory.models import (
+    InventoryChangeLine,
+    StockCheckpoint,
+    StockCheckpointBalance,
+)
+from utils.model_commons import quantize_sum
+
+
+def period_start(moment: datetime, period: str) -> datetime:
+    """
+    Returns the start of the period containing a moment, in the current time zone.
+    """
+    moment = timezone.localtime(moment)
+    start = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == "week":
+        start -= timedelta(days=start.weekday())
+    elif period == "month":
+        start = start.replace(day=1)
+    return start
+
+
+def next_period(start: datetime, period: str) -> datetime:
+    if period == "day":
+        following = start.replace(tzinfo=None) + timedelta(days=1)
+    elif period == "week":
+        following = start.replace(tzinfo=None) + timedelta(weeks=1)
+    elif start.month == 12:
+        following = start.replace(tzinfo=None, year=start.year + 1, month=1)
+    else:
+        following = start.replace(tzinfo=None, month=start.month + 1)
+    # Rebuilt from the naive time, so periods keep starting at midnight across daylight saving changes.
+    return timezone.make_aware(following)
+
+
+class Command(BaseCommand):
+    help = (
+        "Takes stock checkpoints at the end of every period with activity since each customer's latest "
+        "checkpoint. Meant to run on a schedule, ex: nightly with --period month."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--period", choices=["day", "week", "month"], default="month"
+        )
+        parser.add_argument("--customer", type=int)
+        parser.add_argument(
+            "--until",
+            help="Only take checkpoints up to this date, defaults to now.",
+        )
+
+    def handle(self, *args, **options):
+        period = options["period"]
+        until = (
+            parse_date_value(options["until"]) if options["until"] else timezone.now()
+        )
+        # Only periods that have fully ended get a checkpoint.
+        until = period_start(until, period)
+
+        customers = Customer.objects.order_by("pk")
+        if options["customer"]:
+            customers = customers.filter(pk=options["customer"])
+
+        created = 0
+        for customer_id in customers.values_list("pk", flat=True).iterator():
+            created += self.checkpoint_customer(customer_id, period, until)
+
+        self.stdout.write(self.style.SUCCESS(f"Created {created} checkpoints."))
+
+    @staticmethod
+    def checkpoint_customer(customer_id: int, period: str, until: datetime) -> int:
+        """
+        Folds the customer's lines since their latest checkpoint, grouped by period in a single query, into new
+        checkpoints.
+        """
+        latest = (
+            StockCheckpoint.objects.filter(customer_id=customer_id, date__lt=until)
+            .order_by("-date")
+            .first()
+        )
+        balances = {}
+        lines = InventoryChangeLine.objects.filter(
+            transaction__customer_id=customer_id, transaction__date__lt=until
+        )
+        if latest is not None:
+            lines = lines.filter(transaction__date__gte=latest.date)
+            for row in latest.balances.values_list(
+                "product_id", "location_id", "quantity_int", "quantity_decimal"
+            ):
+                balances[row[:2]] = [row[2], row[3]]
+
+        periods = (
+            lines.annotate(
+                period=Trunc(
+                    "transaction__date", period, tzinfo=timezone.get_current_timezone()
+                )
+            )
+            .values("period", "product_id", "location_id")
+            .annotate(
+                total_int=Sum("quantity_int"), total_decimal=Sum("quantity_decimal")
+            )
+            .order_by("period")
+        )
+
+        created = 0
+        current = None
+        with atomic():
+            for row in periods.iterator():
+                if current is not None and row["period"] != current:
+                    created += Command.save_checkpoint(
+                        customer_id, next_period(current, period), balances
+                    )
+                current = row["period"]
+                total = balances.setdefault(
+                    (row["product_id"], row["location_id"]), [0, Decimal(0)]
+                )
+                total[0] += row["total_int"] or 0
+                total[1] += quantize_sum(row["total_decimal"])
+            if current is not None:
+                created += Command.save_checkpoint(
+                    customer_id, next_period(current, period), balances
+                )
+        return created
+
+    @staticmethod
+    def save_checkpoint(customer_id: int, date: datetime, balances: dict) -> int:
+        checkpoint, created = StockCheckpoint.objects.get_or_create(
+            customer_id=customer_id, date=date
+        )
+        if not created:
+            return 0
+        StockCheckpointBalance.objects.bulk_create(
+            StockCheckpointBalance(
+                checkpoint=checkpoint,
+                product_id=product_id,
+                location_id=location_id,
+                quantity_int=quantity_int,
+                quantity_decimal=quantity_decimal,
+            )
+            for (product_id, location_id), (
+                quantity_int,
+                quantity_decimal,
+            ) in balances.items()
+            if quantity_int or quantity_decimal
+        )
+        return 1
@@ -0,0 +1,398 @@
+import random
+import time
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db.transaction import atomic
+from django.utils import timezone
+
+from customers.models import Customer
+from inventory.models import (
+    StorageLocation,
+    InventoryChangeTemplate,
+    InventoryChangeTemplateField,
+    InventoryTransaction,
+    InventoryChangeLine,
+    InventoryChangeFieldValue,
+)
+from products.models import (
+    ProductTemplate,
+    ProductTemplateField,
+    Product,
+    ProductFieldValue,
+    build_search_document,
+)
+from utils.measure import convert_measure_to_mm
+from utils.model_commons import BaseFieldValue, BaseTemplateField
+
+User = get_user_model()
+
+DIAMETERS = ['2 3/8"', '2 7/8"', '3 1/2"', '4 1/2"', '5 1/2"', '6 5/8"', '7"', '8 5/8"']
+COUPLINGS = ["ERW", "Seamless", "Buttress", "LTC", "STC"]
+GRADES = ["J55", "K55", "L80", "N80", "P110"]
+
+
+class Holdings:
+    """
+    Stock a customer holds by (product, location), so withdrawals are only generated against available stock and no
+    balance goes negative.
+    """
+
+    def __init__(self):
+        # Keys are kept in a list too, so one can be picked at random in constant time.
+        self.keys: list[tuple] = []
+        self.positions: dict[tuple, int] = {}
+        self.quantities: dict[tuple, int | Decimal] = {}
+
+    def add(self, key: tuple, quantity: int | Decimal) -> None:
+        if key not in self.quantities:
+            self.positions[key] = len(self.keys)
+            self.keys.append(key)
+            self.quantities[key] = 0
+        self.quantities[key] += quantity
+
+    def pick(self, rng: random.Random) -> tuple | None:
+        """
+        :return: A random (product, location) key of what is held, or None if nothing is held.
+        """
+        return rng.choice(self.keys) if self.keys else None
+
+    def withdraw(self, key: tuple, quantity: int | Decimal) -> int | Decimal:
+        """
+        Withdraws up to quantity from the holding of key.
+
+        :return: The quantity withdrawn.
+        """
+        quantity = min(quantity, self.quantities[key])
+        self.quantities[key] -= quantity
+        if not self.quantities[key]:
+            # Swap with the last key, so removing doesn't shift the list.
+            index = self.positions.pop(key)
+            last = self.keys.pop()
+            if last != key:
+                self.keys[index] = last
+                self.positions[last] = index
+            del self.quantities[key]
+        return quantity
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates a synthetic inventory dataset with bulk inserts, for benchmarking. Adds to whatever is already in "
+        "the database, then rebuilds the derived tables."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--templates", type=int, default=50)
+        parser.add_argument("--products", type=int, default=200_000)
+        parser.add_argument("--customers", type=int, default=5_000)
+        parser.add_argument("--locations", type=int, default=200)
+        parser.add_argument("--lines", type=int, default=10_000_000)
+        parser.add_argument("--lines-per-transaction", type=int, default=20)
+        parser.add_argument(
+            "--products-per-customer",
+            type=int,
+            default=40,
+            help="Products assigned to each customer, lines only move assigned products.",
+        )
+        parser.add_argument("--years", type=int, default=5)
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        self.run_id = f"{int(time.time())}"
+        start = time.perf_counter()
+
+        with atomic():
+            templates = self.step(
+                "templates", self.create_templates, options["templates"]
+            )
+            products = self.step(
+                "products", self.create_products, templates, options["products"]
+            )
+            locations = self.step(
+                "locations", self.create_locations, options["locations"]
+            )
+            customers = self.step(
+                "customers",
+                self.create_customers,
+                options["customers"],
+                products,
+                options["products_per_customer"],
+            )
+            change_template = self.step(
+                "inventory change template", self.create_change_template, templates
+            )
+            self.step(
+                "lines",
+                self.create_lines,
+                customers,
+                locations,
+                change_template,
+                options["lines"],
+                options["lines_per_transaction"],
+                options["years"],
+            )
+
+        self.step("stock balances", call_command, "rebuild_stock_balances")
+        self.step("daily movements", call_command, "rebuild_daily_movements")
+        self.stdout.write(
+            self.style.SUCCESS(f"Done in {time.perf_counter() - start:.1f}s.")
+        )
+
+    def step(self, name: str, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        self.stdout.write(f"{name}: {time.perf_counter() - start:.1f}s")
+        return result
+
+    def create_templates(self, count: int) -> list[ProductTemplate]:
+        templates = ProductTemplate.objects.bulk_create(
+            ProductTemplate(
+                name=f"Template {self.run_id}-{i}",
+                format_string="{{OD}} {{Grade}} {{Coupling}} - {{Weight}}#",
+                counting_type=(
+                    ProductTemplate.CONTINUOUS
+                    if i % 5 == 4
+                    else ProductTemplate.DISCRETE
+                ),
+            )
+            for i in range(count)
+        )
+        ProductTemplateField.objects.bulk_create(
+            field
+            for template in templates
+            for field in (
+                ProductTemplateField(
+                    template=template,
+                    name="OD",
+                    field_type=BaseTemplateField.MEASURE,
+                    required=True,
+                ),
+                ProductTemplateField(
+                    template=template,
+                    name="Weight",
+                    field_type=BaseTemplateField.DECIMAL,
+                ),
+                ProductTemplateField(
+                    template=template,
+                    name="Grade",
+                    field_type=BaseTemplateField.CHOICES,
+                    choices=GRADES,
+                ),
+                ProductTemplateField(
+                    template=template,
+                    name="Coupling",
+                    field_type=BaseTemplateField.CHOICES,
+                    choices=COUPLINGS,
+                ),
+                ProductTemplateField(
+                    template=template,
+                    name="Joints",
+                    field_type=BaseTemplateField.INT,
+                ),
+            )
+        )
+        return templates
+
+    def create_products(self, templates: list[ProductTemplate], count: int) -> list:
+        """
+        :return: (product id, counting type) pairs.
+        """
+        fields = {template.pk: {} for template in templates}
+        for field in ProductTemplateField.objects.filter(template__in=templates):
+            fields[field.template_id][field.name] = field
+
+        created = []
+        for offset in range(0, count, self.batch_size):
+            products = []
+            values = []
+            for _ in range(min(self.batch_size, count - offset)):
+                template = self.random.choice(templates)
+                product = Product(template=template)
+                raw = {
+                    "OD": self.random.choice(DIAMETERS),
+                    "Weight": Decimal(self.random.randint(400, 6000)) / 100,
+                    "Grade": self.random.choice(GRADES),
+                    "Coupling": self.random.choice(COUPLINGS),
+                    "Joints": self.random.randint(1, 400),
+                }
+                # bulk_create skips ProductFieldValue.save(), so snapshots are built here.
+                product.attributes = {
+                    name: BaseFieldValue.to_json(value) for name, value in raw.items()
+                }
+                product.search_document = build_search_document(
+                    template.format_string, template.name, product.attributes
+                )
+                products.append(product)
+
+                for name, value in raw.items():
+                    field = fields[template.pk][name]
+                    column = BaseFieldValue.VALUE_COLUMNS[field.field_type]
+                    field_value = ProductFieldValue(product=product, field=field)
+                    setattr(field_value, column, value)
+                    if field.field_type == BaseTemplateField.MEASURE:
+                        field_value.value_measure_mm = convert_measure_to_mm(value)
+                    values.append(field_value)
+
+            Product.objects.bulk_create(products)
+            ProductFieldValue.objects.bulk_create(values)
+            created.extend(
+                (product.pk, product.template.counting_type) for product in products
+            )
+        return created
+
+    def create_locations(self, count: int) -> list[int]:
+        locations = StorageLocation.objects.bulk_create(
+            StorageLocation(name=f"Rack {self.run_id}-{i}") for i in range(count)
+        )
+        return [location.pk for location in locations]
+
+    def create_customers(
+        self, count: int, products: list, products_per_customer: int
+    ) -> list[tuple[int, list]]:
+        """
+        :return: (customer id, assigned products) pairs.
+        """
+        password = make_password(None)
+        users = User.objects.bulk_create(
+            (
+                User(
+                    username=f"demo-{self.run_id}-{i}",
+                    email=f"demo-{i}@example.com",
+                    password=password,
+                )
+                for i in range(count)
+            ),
+            batch_size=self.batch_size,
+        )
+        customers = Customer.objects.bulk_create(
+            (
+                Customer(
+                    user=user,
+                    display_name=f"Customer {self.random.randint(0, 10**6):06d} {i}",
+                    phone_number=f"801-555-{i % 10000:04d}",
+                )
+                for i, user in enumerate(users)
+            ),
+            batch_size=self.batch_size,
+        )
+
+        assigned = []
+        Through = Customer.products.through
+        links = []
+        for customer in customers:
+            customer_products = self.random.sample(
+                products, min(products_per_customer, len(products))
+            )
+            assigned.append((customer.pk, customer_products))
+            links.extend(
+                Through(customer_id=customer.pk, product_id=product_id)
+                for product_id, _ in customer_products
+            )
+            if len(links) >= self.batch_size:
+                Through.objects.bulk_create(links)
+                links = []
+        Through.objects.bulk_create(links)
+        return assigned
+
+    def create_change_template(self, templates) -> InventoryChangeTemplate:
+        change_template = InventoryChangeTemplate.objects.create(
+            name=f"Delivery {self.run_id}",
+            format_string="{{amount}} moved on {{date}}, ticket {{Ticket}}",
+        )
+        change_template.product_templates.set(templates)
+        InventoryChangeTemplateField.objects.create(
+            template=change_template,
+            name="Ticket",
+            field_type=BaseTemplateField.TEXT,
+        )
+        return change_template
+
+    def create_lines(
+        self,
+        customers: list,
+        locations: list[int],
+        change_template: InventoryChangeTemplate,
+        count: int,
+        lines_per_transaction: int,
+        years: int,
+    ) -> None:
+        ticket_field = change_template.fields.get()
+        customers = [customer for customer in customers if customer[1]]
+        if not customers:
+            return
+        transaction_count = max(1, count // lines_per_transaction)
+        start = timezone.now() - timedelta(days=365 * years)
+        step = timedelta(days=365 * years) / transaction_count
+        holdings = defaultdict(Holdings)
+
+        created = 0
+        transaction_index = 0
+        while created < count:
+            transactions = []
+            lines = []
+            values = []
+            while len(lines) < self.batch_size and created + len(lines) < count:
+                customer_id, customer_products = self.random.choice(customers)
+                transaction = InventoryTransaction(
+                    customer_id=customer_id, date=start + step * transaction_index
+                )
+                transaction_index += 1
+                transactions.append(transaction)
+                held = holdings[customer_id]
+                inbound = self.random.random() < 0.6
+
+                for _ in range(
+                    min(lines_per_transaction, count - created - len(lines))
+                ):
+                    # Outbound lines withdraw from what the customer holds, and deliver while it holds nothing.
+                    key = None if inbound else held.pick(self.random)
+                    if key is None:
+                        product = self.random.choice(customer_products)
+                        key = (product, self.random.choice(locations))
+                        quantity = self.draw_quantity(product[1])
+                        held.add(key, quantity)
+                    else:
+                        quantity = -held.withdraw(key, self.draw_quantity(key[0][1]))
+                    (product_id, counting_type), location_id = key
+
+                    line = InventoryChangeLine(
+                        transaction=transaction,
+                        product_id=product_id,
+                        location_id=location_id,
+                    )
+                    if counting_type == ProductTemplate.DISCRETE:
+                        line.quantity_int = quantity
+                    else:
+                        line.quantity_decimal = quantity
+                    lines.append(line)
+                    values.append(
+                        InventoryChangeFieldValue(
+                            line=line,
+                            field=ticket_field,
+                            value_text=f"T{transaction_index:08d}",
+                        )
+                    )
+
+            InventoryTransaction.objects.bulk_create(transactions)
+            InventoryChangeLine.objects.bulk_create(lines)
+            InventoryChangeFieldValue.objects.bulk_create(values)
+            created += len(lines)
+            self.stdout.write(f"  {created}/{count} lines", ending="\r")
+        self.stdout.write("")
+
+    def draw_quantity(self, counting_type: str) -> int | Decimal:
+        """
+        :return: A random quantity of a product with the counting type.
+        """
+        if counting_type == ProductTemplate.DISCRETE:
+            return self.random.randint(1, 120)
+        return Decimal(self.random.randint(100, 500000)) / 100
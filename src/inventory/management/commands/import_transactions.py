@@ -0,0 +1,60 @@
+from pathlib import Path
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.importers import READERS, decode_lines, import_transactions
+from inventory.models import InventoryChangeTemplate
+
+
+class Command(BaseCommand):
+    help = "Imports inventory transactions in bulk from a CSV or JSON lines file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", type=Path)
+        parser.add_argument(
+            "--format",
+            choices=READERS.keys(),
+            help="Input format, detected from the file extension by default.",
+        )
+        parser.add_argument(
+            "--template",
+            type=int,
+            help="Id of the inventory change template whose fields extra columns map to.",
+        )
+        parser.add_argument("--chunk-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = options["format"] or path.suffix.lstrip(".").lower()
+        if file_format not in READERS:
+            raise CommandError(f"Unknown format {file_format!r}, use --format.")
+
+        change_template = None
+        if options["template"]:
+            try:
+                change_template = InventoryChangeTemplate.objects.get(
+                    pk=options["template"]
+                )
+            except InventoryChangeTemplate.DoesNotExist:
+                raise CommandError(f"Template {options['template']} does not exist.")
+
+        with path.open("rb") as stream:
+            try:
+                result = import_transactions(
+                    decode_lines(stream),
+                    file_format,
+                    change_template,
+                    options["chunk_size"],
+                )
+            except ValidationError as e:
+                for message in e.messages:
+                    self.stderr.write(message)
+                raise CommandError("Import failed, nothing was imported.")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {result.transactions} transactions, {result.lines} lines and {result.values} values "
+                f"in {result.seconds:.2f}s ({result.rows_per_second:.0f} rows/s)."
+            )
+        )
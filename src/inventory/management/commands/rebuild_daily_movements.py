@@ -0,0 +1,185 @@
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+from functools import partial
+from multiprocessing import get_context
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Q, QuerySet, Sum
+from django.db.models.functions import TruncDate
+from django.db.transaction import atomic
+from django.utils import timezone
+
+from customers.models import Customer
+from inventory.ledger import MOVEMENT_COLUMNS
+from inventory.models import ArchivedChangeLine, DailyMovement, InventoryChangeLine
+from utils.model_commons import quantize_sum
+
+ZERO = (0, 0, Decimal(0), Decimal(0))
+
+
+def daily_totals(lines: QuerySet, date_field: str) -> QuerySet:
+    return (
+        lines.annotate(
+            day=TruncDate(date_field, tzinfo=timezone.get_current_timezone())
+        )
+        .values("product__template_id", "location_id", "day")
+        .annotate(
+            inbound_int=Sum("quantity_int", filter=Q(quantity_int__gt=0)),
+            outbound_int=Sum("quantity_int", filter=Q(quantity_int__lt=0)),
+            inbound_decimal=Sum("quantity_decimal", filter=Q(quantity_decimal__gt=0)),
+            outbound_decimal=Sum("quantity_decimal", filter=Q(quantity_decimal__lt=0)),
+        )
+    )
+
+
+def expected_movements(customer_id: int) -> dict[tuple, tuple]:
+    """
+    Folds a customer's ledger into daily rollups with a grouped query, plus one for their archived lines. Opening
+    balances stand in for archived lines, so they're left out.
+
+    :return: (inbound_int, outbound_int, inbound_decimal, outbound_decimal) by (template_id, location_id, day).
+    """
+    ledger = daily_totals(
+        InventoryChangeLine.objects.filter(
+            transaction__customer_id=customer_id,
+            transaction__is_opening_balance=False,
+        ),
+        "transaction__date",
+    )
+    archive = daily_totals(
+        ArchivedChangeLine.objects.filter(customer_id=customer_id), "date"
+    )
+    expected = {}
+    for rows in (ledger, archive):
+        for row in rows.iterator():
+            key = (row["product__template_id"], row["location_id"], row["day"])
+            movement = expected.get(key, ZERO)
+            expected[key] = (
+                movement[0] + (row["inbound_int"] or 0),
+                movement[1] - (row["outbound_int"] or 0),
+                movement[2] + quantize_sum(row["inbound_decimal"]),
+                movement[3] - quantize_sum(row["outbound_decimal"]),
+            )
+    return {key: movement for key, movement in expected.items() if movement != ZERO}
+
+
+def process_customer(
+    customer_id: int, verify: bool, batch_size: int
+) -> tuple[int, list[str]]:
+    """
+    Rebuilds or verifies the rollups of one customer. Runs in worker processes, so it only takes and returns plain
+    values.
+
+    :return: The number of rollups and a description of each one that differs from the ledger.
+    """
+    expected = expected_movements(customer_id)
+    movements = DailyMovement.objects.filter(customer_id=customer_id)
+
+    if not verify:
+        with atomic():
+            movements.delete()
+            DailyMovement.objects.bulk_create(
+                (
+                    DailyMovement(
+                        customer_id=customer_id,
+                        template_id=template_id,
+                        location_id=location_id,
+                        day=day,
+                        **dict(zip(MOVEMENT_COLUMNS, movement)),
+                    )
+                    for (template_id, location_id, day), movement in expected.items()
+                ),
+                batch_size=batch_size,
+            )
+        return len(expected), []
+
+    stored = {
+        row[:3]: row[3:]
+        for row in movements.values_list(
+            "template_id", "location_id", "day", *MOVEMENT_COLUMNS
+        ).iterator()
+    }
+    mismatches = []
+    for key in sorted(expected.keys() | stored.keys()):
+        ledger = expected.get(key, ZERO)
+        rollup = stored.get(key, ZERO)
+        if ledger != rollup:
+            mismatches.append(
+                f"customer={customer_id} template={key[0]} location={key[1]} day={key[2]}: "
+                f"ledger={ledger} rollup={rollup}"
+            )
+    return len(expected), mismatches
+
+
+def close_connections() -> None:
+    # Worker processes must open their own database connections, never share their parent's.
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds the daily movement rollups from the inventory ledger, or verifies them with --verify. Customers "
+        "are independent, so they can be processed by parallel workers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Compare stored rollups against the ledger without changing anything.",
+        )
+        parser.add_argument(
+            "--customer",
+            type=int,
+            help="Only rebuild or verify rollups for the customer with this id.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Worker processes. SQLite serializes writers, so only --verify benefits there.",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        customers = Customer.objects.order_by("pk")
+        if options["customer"]:
+            customers = customers.filter(pk=options["customer"])
+        customer_ids = list(customers.values_list("pk", flat=True))
+
+        process = partial(
+            process_customer,
+            verify=options["verify"],
+            batch_size=options["batch_size"],
+        )
+        if options["workers"] > 1:
+            close_connections()
+            with ProcessPoolExecutor(
+                max_workers=options["workers"],
+                mp_context=get_context("fork"),
+                initializer=close_connections,
+            ) as pool:
+                results = list(pool.map(process, customer_ids, chunksize=8))
+        else:
+            results = [process(customer_id) for customer_id in customer_ids]
+
+        rollups = sum(count for count, _ in results)
+        mismatches = [mismatch for _, found in results for mismatch in found]
+        for mismatch in mismatches:
+            self.stdout.write(mismatch)
+
+        if options["verify"]:
+            if mismatches:
+                raise CommandError(
+                    f"{len(mismatches)} daily movements differ from the ledger."
+                )
+            self.stdout.write(
+                self.style.SUCCESS(f"Verified {rollups} daily movements.")
+            )
+        else:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Rebuilt {rollups} daily movements for {len(customer_ids)} customers."
+                )
+            )
@@ -0,0 +1,99 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Sum
+from django.db.transaction import atomic
+
+from customers.models import Customer
+from inventory.models import InventoryChangeLine, StockBalance
+from utils.model_commons import quantize_sum
+
+
+class Command(BaseCommand):
+    help = "Rebuilds stock balances from the inventory ledger, or verifies them with --verify."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Compare stored balances against the ledger without changing anything.",
+        )
+        parser.add_argument(
+            "--customer",
+            type=int,
+            help="Only rebuild or verify balances for the customer with this id.",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        lines = InventoryChangeLine.objects.all()
+        balances = StockBalance.objects.all()
+        if options["customer"]:
+            lines = lines.filter(transaction__customer_id=options["customer"])
+            balances = balances.filter(customer_id=options["customer"])
+
+        expected = {}
+        totals = lines.values(
+            "transaction__customer_id", "product_id", "location_id"
+        ).annotate(total_int=Sum("quantity_int"), total_decimal=Sum("quantity_decimal"))
+        for row in totals.iterator():
+            key = (
+                row["transaction__customer_id"],
+                row["product_id"],
+                row["location_id"],
+            )
+            expected[key] = (row["total_int"] or 0, quantize_sum(row["total_decimal"]))
+
+        if options["verify"]:
+            self.verify(expected, balances)
+        else:
+            self.rebuild(expected, balances, options["batch_size"])
+
+    def verify(self, expected, balances):
+        mismatches = 0
+        stored = {}
+        for balance in balances.iterator():
+            key = (balance.customer_id, balance.product_id, balance.location_id)
+            stored[key] = (balance.quantity_int, balance.quantity_decimal)
+
+        for key in expected.keys() | stored.keys():
+            ledger = expected.get(key, (0, Decimal(0)))
+            balance = stored.get(key, (0, Decimal(0)))
+            if ledger != balance:
+                mismatches += 1
+                self.stdout.write(
+                    f"customer={key[0]} product={key[1]} location={key[2]}: "
+                    f"ledger={ledger} balance={balance}"
+                )
+
+        if mismatches:
+            raise CommandError(f"{mismatches} stock balances differ from the ledger.")
+        self.stdout.write(
+            self.style.SUCCESS(f"Verified {len(expected)} stock balances.")
+        )
+
+    def rebuild(self, expected, balances, batch_size):
+        with atomic():
+            customer_ids = {key[0] for key in expected}
+            customer_ids.update(balances.values_list("customer_id", flat=True))
+            balances.delete()
+            StockBalance.objects.bulk_create(
+                (
+                    StockBalance(
+                        customer_id=customer_id,
+                        product_id=product_id,
+                        location_id=location_id,
+                        quantity_int=quantity_int,
+                        quantity_decimal=quantity_decimal,
+                    )
+                    for (customer_id, product_id, location_id), (
+                        quantity_int,
+                        quantity_decimal,
+                    ) in expected.items()
+                ),
+                batch_size=batch_size,
+            )
+            Customer.objects.bump_stock_version(customer_ids)
+        self.stdout.write(
+            self.style.SUCCESS(f"Rebuilt {len(expected)} stock balances.")
+        )
@@ -0,0 +1,84 @@
+import json
+import platform
+from pathlib import Path
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from customers.models import Customer
+from inventory.benchmarks import BENCHMARKS, build_context, run_benchmark
+from inventory.models import InventoryChangeLine, InventoryTransaction, StockBalance
+from products.models import Product, ProductTemplate
+
+
+class Command(BaseCommand):
+    help = (
+        "Times the key request and service paths and counts their queries, writing a JSON report that can be "
+        "diffed between releases."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", type=Path, help="Write the report here.")
+        parser.add_argument(
+            "--baseline",
+            type=Path,
+            help="A previous report to compare against.",
+        )
+        parser.add_argument("--repeat", type=int, default=10)
+        parser.add_argument(
+            "--only",
+            nargs="+",
+            choices=BENCHMARKS.keys(),
+            help="Run only these benchmarks.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            context = build_context()
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        report = {
+            "created": timezone.now().isoformat(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "database": connection.vendor,
+            "counts": {
+                model.__name__: model.objects.count()
+                for model in (
+                    ProductTemplate,
+                    Product,
+                    Customer,
+                    InventoryTransaction,
+                    InventoryChangeLine,
+                    StockBalance,
+                )
+            },
+            "benchmarks": {},
+        }
+
+        for name in options["only"] or BENCHMARKS:
+            result = run_benchmark(BENCHMARKS[name], context, options["repeat"])
+            report["benchmarks"][name] = result
+            self.stdout.write(
+                f"{name:<28} {result['median_ms']:>10.2f}ms {result['queries']:>5} queries"
+                + self.compare(name, result, options["baseline"])
+            )
+
+        if options["output"]:
+            options["output"].write_text(json.dumps(report, indent=2))
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+
+    def compare(self, name: str, result: dict, baseline_path: Path | None) -> str:
+        if baseline_path is None:
+            return ""
+        if not hasattr(self, "_baseline"):
+            self._baseline = json.loads(baseline_path.read_text()).get("benchmarks", {})
+        previous = self._baseline.get(name)
+        if not previous or not previous["median_ms"]:
+            return ""
+        change = (result["median_ms"] / previous["median_ms"] - 1) * 100
+        queries = result["queries"] - previous["queries"]
+        return f"  ({change:+.1f}% time, {queries:+d} queries)"
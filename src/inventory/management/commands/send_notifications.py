@@ -0,0 +1,68 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from inventory.notifications import dispatch_batch, outbox_stats, purge_sent
+
+
+class Command(BaseCommand):
+    help = (
+        "Sends queued inventory transaction notifications to notification groups, batched into one digest per "
+        "address over a reused SMTP connection."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=200)
+        parser.add_argument("--max-attempts", type=int, default=5)
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep polling the outbox instead of exiting once it's empty.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5.0,
+            help="Seconds to wait between polls of an empty outbox with --loop.",
+        )
+        parser.add_argument(
+            "--purge-days",
+            type=int,
+            help="Delete notifications sent more than this many days ago.",
+        )
+
+    def handle(self, *args, **options):
+        self.report_stats(options["max_attempts"])
+        try:
+            while True:
+                result = dispatch_batch(options["batch_size"], options["max_attempts"])
+                if result.notifications:
+                    self.stdout.write(
+                        f"Sent {result.sent} notifications in {result.messages} emails "
+                        f"({result.smtp_seconds:.2f}s SMTP, {result.max_latency:.1f}s max latency), "
+                        f"{result.failed} failed"
+                    )
+                    for error in result.errors:
+                        self.stderr.write(error)
+                    # A full batch of failures means the mail server is down, back off instead of spinning.
+                    if result.failed and not result.sent:
+                        time.sleep(options["interval"])
+                    continue
+                if not options["loop"]:
+                    break
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            pass
+
+        if options["purge_days"] is not None:
+            purged = purge_sent(timedelta(days=options["purge_days"]))
+            self.stdout.write(f"Purged {purged} sent notifications.")
+        self.report_stats(options["max_attempts"])
+
+    def report_stats(self, max_attempts: int) -> None:
+        stats = outbox_stats(max_attempts)
+        self.stdout.write(
+            f"Outbox: {stats['depth']} pending, oldest {stats['oldest_seconds']:.1f}s, "
+            f"{stats['dead']} gave up after {max_attempts} attempts"
+        )
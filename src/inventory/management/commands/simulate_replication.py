@@ -0,0 +1,91 @@
+import sqlite3
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from utils.db_routing import REPLICA_DB_ALIAS, has_replica
+
+
+def sqlite_path(database: dict) -> str:
+    name = str(database["NAME"])
+    if database.get("OPTIONS", {}).get("uri"):
+        return urlsplit(name).path
+    return name
+
+
+def snapshot(path: str) -> sqlite3.Connection:
+    """
+    Copies a consistent snapshot of a SQLite database into memory.
+    """
+    source = sqlite3.connect(path)
+    copy = sqlite3.connect(":memory:")
+    try:
+        source.backup(copy)
+    finally:
+        source.close()
+    return copy
+
+
+class Command(BaseCommand):
+    help = (
+        "Stands in for replication locally: copies the SQLite primary over the replica database every --interval "
+        "seconds, as it was --lag seconds earlier, so reads routed to the replica lag behind like on a real one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lag", type=float, default=2.0)
+        parser.add_argument("--interval", type=float, default=0.5)
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Copy the primary to the replica once, without lag, and exit.",
+        )
+
+    def handle(self, *args, **options):
+        if not has_replica():
+            raise CommandError(
+                "No replica database configured, set REPLICA_DATABASE to its path."
+            )
+        primary = settings.DATABASES[DEFAULT_DB_ALIAS]
+        replica = settings.DATABASES[REPLICA_DB_ALIAS]
+        if "sqlite3" not in primary["ENGINE"] or "sqlite3" not in replica["ENGINE"]:
+            raise CommandError(
+                "Replication can only be simulated between SQLite files."
+            )
+        primary_path = sqlite_path(primary)
+        replica_path = sqlite_path(replica)
+
+        if options["once"]:
+            self.publish(snapshot(primary_path), replica_path)
+            self.stdout.write(self.style.SUCCESS("Copied the primary to the replica."))
+            return
+
+        # (taken at, snapshot) in the order taken, held until they're lag seconds old
+        pending = deque()
+        while True:
+            pending.append((time.time(), snapshot(primary_path)))
+            due = None
+            while pending and pending[0][0] <= time.time() - options["lag"]:
+                if due is not None:
+                    due[1].close()
+                due = pending.popleft()
+            if due is not None:
+                self.publish(due[1], replica_path)
+                self.stdout.write(
+                    f"Replica at {time.strftime('%H:%M:%S', time.localtime(due[0]))}, "
+                    f"{time.time() - due[0]:.1f}s behind."
+                )
+            time.sleep(options["interval"])
+
+    @staticmethod
+    def publish(copy: sqlite3.Connection, replica_path: str) -> None:
+        replica = sqlite3.connect(replica_path, timeout=20)
+        try:
+            copy.backup(replica)
+        finally:
+            replica.close()
+            copy.close()
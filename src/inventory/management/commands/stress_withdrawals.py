@@ -0,0 +1,159 @@
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from multiprocessing import get_context
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+
+from customers.models import Customer
+from inventory.models import InventoryChangeLine, StockBalance, StorageLocation
+from inventory.services import InsufficientStock, post_transaction, withdraw
+from products.models import Product, ProductTemplate
+
+
+def withdraw_repeatedly(
+    customer_id: int, product_id: int, location_id: int, quantity: int, count: int
+) -> dict:
+    """
+    Attempts count withdrawals on its own database connection.
+
+    :return: Counts of the outcomes.
+    """
+    customer = Customer.objects.get(pk=customer_id)
+    product = Product.objects.select_related("template").get(pk=product_id)
+    outcomes = {"succeeded": 0, "rejected": 0, "failed": 0}
+    try:
+        for _ in range(count):
+            try:
+                withdraw(customer, product, location_id, quantity)
+                outcomes["succeeded"] += 1
+            except InsufficientStock:
+                outcomes["rejected"] += 1
+            except Exception:
+                outcomes["failed"] += 1
+    finally:
+        connection.close()
+    return outcomes
+
+
+def run_threads(threads: int, task, process: int) -> list[dict]:
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return list(pool.map(lambda _: task(), range(threads)))
+
+
+def close_connections() -> None:
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        "Fires concurrent withdrawals of the same stock from many threads and processes, then checks no more stock "
+        "was withdrawn than was held and that balances still match the ledger. Creates its own customer, product "
+        "and location, so only run it against a development database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=2)
+        parser.add_argument("--threads", type=int, default=4)
+        parser.add_argument(
+            "--withdrawals",
+            type=int,
+            default=50,
+            help="Withdrawals attempted by each thread.",
+        )
+        parser.add_argument("--stock", type=int, default=200)
+        parser.add_argument("--quantity", type=int, default=1)
+
+    def handle(self, *args, **options):
+        customer, product, location = self.create_stock(options["stock"])
+
+        task = partial(
+            withdraw_repeatedly,
+            customer.pk,
+            product.pk,
+            location.pk,
+            options["quantity"],
+            options["withdrawals"],
+        )
+        start = time.perf_counter()
+        close_connections()
+        with ProcessPoolExecutor(
+            max_workers=options["processes"],
+            mp_context=get_context("fork"),
+            initializer=close_connections,
+        ) as pool:
+            results = [
+                outcome
+                for outcomes in pool.map(
+                    partial(run_threads, options["threads"], task),
+                    range(options["processes"]),
+                )
+                for outcome in outcomes
+            ]
+        elapsed = time.perf_counter() - start
+
+        totals = {
+            name: sum(result[name] for result in results)
+            for name in ("succeeded", "rejected", "failed")
+        }
+        attempts = sum(totals.values())
+        self.stdout.write(
+            f"{attempts} withdrawals in {elapsed:.2f}s ({attempts / elapsed:.0f}/s): "
+            f"{totals['succeeded']} succeeded, {totals['rejected']} rejected, {totals['failed']} failed"
+        )
+
+        self.check_invariants(customer, product, location, options, totals)
+
+    def create_stock(self, stock: int):
+        run_id = uuid.uuid4().hex[:8]
+        user = get_user_model().objects.create(username=f"stress-{run_id}")
+        customer = Customer.objects.create(user=user, display_name=f"Stress {run_id}")
+        template, _ = ProductTemplate.objects.get_or_create(
+            name="Stress Test", defaults={"format_string": "Stress Test"}
+        )
+        product = Product.objects.create(template=template)
+        location = StorageLocation.objects.create(name=f"Stress {run_id}")
+        post_transaction(
+            customer,
+            [
+                InventoryChangeLine(
+                    product=product, location=location, quantity_int=stock
+                )
+            ],
+        )
+        return customer, product, location
+
+    def check_invariants(self, customer, product, location, options, totals) -> None:
+        balance = StockBalance.objects.get_quantity(customer, product, location)
+        expected = options["stock"] - totals["succeeded"] * options["quantity"]
+        errors = []
+        if balance < 0:
+            errors.append(f"Balance went negative: {balance}.")
+        if balance != expected:
+            errors.append(
+                f"Balance is {balance}, expected {expected} after {totals['succeeded']} withdrawals."
+            )
+        if totals["failed"]:
+            errors.append(f"{totals['failed']} withdrawals failed unexpectedly.")
+        # Balances only go down, so a rejection means too little stock remained for the rest of the run.
+        if totals["rejected"] and balance >= options["quantity"]:
+            errors.append(
+                f"{totals['rejected']} withdrawals were rejected while stock remained."
+            )
+        try:
+            call_command(
+                "rebuild_stock_balances",
+                verify=True,
+                customer=customer.pk,
+                stdout=self.stdout,
+            )
+        except CommandError as e:
+            errors.append(str(e))
+
+        if errors:
+            raise CommandError(" ".join(errors))
+        self.stdout.write(self.style.SUCCESS(f"Invariants hold, {balance} left."))
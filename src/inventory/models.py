@@ -1,7 +1,12 @@
+from datetime import datetime
+from decimal import Decimal
+
 from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.transaction import atomic
 
-from utils.model_commons import BaseTemplateField, BaseFieldValue
+from utils.format_string import render_format_string
+from utils.model_commons import BaseTemplateField, BaseFieldValue, quantize_sum
 from products.models import ProductTemplate
 
 
@@ -56,6 +61,36 @@ class InventoryTransaction(models.Model):
 
     customer = models.ForeignKey("customers.Customer", on_delete=models.PROTECT)
     date = models.DateTimeField()
+    is_opening_balance = models.BooleanField(
+        default=False,
+        help_text="Carries forward the stock of the customer's archived transactions, see archive_ledger.",
+    )
+
+    def save(self, *args, **kwargs) -> None:
+        from inventory.ledger import LedgerChanges
+
+        with atomic():
+            adding = self._state.adding
+            previous = None
+            if self.pk is not None:
+                previous = (
+                    InventoryTransaction.objects.filter(pk=self.pk)
+                    .values("customer_id", "date")
+                    .first()
+                )
+            super().save(*args, **kwargs)
+
+            # Queued in the same database transaction, so a notification exists exactly when the transaction does.
+            if adding:
+                TransactionNotification.objects.create(transaction=self)
+
+            # Moving a transaction to another customer or date moves its stock with it.
+            if previous and (
+                previous["customer_id"] != self.customer_id
+                or previous["date"] != self.date
+            ):
+                lines = list(self.lines.all())
+                LedgerChanges().remove(lines, **previous).add(lines).apply()
 
     def __str__(self) -> str:
         return f"Transaction {self.pk} ({self.date})"
@@ -104,16 +139,77 @@ class InventoryChangeLine(models.Model):
                 )
 
     def save(self, *args, **kwargs) -> None:
+        from inventory.ledger import LedgerChanges
+
         self.clean()
-        super().save(*args, **kwargs)
+        with atomic():
+            adding = self._state.adding
+            previous = None
+            if self.pk is not None:
+                previous = (
+                    InventoryChangeLine.objects.select_related("transaction")
+                    .filter(pk=self.pk)
+                    .first()
+                )
+            super().save(*args, **kwargs)
 
-    def __str__(self) -> str:
-        qty = (
+            # A line added once its transaction's notification was claimed or sent gets a notification of its own.
+            # Locking the pending one keeps dispatchers from claiming it until the line is committed.
+            if adding and not (
+                TransactionNotification.objects.select_for_update()
+                .filter(
+                    transaction_id=self.transaction_id,
+                    line=None,
+                    sent_at__isnull=True,
+                    claimed_by="",
+                )
+                .exists()
+            ):
+                TransactionNotification.objects.create(
+                    transaction_id=self.transaction_id, line=self
+                )
+
+            changes = LedgerChanges().add([self])
+            if previous is not None:
+                changes.remove([previous])
+            changes.apply()
+
+    @property
+    def quantity(self) -> int | Decimal | None:
+        return (
             self.quantity_int
             if self.quantity_int is not None
             else self.quantity_decimal
         )
-        return f"{self.product} ({qty}) @ {self.location}"
+
+    @property
+    def display_name(self) -> str:
+        """
+        Returns the line rendered with the format string of the inventory change template its values belong to. The
+        built-in placeholders amount, date, product and location are always available.
+        """
+        field_values = self.values.all()
+        if "values" not in getattr(self, "_prefetched_objects_cache", {}):
+            field_values = field_values.select_related("field__template")
+        field_values = list(field_values)
+        if not field_values:
+            return str(self)
+
+        values = {
+            "amount": self.quantity,
+            "date": self.transaction.date,
+            "product": self.product,
+            "location": self.location,
+        }
+        for field_value in field_values:
+            if field_value.field.field_type != BaseTemplateField.FILE:
+                values[field_value.field.name] = field_value.value
+        return render_format_string(
+            field_values[0].field.template.format_string, values
+        )
+
+    def __str__(self) -> str:
+        return f"{self.product} ({self.quantity}) @ {self.location}"
 
 
 class InventoryChangeFieldValue(BaseFieldValue):
@@ -137,3 +233,296 @@ class InventoryChangeFieldValue(BaseFieldValue):
 
     def get_owner(self):
         return self.line
+
+
+class TransactionNotification(models.Model):
+    """
+    Represents an outbox entry for notifying a customer's notification groups about an inventory transaction. Written
+    atomically with the transaction and sent later by the send_notifications command. Lines added to the transaction
+    after its notification went out get a notification of their own.
+    """
+
+    transaction = models.ForeignKey(
+        InventoryTransaction, on_delete=models.CASCADE, related_name="notifications"
+    )
+    line = models.ForeignKey(
+        InventoryChangeLine,
+        on_delete=models.CASCADE,
+        blank=True,
+        null=True,
+        related_name="notifications",
+        help_text="Only this line is notified when set, else every line of the transaction.",
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    # Set by the dispatcher sending the notification, until it's sent or the claim expires.
+    claimed_by = models.CharField(max_length=32, blank=True)
+    claimed_until = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # The dispatcher only ever scans unsent notifications.
+            models.Index(
+                fields=["id"],
+                condition=models.Q(sent_at__isnull=True),
+                name="notification_pending_idx",
+            )
+        ]
+
+    def __str__(self) -> str:
+        return f"Notification for {self.transaction}"
+
+
+class StockBalanceManager(models.Manager):
+    def get_quantity(self, customer, product, location) -> int | Decimal:
+        """
+        Returns the quantity of a product a customer holds at a location, read from a single balance row.
+        """
+        row = (
+            self.filter(customer=customer, product=product, location=location)
+            .values_list("quantity_int", "quantity_decimal")
+            .first()
+        )
+        if row is None:
+            return 0
+        quantity_int, quantity_decimal = row
+        return quantity_decimal if quantity_decimal else quantity_int
+
+
+class StockBalance(models.Model):
+    """
+    Represents the current quantity of a product held by a customer at a storage location. Derived from the
+    InventoryChangeLine ledger and maintained incrementally whenever lines are created, edited or deleted.
+    """
+
+    customer = models.ForeignKey(
+        "customers.Customer", on_delete=models.CASCADE, related_name="stock_balances"
+    )
+    product = models.ForeignKey(
+        "products.Product", on_delete=models.CASCADE, related_name="stock_balances"
+    )
+    location = models.ForeignKey(
+        StorageLocation, on_delete=models.CASCADE, related_name="stock_balances"
+    )
+    quantity_int = models.BigIntegerField(default=0)
+    quantity_decimal = models.DecimalField(
+        default=Decimal(0), max_digits=19, decimal_places=4
+    )
+
+    objects = StockBalanceManager()
+
+    class Meta:
+        # Enforce only one balance for each customer, product and location.
+        constraints = [
+            models.UniqueConstraint(
+                fields=["customer", "product", "location"],
+                name="unique_stock_balance",
+            )
+        ]
+
+    @property
+    def quantity(self) -> int | Decimal:
+        """
+        Returns the quantity of the balance, a product only ever uses one of the quantity columns.
+        """
+        return self.quantity_decimal if self.quantity_decimal else self.quantity_int
+
+    def __str__(self) -> str:
+        return f"{self.product} ({self.quantity}) @ {self.location}"
+
+
+class DailyMovement(models.Model):
+    """
+    Represents the quantity of a product template a customer moved in and out of a storage location on a day, in the
+    current time zone. Derived from the InventoryChangeLine ledger and maintained incrementally with StockBalance.
+
+    Outbound quantities are stored positive. As with lines, discrete templates use the int columns and continuous
+    templates the decimal ones.
+    """
+
+    customer = models.ForeignKey(
+        "customers.Customer", on_delete=models.CASCADE, related_name="daily_movements"
+    )
+    template = models.ForeignKey(
+        "products.ProductTemplate",
+        on_delete=models.CASCADE,
+        related_name="daily_movements",
+    )
+    location = models.ForeignKey(
+        StorageLocation, on_delete=models.CASCADE, related_name="daily_movements"
+    )
+    day = models.DateField()
+    inbound_int = models.BigIntegerField(default=0)
+    outbound_int = models.BigIntegerField(default=0)
+    inbound_decimal = models.DecimalField(
+        default=Decimal(0), max_digits=19, decimal_places=4
+    )
+    outbound_decimal = models.DecimalField(
+        default=Decimal(0), max_digits=19, decimal_places=4
+    )
+
+    class Meta:
+        # Enforce only one rollup for each customer, template, location and day.
+        constraints = [
+            models.UniqueConstraint(
+                fields=["customer", "template", "location", "day"],
+                name="unique_daily_movement",
+            )
+        ]
+        # Reports across customers filter on a range of days
+        indexes = [models.Index(fields=["day"], name="daily_movement_day_idx")]
+
+    def __str__(self) -> str:
+        return f"{self.template} @ {self.location} on {self.day}"
+
+
+class StockCheckpointManager(models.Manager):
+    def stock_as_of(
+        self, customer, when: datetime, product=None, location=None
+    ) -> dict[tuple[int, int], int | Decimal]:
+        """
+        Returns what a customer held at a point in time, keyed by (product id, location id). Starts from the nearest
+        checkpoint at or before the time and adds only the ledger lines since, so the cost depends on recent activity
+        rather than the whole history.
+        """
+        checkpoint = (
+            self.filter(customer=customer, date__lte=when).order_by("-date").first()
+        )
+
+        totals = {}
+        if checkpoint is not None:
+            balances = checkpoint.balances.all()
+            if product is not None:
+                balances = balances.filter(product=product)
+            if location is not None:
+                balances = balances.filter(location=location)
+            for (
+                product_id,
+                location_id,
+                quantity_int,
+                quantity_decimal,
+            ) in balances.values_list(
+                "product_id", "location_id", "quantity_int", "quantity_decimal"
+            ):
+                totals[(product_id, location_id)] = [quantity_int, quantity_decimal]
+
+        lines = InventoryChangeLine.objects.filter(
+            transaction__customer=customer, transaction__date__lte=when
+        )
+        if checkpoint is not None:
+            lines = lines.filter(transaction__date__gte=checkpoint.date)
+        if product is not None:
+            lines = lines.filter(product=product)
+        if location is not None:
+            lines = lines.filter(location=location)
+        for row in lines.values("product_id", "location_id").annotate(
+            total_int=models.Sum("quantity_int"),
+            total_decimal=models.Sum("quantity_decimal"),
+        ):
+            total = totals.setdefault(
+                (row["product_id"], row["location_id"]), [0, Decimal(0)]
+            )
+            total[0] += row["total_int"] or 0
+            total[1] += quantize_sum(row["total_decimal"])
+
+        return {
+            key: quantity_decimal if quantity_decimal else quantity_int
+            for key, (quantity_int, quantity_decimal) in totals.items()
+            if quantity_int or quantity_decimal
+        }
+
+
+class StockCheckpoint(models.Model):
+    """
+    Represents a snapshot of every non-zero balance a customer held just before a point in time, including
+    transactions dated strictly before it. Taken periodically by the create_stock_checkpoints command.
+
+    Reverse lookups:
+     - balances: StockCheckpointBalance instances associated with this checkpoint.
+    """
+
+    customer = models.ForeignKey(
+        "customers.Customer", on_delete=models.CASCADE, related_name="stock_checkpoints"
+    )
+    date = models.DateTimeField()
+
+    objects = StockCheckpointManager()
+
+    class Meta:
+        # Enforce only one checkpoint for each customer at a time.
+        constraints = [
+            models.UniqueConstraint(
+                fields=["customer", "date"], name="unique_stock_checkpoint"
+            )
+        ]
+
+    def __str__(self) -> str:
+        return f"Checkpoint {self.customer_id} ({self.date})"
+
+
+class StockCheckpointBalance(models.Model):
+    """
+    Represents the quantity of a product held at a storage location in a checkpoint.
+    """
+
+    checkpoint = models.ForeignKey(
+        StockCheckpoint, on_delete=models.CASCADE, related_name="balances"
+    )
+    product = models.ForeignKey("products.Product", on_delete=models.CASCADE)
+    location = models.ForeignKey(StorageLocation, on_delete=models.CASCADE)
+    quantity_int = models.BigIntegerField(default=0)
+    quantity_decimal = models.DecimalField(
+        default=Decimal(0), max_digits=19, decimal_places=4
+    )
+
+    class Meta:
+        # Enforce only one balance for each product and location in a checkpoint.
+        constraints = [
+            models.UniqueConstraint(
+                fields=["checkpoint", "product", "location"],
+                name="unique_stock_checkpoint_balance",
+            )
+        ]
+
+
+class ArchivedChangeLine(models.Model):
+    """
+    Represents an inventory change line moved out of the ledger by the archive_ledger command, flattened with its
+    transaction and field values. Archived lines are history only, the stock they add up to is carried by their
+    customer's opening balance transaction.
+    """
+
+    line_id = models.BigIntegerField(unique=True)
+    transaction_id = models.BigIntegerField()
+    customer = models.ForeignKey(
+        "customers.Customer", on_delete=models.PROTECT, related_name="archived_lines"
+    )
+    date = models.DateTimeField()
+    product = models.ForeignKey("products.Product", on_delete=models.PROTECT)
+    location = models.ForeignKey(StorageLocation, on_delete=models.PROTECT)
+    quantity_int = models.IntegerField(blank=True, null=True)
+    quantity_decimal = models.DecimalField(
+        blank=True, null=True, max_digits=15, decimal_places=4
+    )
+    # Field values by field name, see BaseFieldValue.json_value
+    values = models.JSONField(default=dict, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        # Archived history is read by customer and date range
+        indexes = [
+            models.Index(fields=["customer", "date"], name="archived_line_date_idx")
+        ]
+
+    @property
+    def quantity(self) -> int | Decimal | None:
+        return (
+            self.quantity_int
+            if self.quantity_int is not None
+            else self.quantity_decimal
+        )
+
+    def __str__(self) -> str:
+        return f"{self.product} ({self.quantity}) @ {self.location}"
@@ -0,0 +1,239 @@
+import time
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection as db_connection
+from django.db.models import Count, F, Min, Q
+from django.db.transaction import atomic
+from django.utils import timezone
+
+from inventory.models import InventoryChangeLine, TransactionNotification
+from utils.format_string import render_format_string
+
+
+# Seconds a dispatcher holds the notifications it claimed. If it dies before sending them, another one retries them
+# once the claim expires.
+CLAIM_SECONDS = 600
+
+
+@dataclass
+class DispatchResult:
+    notifications: int = 0
+    sent: int = 0
+    failed: int = 0
+    messages: int = 0
+    # Seconds between queueing and sending, of the oldest notification sent
+    max_latency: float = 0.0
+    smtp_seconds: float = 0.0
+    errors: list[str] = field(default_factory=list)
+
+
+def pending_notifications(max_attempts: int = 5):
+    return TransactionNotification.objects.filter(
+        sent_at__isnull=True, attempts__lt=max_attempts
+    )
+
+
+def claim_notifications(batch_size: int, max_attempts: int = 5) -> list[dict]:
+    """
+    Claims a batch of pending notifications, so concurrent dispatchers never send the same one. On databases with
+    SKIP LOCKED, dispatchers lock the notifications they claim and skip the ones others hold. Elsewhere, they're
+    claimed by a conditional update that only matches notifications nobody holds, like jobs.runner.claim_job.
+
+    :return: The pk, transaction_id, line_id and created_at of the claimed notifications.
+    """
+    now = timezone.now()
+    claim = uuid.uuid4().hex
+    claimable = (
+        pending_notifications(max_attempts)
+        .filter(Q(claimed_until__isnull=True) | Q(claimed_until__lt=now))
+        .order_by("pk")
+    )
+    fields = {
+        "claimed_by": claim,
+        "claimed_until": now + timedelta(seconds=CLAIM_SECONDS),
+    }
+
+    if db_connection.features.has_select_for_update_skip_locked:
+        with atomic():
+            pks = list(
+                claimable.select_for_update(skip_locked=True).values_list(
+                    "pk", flat=True
+                )[:batch_size]
+            )
+            TransactionNotification.objects.filter(pk__in=pks).update(**fields)
+    else:
+        pks = list(claimable.values_list("pk", flat=True)[:batch_size])
+        claimable.filter(pk__in=pks).update(**fields)
+
+    return list(
+        TransactionNotification.objects.filter(claimed_by=claim)
+        .order_by("pk")
+        .values("pk", "transaction_id", "line_id", "created_at")
+    )
+
+
+def outbox_stats(max_attempts: int = 5) -> dict:
+    """
+    :return: The queue depth, the age in seconds of its oldest notification, and how many notifications gave up.
+    """
+    pending = pending_notifications(max_attempts).aggregate(
+        depth=Count("id"), oldest=Min("created_at")
+    )
+    oldest = pending["oldest"]
+    return {
+        "depth": pending["depth"],
+        "oldest_seconds": (
+            (timezone.now() - oldest).total_seconds() if oldest is not None else 0.0
+        ),
+        "dead": TransactionNotification.objects.filter(
+            sent_at__isnull=True, attempts__gte=max_attempts
+        ).count(),
+    }
+
+
+def resolve_recipients(
+    transaction_ids: list[int], line_ids: list[int] = ()
+) -> dict[str, set[int]]:
+    """
+    Finds the lines each address must hear about, in a single query for the whole batch: every line of the
+    transactions, and the lines notified on their own. A line notifies every group of its transaction's customer
+    subscribed to the line's product template, and an address in several of those groups is only notified once.
+
+    :return: Line ids by address.
+    """
+    rows = (
+        InventoryChangeLine.objects.filter(
+            Q(transaction_id__in=transaction_ids) | Q(pk__in=line_ids),
+            product__template__notification_groups__customer_id=F(
+                "transaction__customer_id"
+            ),
+            product__template__notification_groups__emails__isnull=False,
+        )
+        .values_list("product__template__notification_groups__emails__address", "pk")
+        .distinct()
+    )
+    recipients = defaultdict(set)
+    for address, line_id in rows:
+        recipients[address.lower()].add(line_id)
+    return recipients
+
+
+def render_digest(lines: list[InventoryChangeLine]) -> tuple[str, str]:
+    """
+    :return: The subject and body of one email covering every line an address is notified about.
+    """
+    lines = sorted(lines, key=lambda line: (line.transaction.date, line.pk))
+    customers = sorted({line.transaction.customer.display_name for line in lines})
+    subject = f"Inventory changes for {', '.join(customers)}"
+
+    body = []
+    current = None
+    for line in lines:
+        if line.transaction_id != current:
+            current = line.transaction_id
+            body.append(
+                f"\n{line.transaction.customer.display_name}, "
+                f"{timezone.localtime(line.transaction.date):%Y-%m-%d %H:%M}"
+            )
+        product = render_format_string(
+            line.product.template.format_string, line.product.attributes
+        )
+        body.append(
+            f"  {line.quantity:+} {product or line.product.template.name} at {line.location.name}"
+        )
+    return subject, "\n".join(body).strip() + "\n"
+
+
+def dispatch_batch(batch_size: int = 200, max_attempts: int = 5) -> DispatchResult:
+    """
+    Claims one batch of pending notifications and sends it as a digest per address, in a single send_messages call
+    over one SMTP connection.
+
+    Delivery is at least once: when sending fails, the whole batch is retried, so addresses that did receive their
+    digest may receive it again.
+    """
+    result = DispatchResult()
+    notifications = claim_notifications(batch_size, max_attempts)
+    if not notifications:
+        return result
+    result.notifications = len(notifications)
+
+    by_transaction = defaultdict(list)
+    whole_transactions = set()
+    single_lines = set()
+    for notification in notifications:
+        by_transaction[notification["transaction_id"]].append(notification["pk"])
+        if notification["line_id"] is None:
+            whole_transactions.add(notification["transaction_id"])
+        else:
+            single_lines.add(notification["line_id"])
+
+    recipients = resolve_recipients(list(whole_transactions), list(single_lines))
+    line_ids = {line_id for ids in recipients.values() for line_id in ids}
+    lines = InventoryChangeLine.objects.select_related(
+        "transaction__customer", "product__template", "location"
+    ).in_bulk(line_ids)
+
+    messages = []
+    for address, ids in recipients.items():
+        subject, body = render_digest([lines[line_id] for line_id in ids])
+        messages.append(
+            EmailMessage(subject, body, settings.DEFAULT_FROM_EMAIL, [address])
+        )
+
+    failed = set()
+    start = time.perf_counter()
+    if messages:
+        try:
+            with get_connection() as connection:
+                result.messages = connection.send_messages(messages) or 0
+        except Exception as e:
+            # The server couldn't be reached or refused a message, which of the others went out is unknown.
+            result.errors.append(str(e))
+            failed.update(by_transaction)
+    result.smtp_seconds = time.perf_counter() - start
+
+    now = timezone.now()
+    sent_ids = [
+        pk
+        for transaction_id, ids in by_transaction.items()
+        if transaction_id not in failed
+        for pk in ids
+    ]
+    failed_ids = [
+        pk for transaction_id in failed for pk in by_transaction[transaction_id]
+    ]
+    if sent_ids:
+        TransactionNotification.objects.filter(pk__in=sent_ids).update(
+            sent_at=now, claimed_by="", claimed_until=None
+        )
+    if failed_ids:
+        TransactionNotification.objects.filter(pk__in=failed_ids).update(
+            attempts=F("attempts") + 1,
+            last_error="\n".join(result.errors)[:2000],
+            claimed_by="",
+            claimed_until=None,
+        )
+
+    result.sent = len(sent_ids)
+    result.failed = len(failed_ids)
+    sent_created = [
+        notification["created_at"]
+        for notification in notifications
+        if notification["transaction_id"] not in failed
+    ]
+    if sent_created:
+        result.max_latency = (now - min(sent_created)).total_seconds()
+    return result
+
+
+def purge_sent(older_than: timedelta) -> int:
+    deleted, _ = TransactionNotification.objects.filter(
+        sent_at__lt=timezone.now() - older_than
+    ).delete()
+    return deleted
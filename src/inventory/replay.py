@@ -0,0 +1,469 @@
+import os
+import time
+from contextlib import nullcontext
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from decimal import Decimal
+from multiprocessing import get_context
+from typing import Callable
+
+from django.db import connections
+from django.db.models import Count, Q
+from django.db.transaction import atomic
+from django.utils import timezone
+
+from customers.models import Customer
+from inventory.ledger import MOVEMENT_COLUMNS
+from inventory.models import (
+    ArchivedChangeLine,
+    DailyMovement,
+    InventoryChangeLine,
+    StockBalance,
+)
+from products.models import ProductTemplate
+
+# Rows fetched per round trip while streaming a shard, through a server-side cursor where the database has them
+STREAM_CHUNK_SIZE = 5000
+
+# Shards planned per worker, so workers that finish early pick up more work instead of idling until the last one
+SHARDS_PER_WORKER = 4
+
+# Mismatches described for each shard, the rest are only counted
+MAX_DESCRIBED = 20
+
+SHARD_BY = ["customer", "template"]
+
+ZERO_BALANCE = (0, Decimal(0))
+ZERO_MOVEMENT = (0, 0, Decimal(0), Decimal(0))
+
+
+@dataclass
+class Shard:
+    """
+    A slice of the ledger whose derived rows no other shard touches: a customer's lines, a range of product templates'
+    lines, or both. Product ranges are cut at template boundaries, since daily movements are rolled up by template.
+    """
+
+    customer_id: int | None = None
+    first_template_id: int | None = None
+    last_template_id: int | None = None
+    # Lines planned for the shard, for progress and scheduling
+    lines: int = 0
+
+    def filter(self, customer_field: str, template_field: str) -> Q:
+        condition = Q()
+        if self.customer_id is not None:
+            condition &= Q(**{customer_field: self.customer_id})
+        if self.first_template_id is not None:
+            condition &= Q(
+                **{
+                    f"{template_field}__gte": self.first_template_id,
+                    f"{template_field}__lte": self.last_template_id,
+                }
+            )
+        return condition
+
+    def __str__(self) -> str:
+        parts = []
+        if self.customer_id is not None:
+            parts.append(f"customer {self.customer_id}")
+        if self.first_template_id is not None:
+            parts.append(f"templates {self.first_template_id}-{self.last_template_id}")
+        return ", ".join(parts) or "whole ledger"
+
+
+@dataclass
+class ShardResult:
+    shard: Shard
+    lines: int = 0
+    balances: int = 0
+    movements: int = 0
+    mismatches: int = 0
+    described: list[str] = field(default_factory=list)
+    rewritten: bool = False
+    seconds: float = 0.0
+
+
+@dataclass
+class ReplayResult:
+    shards: int = 0
+    lines: int = 0
+    balances: int = 0
+    movements: int = 0
+    mismatches: int = 0
+    rewritten: int = 0
+    described: list[str] = field(default_factory=list)
+    seconds: float = 0.0
+
+    def add(self, shard: ShardResult) -> None:
+        self.shards += 1
+        self.lines += shard.lines
+        self.balances += shard.balances
+        self.movements += shard.movements
+        self.mismatches += shard.mismatches
+        self.rewritten += shard.rewritten
+        self.described.extend(shard.described)
+
+    @property
+    def lines_per_second(self) -> float:
+        return self.lines / self.seconds if self.seconds else 0.0
+
+
+def line_counts(group_field: str, archive_group_field: str, **filters) -> dict:
+    """
+    Counts ledger and archived lines by a field with two grouped queries, to size shards.
+    """
+    counts = {}
+    ledger = InventoryChangeLine.objects.filter(
+        **{f"transaction__{name}": value for name, value in filters.items()}
+    )
+    archive = ArchivedChangeLine.objects.filter(**filters)
+    for lines, group in ((ledger, group_field), (archive, archive_group_field)):
+        rows = lines.order_by().values_list(group).annotate(count=Count("pk"))
+        for key, count in rows:
+            counts[key] = counts.get(key, 0) + count
+    return counts
+
+
+def plan_shards(
+    shard_by: str, workers: int, customer_id: int | None = None
+) -> list[Shard]:
+    """
+    Splits the ledger into shards, largest first so the longest ones don't start last. Every customer or template
+    gets a shard, even without lines, so derived rows left behind by deleted lines are found too.
+
+    Sharding by customer suits ledgers spread over many customers. Sharding by template splits the ledger into
+    contiguous template ranges of about equal size, so one customer holding most of the ledger is still processed
+    by every worker.
+    """
+    if shard_by == "customer":
+        customers = Customer.objects.order_by("pk")
+        if customer_id is not None:
+            customers = customers.filter(pk=customer_id)
+        counts = line_counts("transaction__customer_id", "customer_id")
+        shards = [
+            Shard(customer_id=pk, lines=counts.get(pk, 0))
+            for pk in customers.values_list("pk", flat=True)
+        ]
+    elif shard_by == "template":
+        filters = {} if customer_id is None else {"customer_id": customer_id}
+        counts = line_counts("product__template_id", "product__template_id", **filters)
+        target = max(1, sum(counts.values()) // (workers * SHARDS_PER_WORKER))
+
+        shards = []
+        shard = None
+        for pk in ProductTemplate.objects.order_by("pk").values_list("pk", flat=True):
+            if shard is None or shard.lines >= target:
+                shard = Shard(customer_id=customer_id, first_template_id=pk)
+                shards.append(shard)
+            shard.last_template_id = pk
+            shard.lines += counts.get(pk, 0)
+    else:
+        raise ValueError(f"Can't shard the ledger by {shard_by!r}.")
+    return sorted(shards, key=lambda shard: -shard.lines)
+
+
+def compare(
+    name: str, rebuilt: dict, stored: dict, zero: tuple, result: ShardResult
+) -> list[tuple]:
+    """
+    Counts the keys whose rebuilt and stored rows differ, describing the first MAX_DESCRIBED of each shard.
+
+    :return: The keys that differ.
+    """
+    differing = []
+    for key in sorted(rebuilt.keys() | stored.keys()):
+        ledger = rebuilt.get(key, zero)
+        current = stored.get(key, zero)
+        if ledger != current:
+            differing.append(key)
+            if len(result.described) < MAX_DESCRIBED:
+                result.described.append(
+                    f"{name} {key}: ledger={ledger} stored={current}"
+                )
+    result.mismatches += len(differing)
+    return differing
+
+
+def replay_lines(shard: Shard, result: ShardResult) -> tuple[dict, dict]:
+    """
+    Streams a shard's ledger and archived lines, counting them in the result.
+
+    :return: The shard's balances and its non-zero daily movements, as tuples of their quantity columns by key.
+    """
+    # [quantity_int, quantity_decimal] by (customer_id, product_id, location_id)
+    balances: dict[tuple, list] = {}
+    # [inbound_int, outbound_int, inbound_decimal, outbound_decimal] by (customer_id, template_id, location_id, day)
+    movements: dict[tuple, list] = {}
+    # Local day of each transaction date, transactions have many lines
+    days = {}
+
+    def add_movement(
+        customer_id, template_id, location_id, date, quantity_int, quantity_decimal
+    ):
+        day = days.get(date)
+        if day is None:
+            day = days[date] = timezone.localdate(date)
+        movement = movements.get((customer_id, template_id, location_id, day))
+        if movement is None:
+            movement = movements[(customer_id, template_id, location_id, day)] = [
+                0,
+                0,
+                Decimal(0),
+                Decimal(0),
+            ]
+        if quantity_int is not None:
+            if quantity_int >= 0:
+                movement[0] += quantity_int
+            else:
+                movement[1] -= quantity_int
+        if quantity_decimal is not None:
+            if quantity_decimal >= 0:
+                movement[2] += quantity_decimal
+            else:
+                movement[3] -= quantity_decimal
+
+    lines = InventoryChangeLine.objects.filter(
+        shard.filter("transaction__customer_id", "product__template_id")
+    ).values_list(
+        "transaction__customer_id",
+        "product_id",
+        "product__template_id",
+        "location_id",
+        "transaction__date",
+        "transaction__is_opening_balance",
+        "quantity_int",
+        "quantity_decimal",
+    )
+    for (
+        customer_id,
+        product_id,
+        template_id,
+        location_id,
+        date,
+        is_opening_balance,
+        quantity_int,
+        quantity_decimal,
+    ) in lines.iterator(chunk_size=STREAM_CHUNK_SIZE):
+        result.lines += 1
+        balance = balances.get((customer_id, product_id, location_id))
+        if balance is None:
+            balance = balances[(customer_id, product_id, location_id)] = [
+                0,
+                Decimal(0),
+            ]
+        if quantity_int is not None:
+            balance[0] += quantity_int
+        if quantity_decimal is not None:
+            balance[1] += quantity_decimal
+        # Opening balances carry archived stock forward, archived lines below hold the movements.
+        if not is_opening_balance:
+            add_movement(
+                customer_id,
+                template_id,
+                location_id,
+                date,
+                quantity_int,
+                quantity_decimal,
+            )
+
+    archived = ArchivedChangeLine.objects.filter(
+        shard.filter("customer_id", "product__template_id")
+    ).values_list(
+        "customer_id",
+        "product__template_id",
+        "location_id",
+        "date",
+        "quantity_int",
+        "quantity_decimal",
+    )
+    for row in archived.iterator(chunk_size=STREAM_CHUNK_SIZE):
+        result.lines += 1
+        add_movement(*row)
+
+    rebuilt_balances = {key: tuple(balance) for key, balance in balances.items()}
+    rebuilt_movements = {
+        key: tuple(movement)
+        for key, movement in movements.items()
+        if tuple(movement) != ZERO_MOVEMENT
+    }
+    return rebuilt_balances, rebuilt_movements
+
+
+def replay_shard(shard: Shard, rebuild: bool, batch_size: int) -> ShardResult:
+    """
+    Streams a shard's lines to recompute its balances and daily movements, then diffs them against the stored ones,
+    and swaps in the rebuilt rows when rebuilding and they differ. Runs in worker processes, so it only
+    takes and returns plain values.
+
+    A rebuild locks the shard's stored balances before reading its lines, and rewrites them in the same database
+    transaction, so lines posted to them meanwhile wait for the rewrite instead of being lost. On SQLite the
+    transaction holds the database write lock throughout.
+    """
+    started = time.monotonic()
+    result = ShardResult(shard)
+
+    with atomic() if rebuild else nullcontext():
+        if rebuild:
+            # In key order like lock_balances, so posting transactions can't deadlock with the rebuild.
+            list(
+                StockBalance.objects.select_for_update()
+                .filter(shard.filter("customer_id", "product__template_id"))
+                .order_by("customer_id", "product_id", "location_id")
+                .values_list("pk", flat=True)
+            )
+        rebuilt_balances, rebuilt_movements = replay_lines(shard, result)
+        result.balances = len(rebuilt_balances)
+        result.movements = len(rebuilt_movements)
+
+        with atomic():
+            stored_balances = StockBalance.objects.filter(
+                shard.filter("customer_id", "product__template_id")
+            )
+            stored_movements = DailyMovement.objects.filter(
+                shard.filter("customer_id", "template_id")
+            )
+            differing_balances = compare(
+                "balance",
+                rebuilt_balances,
+                {
+                    row[:3]: row[3:]
+                    for row in stored_balances.values_list(
+                        "customer_id",
+                        "product_id",
+                        "location_id",
+                        "quantity_int",
+                        "quantity_decimal",
+                    ).iterator(chunk_size=STREAM_CHUNK_SIZE)
+                },
+                ZERO_BALANCE,
+                result,
+            )
+            differing_movements = compare(
+                "movement",
+                rebuilt_movements,
+                {
+                    row[:4]: row[4:]
+                    for row in stored_movements.values_list(
+                        "customer_id",
+                        "template_id",
+                        "location_id",
+                        "day",
+                        *MOVEMENT_COLUMNS,
+                    ).iterator(chunk_size=STREAM_CHUNK_SIZE)
+                },
+                ZERO_MOVEMENT,
+                result,
+            )
+
+            if rebuild and differing_balances:
+                stored_balances.delete()
+                StockBalance.objects.bulk_create(
+                    (
+                        StockBalance(
+                            customer_id=customer_id,
+                            product_id=product_id,
+                            location_id=location_id,
+                            quantity_int=quantity_int,
+                            quantity_decimal=quantity_decimal,
+                        )
+                        for (customer_id, product_id, location_id), (
+                            quantity_int,
+                            quantity_decimal,
+                        ) in rebuilt_balances.items()
+                    ),
+                    batch_size=batch_size,
+                )
+                Customer.objects.bump_stock_version(
+                    {customer_id for customer_id, _, _ in differing_balances}
+                )
+                result.rewritten = True
+            if rebuild and differing_movements:
+                stored_movements.delete()
+                DailyMovement.objects.bulk_create(
+                    (
+                        DailyMovement(
+                            customer_id=customer_id,
+                            template_id=template_id,
+                            location_id=location_id,
+                            day=day,
+                            **dict(zip(MOVEMENT_COLUMNS, movement)),
+                        )
+                        for (
+                            customer_id,
+                            template_id,
+                            location_id,
+                            day,
+                        ), movement in rebuilt_movements.items()
+                    ),
+                    batch_size=batch_size,
+                )
+                result.rewritten = True
+
+    result.seconds = time.monotonic() - started
+    return result
+
+
+def close_connections() -> None:
+    # Worker processes must open their own database connections, never share their parent's.
+    connections.close_all()
+
+
+def replay_ledger(
+    shard_by: str = "customer",
+    customer_id: int | None = None,
+    rebuild: bool = False,
+    workers: int | None = None,
+    batch_size: int = 1000,
+    progress: Callable | None = None,
+) -> ReplayResult:
+    """
+    Replays the ledger shard by shard in parallel worker processes, diffing the balances and daily movements derived
+    from it against the stored ones, and with rebuild swapping in the rebuilt rows of every shard that differs. By
+    default, one worker runs on every core.
+
+    Every shard is rebuilt in its own database transaction, holding the locks described in replay_shard.
+
+    :param progress: Called as shards finish, with the lines replayed, the lines planned and a message, compatible
+        with JobContext.progress.
+    """
+    workers = workers or os.cpu_count() or 1
+    started = time.monotonic()
+    shards = plan_shards(shard_by, workers, customer_id)
+    total = sum(shard.lines for shard in shards)
+    result = ReplayResult()
+
+    def finished(shard_result: ShardResult) -> None:
+        result.add(shard_result)
+        result.seconds = time.monotonic() - started
+        if progress is not None:
+            progress(
+                result.lines,
+                total,
+                f"{result.shards}/{len(shards)} shards, {result.lines_per_second:,.0f} lines/s, last "
+                f"{shard_result.shard}: {shard_result.lines:,} lines in {shard_result.seconds:.1f}s",
+            )
+
+    if workers == 1:
+        for shard in shards:
+            finished(replay_shard(shard, rebuild, batch_size))
+        return result
+
+    close_connections()
+    pool = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=get_context("fork"),
+        initializer=close_connections,
+    )
+    try:
+        pending = {
+            pool.submit(replay_shard, shard, rebuild, batch_size) for shard in shards
+        }
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                finished(future.result())
+    finally:
+        # Shards not started yet are dropped when a shard fails or progress reporting raises, ex: JobCancelled.
+        pool.shutdown(wait=True, cancel_futures=True)
+    return result
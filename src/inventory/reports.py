@@ -0,0 +1,99 @@
+from datetime import date
+
+from django.db.models import Q, Sum
+
+from inventory.ledger import MOVEMENT_COLUMNS
+from inventory.models import DailyMovement, StockBalance
+
+# Fields stock and movement reports can group by, by name
+STOCK_GROUPS = {
+    "customer": ("customer_id", "customer__display_name"),
+    "template": ("product__template_id", "product__template__name"),
+    "location": ("location_id", "location__name"),
+}
+MOVEMENT_GROUPS = {
+    "customer": ("customer_id", "customer__display_name"),
+    "template": ("template_id", "template__name"),
+    "location": ("location_id", "location__name"),
+    "day": ("day",),
+}
+
+
+def group_fields(groups: dict, group_by: list[str]) -> list[str]:
+    """
+    :raises ValueError: If a name isn't a group of the report.
+    """
+    fields = []
+    for name in group_by:
+        if name not in groups:
+            raise ValueError(
+                f"Can't group by {name!r}, choose from {', '.join(groups)}."
+            )
+        fields.extend(groups[name])
+    return fields
+
+
+def stock_totals(
+    group_by: list[str],
+    customer_id: int | None = None,
+    template_id: int | None = None,
+    location_id: int | None = None,
+) -> list[dict]:
+    """
+    Totals current stock by customer, template and/or location, from the stock balances. Discrete and continuous
+    quantities are totalled separately, as total_int and total_decimal.
+
+    :raises ValueError: If a name isn't a group of the report.
+    """
+    fields = group_fields(STOCK_GROUPS, group_by)
+    balances = StockBalance.objects.all()
+    if customer_id is not None:
+        balances = balances.filter(customer_id=customer_id)
+    if template_id is not None:
+        balances = balances.filter(product__template_id=template_id)
+    if location_id is not None:
+        balances = balances.filter(location_id=location_id)
+    totals = {
+        "total_int": Sum("quantity_int"),
+        "total_decimal": Sum("quantity_decimal"),
+    }
+    if not fields:
+        return [balances.aggregate(**totals)]
+    return list(
+        balances.values(*fields)
+        .annotate(**totals)
+        .exclude(Q(total_int=0) & Q(total_decimal=0))
+        .order_by(*fields)
+    )
+
+
+def movement_totals(
+    group_by: list[str],
+    start: date | None = None,
+    end: date | None = None,
+    customer_id: int | None = None,
+    template_id: int | None = None,
+    location_id: int | None = None,
+) -> list[dict]:
+    """
+    Totals inbound and outbound volume between the start and end days, inclusive, from the daily rollups. Group by
+    "day" for a daily series. Discrete and continuous quantities are totalled separately.
+
+    :raises ValueError: If a name isn't a group of the report.
+    """
+    fields = group_fields(MOVEMENT_GROUPS, group_by)
+    movements = DailyMovement.objects.all()
+    if start is not None:
+        movements = movements.filter(day__gte=start)
+    if end is not None:
+        movements = movements.filter(day__lte=end)
+    if customer_id is not None:
+        movements = movements.filter(customer_id=customer_id)
+    if template_id is not None:
+        movements = movements.filter(template_id=template_id)
+    if location_id is not None:
+        movements = movements.filter(location_id=location_id)
+    totals = {f"total_{column}": Sum(column) for column in MOVEMENT_COLUMNS}
+    if not fields:
+        return [movements.aggregate(**totals)]
+    return list(movements.values(*fields).annotate(**totals).order_by(*fields))
@@ -0,0 +1,290 @@
+import random
+import time
+from datetime import datetime
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+from typing import Callable, TypeVar
+
+from django.core.exceptions import ValidationError
+from django.db import OperationalError, connection
+from django.db.models import Q
+from django.db.transaction import atomic
+from django.utils import timezone
+
+from inventory.ledger import BalanceKey, LedgerChanges
+from inventory.models import (
+    InventoryChangeFieldValue,
+    InventoryChangeLine,
+    InventoryChangeTemplate,
+    InventoryTransaction,
+    StockBalance,
+    StorageLocation,
+)
+from inventory.validation import LineValidator
+from products.models import Product, ProductTemplate
+
+T = TypeVar("T")
+
+# Postgres serialization failure and deadlock
+RETRYABLE_SQLSTATES = {"40001", "40P01"}
+
+# Seconds, doubled on every retry and jittered so retrying writers spread out
+RETRY_BACKOFF = 0.01
+
+
+class InsufficientStock(ValidationError):
+    """
+    Raised when a transaction would take a balance below zero.
+
+    shortages holds a (balance key, available, requested) tuple for each balance.
+    """
+
+    def __init__(
+        self, shortages: list[tuple[BalanceKey, int | Decimal, int | Decimal]]
+    ):
+        self.shortages = shortages
+        super().__init__(
+            [
+                f"Only {available} of product {product_id} at location {location_id} available, "
+                f"{requested} requested."
+                for (_, product_id, location_id), available, requested in shortages
+            ]
+        )
+
+
+def is_retryable(error: OperationalError) -> bool:
+    if getattr(error.__cause__, "sqlstate", None) in RETRYABLE_SQLSTATES:
+        return True
+    # SQLite gave up waiting for another writer.
+    return "database is locked" in str(error)
+
+
+def retry_on_conflict(function: Callable[[], T], retries: int = 5) -> T:
+    """
+    Calls function, calling it again after a backoff when the database aborts it for conflicting with a concurrent
+    transaction. Inside an outer transaction the conflict can't be retried, so it's raised.
+    """
+    if connection.in_atomic_block:
+        return function()
+    for attempt in range(retries + 1):
+        try:
+            return function()
+        except OperationalError as e:
+            if attempt == retries or not is_retryable(e):
+                raise
+            time.sleep(random.uniform(0, RETRY_BACKOFF * 2**attempt))
+
+
+def lock_balances(keys: list[BalanceKey]) -> dict[BalanceKey, tuple[int, Decimal]]:
+    """
+    Locks the balance rows of the keys until the end of the transaction, always in key order so concurrent
+    transactions can't deadlock on them. Balances that don't exist yet aren't locked and read as zero.
+
+    :return: The locked quantities by key.
+    """
+    if not keys:
+        return {}
+    condition = reduce(
+        or_,
+        (
+            Q(customer_id=customer_id, product_id=product_id, location_id=location_id)
+            for customer_id, product_id, location_id in keys
+        ),
+    )
+    rows = (
+        StockBalance.objects.select_for_update()
+        .filter(condition)
+        .order_by("customer_id", "product_id", "location_id")
+        .values_list(
+            "customer_id",
+            "product_id",
+            "location_id",
+            "quantity_int",
+            "quantity_decimal",
+        )
+    )
+    return {row[:3]: row[3:] for row in rows}
+
+
+def post_transaction(
+    customer,
+    lines: list[InventoryChangeLine],
+    date: datetime | None = None,
+    retries: int = 5,
+) -> InventoryTransaction:
+    """
+    Records a transaction of unsaved lines, rejecting it whole if any balance would go below zero. The balances it
+    touches are locked while they're checked and updated, so concurrent withdrawals of the same stock can't both
+    succeed. Retried when it conflicts with a concurrent transaction.
+
+    :raises ValidationError: If a line's quantity doesn't suit its product's counting type.
+    :raises InsufficientStock: If the transaction would take a balance below zero.
+    """
+    products = Product.objects.select_related("template").in_bulk(
+        {line.product_id for line in lines}
+    )
+    for line in lines:
+        line.product = products[line.product_id]
+        line.clean()
+    return retry_on_conflict(
+        lambda: record_transaction(customer, date or timezone.now(), lines), retries
+    )
+
+
+def record_transaction(
+    customer,
+    date: datetime,
+    lines: list[InventoryChangeLine],
+    values: list[list[dict]] | None = None,
+    check_stock: bool = True,
+) -> InventoryTransaction:
+    """
+    Inserts a transaction of validated, unsaved lines and their field values with bulk_create, then updates the
+    ledger. values holds the InventoryChangeFieldValue keyword arguments of each line's values, in line order, see
+    LineValidator.parse_values.
+
+    :raises InsufficientStock: If check_stock is set and the transaction would take a balance below zero.
+    """
+    with atomic():
+        if check_stock:
+            deltas = {}
+            for line in lines:
+                key = (customer.pk, line.product_id, line.location_id)
+                delta = deltas.setdefault(key, [0, Decimal(0)])
+                delta[0] += line.quantity_int or 0
+                delta[1] += line.quantity_decimal or 0
+
+            balances = lock_balances(sorted(deltas))
+            shortages = []
+            for key, (quantity_int, quantity_decimal) in sorted(deltas.items()):
+                available_int, available_decimal = balances.get(key, (0, Decimal(0)))
+                if quantity_int < 0 and available_int + quantity_int < 0:
+                    shortages.append((key, available_int, -quantity_int))
+                if quantity_decimal < 0 and available_decimal + quantity_decimal < 0:
+                    shortages.append((key, available_decimal, -quantity_decimal))
+            if shortages:
+                raise InsufficientStock(shortages)
+
+        transaction = InventoryTransaction.objects.create(customer=customer, date=date)
+        # Fresh copies, so a retried attempt doesn't reuse primary keys from a rolled back one.
+        saved = [
+            InventoryChangeLine(
+                transaction=transaction,
+                product=line.product,
+                location_id=line.location_id,
+                quantity_int=line.quantity_int,
+                quantity_decimal=line.quantity_decimal,
+            )
+            for line in lines
+        ]
+        InventoryChangeLine.objects.bulk_create(saved)
+
+        InventoryChangeFieldValue.objects.bulk_create(
+            InventoryChangeFieldValue(line=line, **value)
+            for line, line_values in zip(saved, values or [])
+            for value in line_values
+        )
+
+        LedgerChanges().add(saved).apply()
+        return transaction
+
+
+def create_transaction(
+    customer,
+    date: datetime,
+    lines: list[dict],
+    change_template: InventoryChangeTemplate | None = None,
+    check_stock: bool = True,
+    retries: int = 5,
+) -> InventoryTransaction:
+    """
+    Validates and records a transaction of many lines in a constant number of queries. Each line is a dict of
+    product, location, quantity and, with a change template, the values of its fields by name:
+
+        {"product": 1, "location": 1, "quantity": 5, "values": {"reference": "PO-12"}}
+
+    Products and locations are loaded in one query each, fields come from the template schema cache, and every line
+    is validated in memory by a LineValidator, so all the errors of the transaction are reported together. Nothing is
+    written unless every line is valid.
+
+    :raises ValidationError: With every error found, if any line is invalid.
+    :raises InsufficientStock: If check_stock is set and the transaction would take a balance below zero.
+    """
+    products = Product.objects.select_related("template").in_bulk(
+        {getattr(line.get("product"), "pk", line.get("product")) for line in lines}
+        - {None}
+    )
+    location_ids = set(
+        StorageLocation.objects.filter(
+            pk__in={
+                getattr(line.get("location"), "pk", line.get("location"))
+                for line in lines
+            }
+            - {None}
+        ).values_list("pk", flat=True)
+    )
+    validator = LineValidator(change_template)
+
+    errors = []
+    instances = []
+    values = []
+    for number, line in enumerate(lines, start=1):
+        line_errors = []
+        product_id = getattr(line.get("product"), "pk", line.get("product"))
+        location_id = getattr(line.get("location"), "pk", line.get("location"))
+        product = products.get(product_id)
+        if product is None:
+            line_errors.append(f"Product {product_id} does not exist.")
+        else:
+            line_errors += validator.check_product_template(
+                product.template_id, product.template.name
+            )
+        if location_id not in location_ids:
+            line_errors.append(f"Storage location {location_id} does not exist.")
+
+        instance = InventoryChangeLine(product=product, location_id=location_id)
+        if product is not None:
+            instance.quantity_int, instance.quantity_decimal, quantity_errors = (
+                validator.parse_quantity(
+                    product.template.counting_type, line.get("quantity", "")
+                )
+            )
+            line_errors += quantity_errors
+
+        line_values, value_errors = validator.parse_values(line.get("values"))
+        line_errors += value_errors
+
+        errors.extend(f"Line {number}: {message}" for message in line_errors)
+        instances.append(instance)
+        values.append(line_values)
+
+    if not lines:
+        errors.append("A transaction requires at least one line.")
+    if errors:
+        raise ValidationError(errors)
+
+    return retry_on_conflict(
+        lambda: record_transaction(customer, date, instances, values, check_stock),
+        retries,
+    )
+
+
+def withdraw(
+    customer,
+    product: Product,
+    location_id: int,
+    quantity: int | Decimal,
+    date: datetime | None = None,
+) -> InventoryTransaction:
+    """
+    Takes a quantity of a product out of a customer's stock at a location.
+
+    :raises InsufficientStock: If the customer holds less than the quantity there.
+    """
+    line = InventoryChangeLine(product=product, location_id=location_id)
+    if product.template.counting_type == ProductTemplate.DISCRETE:
+        line.quantity_int = -quantity
+    else:
+        line.quantity_decimal = -Decimal(quantity)
+    return post_transaction(customer, [line], date)
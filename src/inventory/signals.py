@@ -0,0 +1,37 @@
+from django.db.models.signals import post_delete, pre_save
+from django.dispatch import receiver
+
+from inventory.ledger import LedgerChanges, move_product_template
+from inventory.models import InventoryChangeLine, InventoryChangeTemplateField
+from products.models import Product
+
+
+@receiver(post_delete, sender=InventoryChangeLine)
+def remove_line_from_balances(sender, instance, **kwargs) -> None:
+    """
+    Removes a deleted line from the state derived from the ledger. Handles cascaded deletes from InventoryTransaction,
+    which don't call InventoryChangeLine.delete().
+    """
+    LedgerChanges().remove([instance]).apply()
+
+
+@receiver(post_delete, sender=InventoryChangeTemplateField)
+def invalidate_inventory_change_schema(sender, instance, **kwargs) -> None:
+    instance.invalidate_schema()
+
+
+@receiver(pre_save, sender=Product)
+def move_product_movements(sender, instance, raw=False, **kwargs) -> None:
+    """
+    Daily movements are rolled up by template, so a product changing template takes its movements along, in the
+    transaction saving it.
+    """
+    if raw or instance.pk is None:
+        return
+    previous = (
+        Product.objects.filter(pk=instance.pk)
+        .values_list("template_id", flat=True)
+        .first()
+    )
+    if previous is not None and previous != instance.template_id:
+        move_product_template(instance.pk, previous, instance.template_id)
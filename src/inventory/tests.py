@@ -1,3 +1,856 @@
-from django.test import TestCase
+import csv
+import json
+import random
+import time
+from contextvars import Context
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.mail.backends import smtp
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db.models import Q, Sum
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from customers.models import Customer, Email, NotificationGroup
+from inventory.archive import archive_customer
+from inventory.importers import import_transactions
+from inventory.management.commands.generate_demo_data import Holdings
+from inventory.notifications import dispatch_batch, outbox_stats
+from inventory.replay import (
+    SHARD_BY,
+    ZERO_BALANCE,
+    Shard,
+    ShardResult,
+    compare,
+    plan_shards,
+    replay_ledger,
+)
+from inventory.services import (
+    InsufficientStock,
+    create_transaction,
+    post_transaction,
+    withdraw,
+)
+from inventory.models import (
+    ArchivedChangeLine,
+    DailyMovement,
+    InventoryChangeFieldValue,
+    InventoryChangeTemplate,
+    InventoryChangeTemplateField,
+    InventoryChangeLine,
+    InventoryTransaction,
+    StockBalance,
+    StorageLocation,
+    TransactionNotification,
+)
+from products.models import Product, ProductTemplate
+from utils.db_routing import PIN_SESSION_KEY
+from utils.model_commons import BaseTemplateField
+
+
+def make_customer(name: str = "Acme") -> Customer:
+    user = get_user_model().objects.create_user(username=name.lower())
+    return Customer.objects.create(user=user, display_name=name)
+
+
+def make_product(counting_type: str = ProductTemplate.DISCRETE) -> Product:
+    template = ProductTemplate.objects.create(
+        name=f"Pipe ({counting_type})",
+        format_string="{{OD}}",
+        counting_type=counting_type,
+    )
+    return Product.objects.create(template=template)
+
+
+def post_lines(customer, product, location, *quantities, date=None) -> None:
+    """
+    Posts a transaction with a line for each quantity, through the models so derived state is maintained.
+    """
+    transaction = InventoryTransaction.objects.create(
+        customer=customer, date=date or timezone.now()
+    )
+    continuous = product.template.counting_type == ProductTemplate.CONTINUOUS
+    for quantity in quantities:
+        InventoryChangeLine.objects.create(
+            transaction=transaction,
+            product=product,
+            location=location,
+            quantity_int=None if continuous else quantity,
+            quantity_decimal=Decimal(quantity) if continuous else None,
+        )
+
+
+class RebuildStockBalancesTests(TestCase):
+    # SQLite sums these as floats, to -545.829999999999
+    QUANTITIES = [
+        "-882.09",
+        "-854.93",
+        "566.34",
+        "-938.97",
+        "972.44",
+        "-432.31",
+        "791.22",
+        "-909.01",
+        "296.19",
+        "845.29",
+    ]
+
+    def setUp(self):
+        self.customer = make_customer()
+        self.product = make_product(ProductTemplate.CONTINUOUS)
+        self.location = StorageLocation.objects.create(name="Rack 1")
+        post_lines(self.customer, self.product, self.location, *self.QUANTITIES)
+
+    def test_verify_ignores_float_sums(self):
+        stdout = StringIO()
+        call_command("rebuild_stock_balances", verify=True, stdout=stdout)
+        self.assertIn("Verified 1 stock balances.", stdout.getvalue())
+
+    def test_rebuild_writes_exact_sums(self):
+        call_command("rebuild_stock_balances", stdout=StringIO())
+        balance = StockBalance.objects.get(customer=self.customer)
+        self.assertEqual(balance.quantity_decimal, Decimal("-545.83"))
+        self.assertEqual(
+            StockBalance.objects.filter(quantity_decimal=Decimal("-545.83")).count(), 1
+        )
+
+
+class ImportTransactionsTests(TestCase):
+    def setUp(self):
+        self.customer = make_customer()
+        self.product = make_product()
+        self.continuous = make_product(ProductTemplate.CONTINUOUS)
+        self.location = StorageLocation.objects.create(name="Rack 1")
+
+    def csv(self, *rows: str) -> StringIO:
+        return StringIO(
+            "transaction,customer,date,product,location,quantity\n" + "\n".join(rows)
+        )
+
+    def assertImportErrors(self, stream, file_format: str, *messages: str):
+        with self.assertRaises(ValidationError) as raised:
+            import_transactions(stream, file_format)
+        self.assertEqual(raised.exception.messages, list(messages))
+        self.assertFalse(InventoryTransaction.objects.exists())
+
+    def test_imports_csv(self):
+        c, p, l = self.customer.pk, self.product.pk, self.location.pk
+        result = import_transactions(
+            self.csv(f"1,{c},2025-01-01,{p},{l},5", f"1,{c},2025-01-01,{p},{l},3"),
+            "csv",
+        )
+        self.assertEqual((result.transactions, result.lines), (1, 2))
+        self.assertEqual(
+            StockBalance.objects.get_quantity(
+                self.customer, self.product, self.location
+            ),
+            8,
+        )
+
+    def test_missing_csv_columns(self):
+        self.assertImportErrors(
+            StringIO("transaction,customer,date,product\n1,1,2025-01-01,1\n"),
+            "csv",
+            "Row 1: Missing columns: location, quantity.",
+        )
+
+    def test_invalid_json_lines(self):
+        c, p, l = self.customer.pk, self.product.pk, self.location.pk
+        valid = (
+            f'{{"customer": {c}, "date": "2025-01-01", '
+            f'"lines": [{{"product": {p}, "location": {l}, "quantity": 1}}]}}'
+        )
+        self.assertImportErrors(
+            StringIO(f"{valid}\n{{not json\n[1, 2]\n" '{"lines": 5}\n'),
+            "jsonl",
+            "Row 2: Invalid JSON: Expecting property name enclosed in double quotes: line 1 column 2 (char 1).",
+            "Row 3: A transaction must be a JSON object.",
+            'Row 4: "lines" must be a list of objects.',
+        )
+
+    def test_non_finite_quantities(self):
+        c, l = self.customer.pk, self.location.pk
+        self.assertImportErrors(
+            self.csv(
+                f"1,{c},2025-01-01,{self.continuous.pk},{l},NaN",
+                f"2,{c},2025-01-01,{self.continuous.pk},{l},-Infinity",
+                f"3,{c},2025-01-01,{self.product.pk},{l},1.5",
+            ),
+            "csv",
+            "Row 2: Continuous products require a decimal quantity, got 'NaN'.",
+            "Row 3: Continuous products require a decimal quantity, got '-Infinity'.",
+            "Row 4: Discrete products require a whole quantity, got '1.5'.",
+        )
+
+    def test_unknown_references(self):
+        self.assertImportErrors(
+            self.csv(
+                f"1,999,2025-01-01,{self.product.pk},{self.location.pk},1",
+                f"2,{self.customer.pk},yesterday,{self.product.pk},{self.location.pk},1",
+                f"3,{self.customer.pk},2025-01-01,999,{self.location.pk},1",
+                f"4,{self.customer.pk},2025-01-01,{self.product.pk},,1",
+            ),
+            "csv",
+            "Row 2: Customer 999 does not exist.",
+            "Row 3: 'yesterday' is not a date.",
+            "Row 4: Product 999 does not exist.",
+            "Row 5: Product and location must be ids.",
+        )
+
+    def test_upload_errors_are_form_errors(self):
+        url = reverse("inventory:transaction_import")
+        uploads = {
+            "undecodable": (
+                b"transaction,customer,date,product,location,quantity\n\xff\xfe\n",
+                "csv",
+                "Row 2: The file is not valid UTF-8 text.",
+            ),
+            "invalid json": (b"{", "jsonl", "Row 1: Invalid JSON"),
+            "byte order mark": (
+                "\ufefftransaction,customer,date,product\n".encode(),
+                "csv",
+                "Row 1: Missing columns: location, quantity.",
+            ),
+        }
+        for name, (content, file_format, message) in uploads.items():
+            with self.subTest(name):
+                response = self.client.post(
+                    url,
+                    {
+                        "file": SimpleUploadedFile(f"import.{file_format}", content),
+                        "file_format": file_format,
+                    },
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertIn(
+                    message, " ".join(response.context["form"].errors["file"])
+                )
+
+
+class GenerateDemoDataTests(TestCase):
+    def test_balances_never_go_negative(self):
+        call_command(
+            "generate_demo_data",
+            templates=5,
+            products=40,
+            customers=3,
+            locations=3,
+            lines=2000,
+            products_per_customer=4,
+            stdout=StringIO(),
+        )
+        self.assertEqual(InventoryChangeLine.objects.count(), 2000)
+        self.assertTrue(
+            InventoryChangeLine.objects.filter(
+                Q(quantity_int__lt=0) | Q(quantity_decimal__lt=0)
+            ).exists()
+        )
+        self.assertFalse(
+            StockBalance.objects.filter(
+                Q(quantity_int__lt=0) | Q(quantity_decimal__lt=0)
+            ).exists()
+        )
+        # Each line is counted the way its product is, and moves something.
+        self.assertFalse(
+            InventoryChangeLine.objects.filter(
+                Q(quantity_int=0)
+                | Q(quantity_decimal=0)
+                | Q(
+                    product__template__counting_type=ProductTemplate.DISCRETE,
+                    quantity_int=None,
+                )
+                | Q(
+                    product__template__counting_type=ProductTemplate.CONTINUOUS,
+                    quantity_decimal=None,
+                )
+            ).exists()
+        )
+
+
+class HoldingsTests(TestCase):
+    def test_withdraw_up_to_what_is_held(self):
+        held = Holdings()
+        for key in "abc":
+            held.add(key, 5)
+        self.assertEqual(held.withdraw("a", 3), 3)
+        self.assertEqual(held.withdraw("a", 3), 2)
+        self.assertEqual(held.withdraw("c", Decimal("9.5")), 5)
+        self.assertEqual(held.keys, ["b"])
+        self.assertEqual(held.positions, {"b": 0})
+        self.assertEqual(held.pick(random.Random(0)), "b")
+        held.withdraw("b", 5)
+        self.assertIsNone(held.pick(random.Random(0)))
+
+
+class RefusingBackend(BaseEmailBackend):
+    """
+    Stands in for an SMTP server that rejects every message.
+    """
+
+    def send_messages(self, email_messages):
+        raise ConnectionRefusedError("Connection refused")
+
+
+class DispatchNotificationsTests(TestCase):
+    def setUp(self):
+        self.customer = make_customer()
+        self.product = make_product()
+        self.location = StorageLocation.objects.create(name="Rack 1")
+        for name, addresses in [
+            ("Yard", ["yard@example.com", "Shared@example.com"]),
+            ("Office", ["shared@example.com"]),
+        ]:
+            group = NotificationGroup.objects.create(customer=self.customer, name=name)
+            group.templates.add(self.product.template)
+            for address in addresses:
+                Email.objects.create(group=group, address=address)
+
+    def test_sends_digest_per_address(self):
+        post_lines(self.customer, self.product, self.location, 5, 3)
+        post_lines(self.customer, self.product, self.location, -2)
+
+        result = dispatch_batch()
+
+        self.assertEqual((result.notifications, result.sent, result.failed), (2, 2, 0))
+        self.assertEqual(
+            sorted(message.to[0] for message in mail.outbox),
+            ["shared@example.com", "yard@example.com"],
+        )
+        self.assertEqual(mail.outbox[0].body.count("at Rack 1"), 3)
+        self.assertFalse(
+            TransactionNotification.objects.filter(sent_at__isnull=True).exists()
+        )
+        self.assertEqual(dispatch_batch().notifications, 0)
+
+    def test_skips_claimed_notifications(self):
+        post_lines(self.customer, self.product, self.location, 5)
+        post_lines(self.customer, self.product, self.location, 1)
+        claimed, expired = TransactionNotification.objects.order_by("pk")
+        TransactionNotification.objects.filter(pk=claimed.pk).update(
+            claimed_by="other", claimed_until=timezone.now() + timedelta(minutes=5)
+        )
+        TransactionNotification.objects.filter(pk=expired.pk).update(
+            claimed_by="dead", claimed_until=timezone.now() - timedelta(minutes=5)
+        )
+
+        result = dispatch_batch()
+
+        self.assertEqual((result.notifications, result.sent), (1, 1))
+        claimed.refresh_from_db()
+        expired.refresh_from_db()
+        self.assertIsNone(claimed.sent_at)
+        self.assertIsNotNone(expired.sent_at)
+        self.assertEqual(expired.claimed_by, "")
+
+    @override_settings(EMAIL_BACKEND="inventory.tests.RefusingBackend")
+    def test_failed_sends_are_retried(self):
+        post_lines(self.customer, self.product, self.location, 5)
+
+        for attempt in range(1, 3):
+            result = dispatch_batch(max_attempts=2)
+            self.assertEqual((result.sent, result.failed), (0, 1))
+            notification = TransactionNotification.objects.get()
+            self.assertEqual(notification.attempts, attempt)
+            self.assertIn("Connection refused", notification.last_error)
+            self.assertIsNone(notification.claimed_until)
+
+        self.assertEqual(dispatch_batch(max_attempts=2).notifications, 0)
+        self.assertEqual(outbox_stats(max_attempts=2)["dead"], 1)
+
+    def test_lines_added_after_sending_are_notified(self):
+        post_lines(self.customer, self.product, self.location, 5)
+        transaction = InventoryTransaction.objects.get()
+        # Covered by the transaction's pending notification
+        InventoryChangeLine.objects.create(
+            transaction=transaction,
+            product=self.product,
+            location=self.location,
+            quantity_int=3,
+        )
+        self.assertEqual(TransactionNotification.objects.count(), 1)
+        dispatch_batch()
+        self.assertEqual(mail.outbox[0].body.count("at Rack 1"), 2)
+
+        mail.outbox = []
+        InventoryChangeLine.objects.create(
+            transaction=transaction,
+            product=self.product,
+            location=self.location,
+            quantity_int=7,
+        )
+        result = dispatch_batch()
+
+        self.assertEqual((result.notifications, result.sent), (1, 1))
+        self.assertEqual(len(mail.outbox), 2)
+        for message in mail.outbox:
+            self.assertEqual(message.body.count("at Rack 1"), 1)
+            self.assertIn("+7 ", message.body)
+
+    @override_settings(EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend")
+    def test_one_smtp_connection_per_batch(self):
+        for quantity in range(1, 4):
+            post_lines(self.customer, self.product, self.location, quantity)
+        opened, batches = [], []
+
+        def open_connection(backend):
+            # True only when a new connection is made, see EmailBackend.open()
+            opened.append(smtp_open(backend))
+            return opened[-1]
+
+        def send_messages(backend, messages):
+            batches.append(len(messages))
+            return smtp_send_messages(backend, messages)
+
+        smtp_open, smtp_send_messages = (
+            smtp.EmailBackend.open,
+            smtp.EmailBackend.send_messages,
+        )
+        with (
+            mock.patch("smtplib.SMTP") as server,
+            mock.patch.object(smtp.EmailBackend, "open", open_connection),
+            mock.patch.object(smtp.EmailBackend, "send_messages", send_messages),
+        ):
+            server.return_value.sendmail.return_value = {}
+            self.assertEqual(dispatch_batch(batch_size=2).messages, 2)
+            self.assertEqual(dispatch_batch(batch_size=2).messages, 2)
+
+        self.assertEqual(opened.count(True), 2)
+        self.assertEqual(server.call_count, 2)
+        self.assertEqual(batches, [2, 2])
+        self.assertEqual(server.return_value.sendmail.call_count, 4)
+        self.assertEqual(server.return_value.quit.call_count, 2)
+        self.assertFalse(
+            TransactionNotification.objects.filter(sent_at__isnull=True).exists()
+        )
+
+
+class ConcurrentWithdrawTests(TransactionTestCase):
+    def setUp(self):
+        self.customer = make_customer()
+        self.product = make_product()
+        self.location = StorageLocation.objects.create(name="Rack 1")
+        post_transaction(
+            self.customer,
+            [
+                InventoryChangeLine(
+                    product=self.product, location=self.location, quantity_int=10
+                )
+            ],
+        )
+
+    def test_stock_never_goes_negative(self):
+        start = threading.Barrier(8)
+
+        def take_two() -> bool:
+            start.wait()
+            try:
+                withdraw(self.customer, self.product, self.location.pk, 2)
+                return True
+            except InsufficientStock:
+                return False
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(lambda _: take_two(), range(8)))
+
+        self.assertEqual(results.count(True), 5)
+        self.assertEqual(
+            StockBalance.objects.get_quantity(
+                self.customer, self.product, self.location
+            ),
+            0,
+        )
+        self.assertEqual(
+            InventoryChangeLine.objects.filter(quantity_int__lt=0).count(), 5
+        )
+
+
+@override_settings(REPLICA_READS=True)
+class ReplicaRoutingTests(TransactionTestCase):
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        self.customer = make_customer()
+        self.product = make_product()
+        self.location = StorageLocation.objects.create(name="Rack 1")
+        post_lines(self.customer, self.product, self.location, 10)
+        call_command("simulate_replication", once=True, stdout=StringIO())
+        # Not replicated yet
+        post_lines(self.customer, self.product, self.location, 5)
+
+    def export_stock(self) -> bytes:
+        response = self.client.get(reverse("inventory:stock_export"))
+        return b"".join(response.streaming_content)
+
+    def exported_quantity(self) -> str:
+        # In a fresh context like a server thread's, the test's own is pinned by the writes of setUp.
+        content = Context().run(self.export_stock)
+        rows = list(csv.reader(content.decode().splitlines()))
+        self.assertEqual(len(rows), 2)
+        return rows[1][-1]
+
+    def test_export_streams_from_replica(self):
+        with CaptureQueriesContext(connections["replica"]) as replica_queries:
+            self.assertEqual(self.exported_quantity(), "10")
+        self.assertTrue(replica_queries)
+
+    def test_pinned_session_streams_from_primary(self):
+        session = self.client.session
+        session[PIN_SESSION_KEY] = time.time() + 60
+        session.save()
+        with CaptureQueriesContext(connections["replica"]) as replica_queries:
+            self.assertEqual(self.exported_quantity(), "15")
+        self.assertFalse(replica_queries)
+
+    def test_unsafe_request_pins_session(self):
+        self.client.post(reverse("inventory:stock_export"))
+        self.assertGreater(self.client.session[PIN_SESSION_KEY], time.time())
+        self.assertEqual(self.exported_quantity(), "15")
+
+    @override_settings(REPLICA_READS=False)
+    def test_replica_reads_off(self):
+        self.assertEqual(self.exported_quantity(), "15")
+
+
+class LineValidationTests(TestCase):
+    def setUp(self):
+        self.customer = make_customer()
+        self.product = make_product()
+        self.other = make_product()
+        self.location = StorageLocation.objects.create(name="Rack 1")
+        self.change_template = InventoryChangeTemplate.objects.create(
+            name="Delivery", format_string="{{amount}} delivered"
+        )
+        self.change_template.product_templates.add(self.product.template)
+        for name, field_type, required, choices in [
+            ("Ticket", BaseTemplateField.TEXT, True, None),
+            ("Joints", BaseTemplateField.INT, False, None),
+            ("Grade", BaseTemplateField.CHOICES, False, ["J55", "L80"]),
+        ]:
+            InventoryChangeTemplateField.objects.create(
+                template=self.change_template,
+                name=name,
+                field_type=field_type,
+                required=required,
+                choices=choices,
+            )
+        self.lines = [
+            {
+                "product": self.product.pk,
+                "location": self.location.pk,
+                "quantity": 5,
+                "values": {"Ticket": "T1", "Joints": "12", "Grade": "L80"},
+            },
+            {
+                "product": self.other.pk,
+                "location": self.location.pk,
+                "quantity": "2.5",
+                "values": {"Joints": "many", "Grade": "X42", "Color": "red"},
+            },
+        ]
+        self.expected = [
+            f"{self.other.template} products can't be changed with Delivery.",
+            "Discrete products require a whole quantity, got '2.5'.",
+            "'Color' is not a field of the inventory change template.",
+            "'Ticket' is required.",
+            "'Joints': invalid literal for int() with base 10: 'many'",
+            "'Grade': 'X42' is not one of ['J55', 'L80'].",
+        ]
+
+    def test_create_transaction(self):
+        with self.assertRaises(ValidationError) as raised:
+            create_transaction(
+                self.customer, timezone.now(), self.lines, self.change_template
+            )
+        self.assertEqual(
+            raised.exception.messages,
+            [f"Line 2: {message}" for message in self.expected],
+        )
+
+        transaction = create_transaction(
+            self.customer, timezone.now(), self.lines[:1], self.change_template
+        )
+        self.assertEqual(
+            {
+                value.field.name: value.value
+                for value in InventoryChangeFieldValue.objects.filter(
+                    line__transaction=transaction
+                )
+            },
+            {"Ticket": "T1", "Joints": 12, "Grade": "L80"},
+        )
+
+    def test_quantities_out_of_range(self):
+        maximum = connection.ops.integer_field_range("IntegerField")[1]
+        continuous = make_product(ProductTemplate.CONTINUOUS)
+        lines = [
+            {"product": product.pk, "location": self.location.pk, "quantity": quantity}
+            for product, quantity in [
+                (self.product, "99999999999999999999"),
+                (continuous, "99999999999999999999"),
+                (continuous, "1.23456"),
+            ]
+        ]
+        with self.assertRaises(ValidationError) as raised:
+            create_transaction(self.customer, timezone.now(), lines)
+        self.assertEqual(
+            raised.exception.messages,
+            [
+                f"Line 1: Quantity 99999999999999999999: Ensure this value is less than or equal to {maximum}.",
+                "Line 2: Quantity 99999999999999999999: Ensure that there are no more than 15 digits in total.",
+                "Line 3: Quantity 1.23456: Ensure that there are no more than 4 decimal places.",
+            ],
+        )
+
+        c, p, l = self.customer.pk, self.product.pk, self.location.pk
+        with self.assertRaises(ValidationError) as raised:
+            import_transactions(
+                StringIO(
+                    "transaction,customer,date,product,location,quantity\n"
+                    f"1,{c},2025-01-01,{p},{l},99999999999999999999"
+                ),
+                "csv",
+            )
+        self.assertEqual(
+            raised.exception.messages,
+            [
+                f"Row 2: Quantity 99999999999999999999: Ensure this value is less than or equal to {maximum}."
+            ],
+        )
+
+    def test_importer(self):
+        stream = StringIO(
+            "\n".join(
+                json.dumps(
+                    {
+                        "customer": self.customer.pk,
+                        "date": "2025-01-01",
+                        "lines": [line],
+                    }
+                )
+                for line in self.lines
+            )
+        )
+        with self.assertRaises(ValidationError) as raised:
+            import_transactions(stream, "jsonl", self.change_template)
+        self.assertEqual(
+            raised.exception.messages,
+            [f"Row 2: {message}" for message in self.expected],
+        )
+
+
+class ArchiveCustomerTests(TestCase):
+    def setUp(self):
+        self.customer = make_customer()
+        self.product = make_product()
+        self.other = make_product()
+        self.location = StorageLocation.objects.create(name="Rack 1")
+        day = timezone.make_aware(datetime(2024, 1, 1))
+        post_lines(self.customer, self.product, self.location, 5, date=day)
+        post_lines(
+            self.customer, self.product, self.location, -5, date=day + timedelta(30)
+        )
+        post_lines(self.customer, self.other, self.location, 10, date=day)
+        post_lines(
+            self.customer, self.other, self.location, 3, date=day + timedelta(600)
+        )
+        change_template = InventoryChangeTemplate.objects.create(
+            name="Delivery", format_string=""
+        )
+        field = InventoryChangeTemplateField.objects.create(
+            template=change_template, name="Ticket", field_type=BaseTemplateField.TEXT
+        )
+        InventoryChangeFieldValue.objects.create(
+            line=InventoryChangeLine.objects.first(), field=field, value_text="T1"
+        )
+
+    def test_carries_stock_forward(self):
+        archive_customer(self.customer.pk, timezone.make_aware(datetime(2025, 1, 1)))
+
+        self.assertEqual(ArchivedChangeLine.objects.count(), 3)
+        self.assertFalse(InventoryChangeFieldValue.objects.exists())
+        # The product whose stock was all withdrawn gets no opening balance line.
+        self.assertEqual(
+            list(
+                InventoryChangeLine.objects.order_by("transaction__date").values_list(
+                    "product", "quantity_int", "transaction__is_opening_balance"
+                )
+            ),
+            [(self.other.pk, 10, True), (self.other.pk, 3, False)],
+        )
+        self.assertEqual(
+            StockBalance.objects.get_quantity(self.customer, self.other, self.location),
+            13,
+        )
+        self.assertEqual(
+            StockBalance.objects.get_quantity(
+                self.customer, self.product, self.location
+            ),
+            0,
+        )
+        stdout = StringIO()
+        call_command("rebuild_stock_balances", verify=True, stdout=stdout)
+        self.assertIn("Verified", stdout.getvalue())
+
+
+class ReplayLedgerTests(TestCase):
+    def setUp(self):
+        self.big = make_customer("Big")
+        self.small = make_customer("Small")
+        self.pipe = make_product()
+        self.cable = make_product(ProductTemplate.CONTINUOUS)
+        self.location = StorageLocation.objects.create(name="Rack 1")
+        day = timezone.make_aware(datetime(2024, 1, 1))
+        for offset in (0, 400):
+            date = day + timedelta(offset)
+            post_lines(self.big, self.pipe, self.location, 5, -2, date=date)
+            post_lines(self.big, self.cable, self.location, "2.5", date=date)
+        post_lines(self.small, self.pipe, self.location, 1, date=day)
+        # Leaves 3 archived lines and an opening balance transaction of 2 lines
+        archive_customer(self.big.pk, timezone.make_aware(datetime(2025, 1, 1)))
+
+    def replay(self, **kwargs):
+        return replay_ledger(workers=1, **kwargs)
+
+    def test_plan_shards_by_customer(self):
+        shards = plan_shards("customer", workers=2)
+        self.assertEqual(
+            [(shard.customer_id, shard.lines) for shard in shards],
+            # Big: 3 archived lines, 2 opening balance lines and 3 lines since
+            [(self.big.pk, 8), (self.small.pk, 1)],
+        )
+        self.assertEqual(
+            [shard.customer_id for shard in plan_shards("customer", 2, self.small.pk)],
+            [self.small.pk],
+        )
+        with self.assertRaises(ValueError):
+            plan_shards("location", workers=2)
+
+    def test_plan_shards_by_template(self):
+        pipe, cable = self.pipe.template_id, self.cable.template_id
+        self.assertEqual(
+            [
+                (shard.customer_id, shard.first_template_id, shard.last_template_id)
+                + (shard.lines,)
+                for shard in plan_shards("template", workers=1)
+            ],
+            [(None, pipe, pipe, 6), (None, cable, cable, 3)],
+        )
+        # Templates join a range until it holds its share of the lines
+        ProductTemplate.objects.create(name="Empty", format_string="")
+        rod = make_product()
+        post_lines(self.small, rod, self.location, 1)
+        self.assertEqual(
+            [
+                (shard.customer_id, shard.first_template_id, shard.last_template_id)
+                + (shard.lines,)
+                for shard in plan_shards(
+                    "template", workers=1, customer_id=self.small.pk
+                )
+            ],
+            [
+                (self.small.pk, pipe, pipe, 1),
+                (self.small.pk, cable, rod.template_id, 1),
+            ],
+        )
+
+    def test_compare(self):
+        result = ShardResult(Shard())
+        differing = compare(
+            "balance",
+            {(1, 1, 1): (5, Decimal(0)), (1, 2, 1): (0, Decimal(0))},
+            {(1, 1, 1): (4, Decimal(0)), (1, 3, 1): (0, Decimal(0))},
+            ZERO_BALANCE,
+            result,
+        )
+        self.assertEqual(differing, [(1, 1, 1)])
+        self.assertEqual(result.mismatches, 1)
+        self.assertEqual(
+            result.described,
+            ["balance (1, 1, 1): ledger=(5, Decimal('0')) stored=(4, Decimal('0'))"],
+        )
+
+    def test_verifies_ledger_with_archive(self):
+        for shard_by in SHARD_BY:
+            with self.subTest(shard_by):
+                result = self.replay(shard_by=shard_by)
+                self.assertEqual(result.mismatches, 0, result.described)
+                self.assertEqual(result.lines, 9)
+                self.assertEqual(result.rewritten, 0)
+
+    def test_rebuild_repairs_corrupted_rows(self):
+        StockBalance.objects.filter(customer=self.big, product=self.pipe).update(
+            quantity_int=99
+        )
+        DailyMovement.objects.filter(customer=self.big, day__year=2024).first().delete()
+        StockBalance.objects.filter(customer=self.small).delete()
+        expected_balances = {
+            (self.big.pk, self.pipe.pk): 6,
+            (self.small.pk, self.pipe.pk): 1,
+        }
+
+        for shard_by in SHARD_BY:
+            with self.subTest(shard_by):
+                with self.assertRaisesMessage(
+                    CommandError, "3 balances and daily movements differ"
+                ):
+                    call_command(
+                        "replay_ledger", shard_by=shard_by, workers=1, stdout=StringIO()
+                    )
+        self.assertEqual(
+            StockBalance.objects.get(customer=self.big, product=self.pipe).quantity_int,
+            99,
+        )
+
+        versions = dict(Customer.objects.values_list("pk", "stock_version"))
+        result = self.replay(shard_by="template", rebuild=True)
+        self.assertEqual(result.mismatches, 3)
+        # Only the pipe template's shard differed
+        self.assertEqual(result.rewritten, 1)
+        self.assertEqual(
+            {
+                (customer_id, product_id): quantity
+                for customer_id, product_id, quantity in StockBalance.objects.filter(
+                    product=self.pipe
+                ).values_list("customer_id", "product_id", "quantity_int")
+            },
+            expected_balances,
+        )
+        self.assertEqual(self.replay().mismatches, 0)
+        for customer in (self.big, self.small):
+            customer.refresh_from_db()
+            self.assertGreater(customer.stock_version, versions[customer.pk])
+
+    def test_template_change_moves_movements(self):
+        old = self.pipe.template
+        self.pipe.template = ProductTemplate.objects.create(
+            name="Tubing", format_string=""
+        )
+        self.pipe.save()
+
+        self.assertEqual(self.replay().mismatches, 0)
+        self.assertFalse(
+            DailyMovement.objects.filter(template=old)
+            .exclude(inbound_int=0, outbound_int=0)
+            .exists()
+        )
+        self.assertEqual(
+            DailyMovement.objects.filter(template=self.pipe.template).aggregate(
+                inbound=Sum("inbound_int"), outbound=Sum("outbound_int")
+            ),
+            {"inbound": 11, "outbound": 4},
+        )
@@ -0,0 +1,19 @@
+from django.urls import path
+
+from inventory.views import (
+    TransactionImportView,
+    ledger_export_view,
+    movement_report_view,
+    stock_export_view,
+    stock_report_view,
+)
+
+app_name = "inventory"
+
+urlpatterns = [
+    path("import/", TransactionImportView.as_view(), name="transaction_import"),
+    path("export/ledger.csv", ledger_export_view, name="ledger_export"),
+    path("export/stock.csv", stock_export_view, name="stock_export"),
+    path("reports/stock/", stock_report_view, name="stock_report"),
+    path("reports/movements/", movement_report_view, name="movement_report"),
+]
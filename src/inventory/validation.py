@@ -0,0 +1,111 @@
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+
+from inventory.models import (
+    InventoryChangeFieldValue,
+    InventoryChangeLine,
+    InventoryChangeTemplate,
+)
+from products.models import ProductTemplate
+from utils.model_commons import parse_decimal
+from utils.schema_cache import get_template_schema
+
+
+class LineValidator:
+    """
+    Validates the quantities, products and field values of inventory change lines against a change template, shared
+    by create_transaction and the importer. Fields are read from the template schema cache, so validating many lines
+    costs a query for its version stamp, and one more for the fields when they changed.
+
+    Checks return error messages rather than raising, so callers can report every error with its line or row.
+    """
+
+    def __init__(self, change_template: InventoryChangeTemplate | None = None):
+        self.change_template = change_template
+        self.fields = {}
+        self.allowed_templates = set()
+        if change_template is not None:
+            self.fields = {
+                field.name: field for field in get_template_schema(change_template)
+            }
+            self.allowed_templates = set(
+                change_template.product_templates.values_list("pk", flat=True)
+            )
+
+    def check_product_template(self, template_id: int, name: str) -> list[str]:
+        """
+        Checks products of the template may be changed with the change template, a change template without product
+        templates allows every product.
+        """
+        if self.allowed_templates and template_id not in self.allowed_templates:
+            return [f"{name} products can't be changed with {self.change_template}."]
+        return []
+
+    @staticmethod
+    def parse_quantity(
+        counting_type: str, quantity
+    ) -> tuple[int | None, Decimal | None, list[str]]:
+        """
+        Converts a quantity to the column of the product's counting type, checked against the column's range and
+        digits so it can be stored.
+
+        :return: The quantity_int and quantity_decimal of the line, and the errors found.
+        """
+        quantity = str(quantity).strip()
+        if counting_type == ProductTemplate.DISCRETE:
+            column = "quantity_int"
+            try:
+                value = int(quantity)
+            except ValueError:
+                return (
+                    None,
+                    None,
+                    [f"Discrete products require a whole quantity, got {quantity!r}."],
+                )
+        else:
+            column = "quantity_decimal"
+            try:
+                value = parse_decimal(quantity)
+            except ValueError:
+                return (
+                    None,
+                    None,
+                    [
+                        f"Continuous products require a decimal quantity, got {quantity!r}."
+                    ],
+                )
+
+        try:
+            InventoryChangeLine._meta.get_field(column).run_validators(value)
+        except ValidationError as e:
+            return None, None, [f"Quantity {quantity}: {' '.join(e.messages)}"]
+        if column == "quantity_int":
+            return value, None, []
+        return None, value, []
+
+    def parse_values(self, raw_values: dict | None) -> tuple[list[dict], list[str]]:
+        """
+        Converts the raw values of a line's fields, by field name.
+
+        :return: The InventoryChangeFieldValue keyword arguments of each value, without the line, and the errors found.
+        """
+        raw_values = raw_values or {}
+        errors = [
+            f"{name!r} is not a field of the inventory change template."
+            for name in sorted(raw_values.keys() - self.fields.keys())
+        ]
+        values = []
+        for name, field in self.fields.items():
+            raw = raw_values.get(name)
+            if raw in (None, ""):
+                if field.required:
+                    errors.append(f"{name!r} is required.")
+                continue
+            try:
+                columns = InventoryChangeFieldValue.parse_value(field, raw)
+            except ValueError as e:
+                errors.append(f"{name!r}: {e}")
+                continue
+            values.append({"field_id": field.pk, **columns})
+        return values, errors
@@ -1,3 +1,99 @@
-from django.shortcuts import render
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import ValidationError
+from django.http import HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.views.decorators.http import require_GET
+from django.views.generic.edit import FormView
 
-# Create your views here.
+from inventory.exports import export_ledger, export_stock
+from inventory.forms import (
+    LedgerExportForm,
+    MovementReportForm,
+    StockExportForm,
+    StockReportForm,
+    TransactionImportForm,
+)
+from inventory.importers import decode_lines, import_transactions
+from inventory.reports import movement_totals, stock_totals
+from utils.db_routing import replica_iterator, replica_reads
+
+
+class TransactionImportView(FormView):
+    template_name = "inventory/transaction_import.html"
+    form_class = TransactionImportForm
+
+    def form_valid(self, form):
+        try:
+            result = import_transactions(
+                decode_lines(form.cleaned_data["file"]),
+                form.cleaned_data["file_format"],
+                form.cleaned_data["change_template"],
+            )
+        except ValidationError as e:
+            form.add_error("file", e)
+            return self.form_invalid(form)
+
+        return self.render_to_response(self.get_context_data(form=form, result=result))
+
+
+def csv_response(rows, name: str) -> StreamingHttpResponse:
+    """
+    Streams the rows from the replica, they're queried as the response is sent. Requests pinned to the primary
+    stream from the primary.
+    """
+    response = StreamingHttpResponse(replica_iterator(rows), content_type="text/csv")
+    response["Content-Disposition"] = (
+        f'attachment; filename="{name}-{timezone.localdate():%Y%m%d}.csv"'
+    )
+    return response
+
+
+@require_GET
+@replica_reads()
+def ledger_export_view(request):
+    """
+    Streams the ledger as CSV, filtered by the customer, template, start and end query parameters.
+    """
+    form = LedgerExportForm(request.GET)
+    if not form.is_valid():
+        return HttpResponseBadRequest(form.errors.as_text())
+    return csv_response(export_ledger(**form.cleaned_data), "ledger")
+
+
+@require_GET
+@replica_reads()
+def stock_export_view(request):
+    """
+    Streams current stock positions as CSV, filtered by the customer and template query parameters.
+    """
+    form = StockExportForm(request.GET)
+    if not form.is_valid():
+        return HttpResponseBadRequest(form.errors.as_text())
+    return csv_response(export_stock(**form.cleaned_data), "stock")
+
+
+@staff_member_required
+@require_GET
+@replica_reads()
+def stock_report_view(request):
+    """
+    Returns current stock totals as JSON, grouped by the group_by query parameters, ex: ?group_by=template
+    """
+    form = StockReportForm(request.GET)
+    if not form.is_valid():
+        return HttpResponseBadRequest(form.errors.as_text())
+    return JsonResponse({"results": stock_totals(**form.cleaned_data)})
+
+
+@staff_member_required
+@require_GET
+@replica_reads()
+def movement_report_view(request):
+    """
+    Returns inbound and outbound volume as JSON, grouped by the group_by query parameters, ex:
+    ?group_by=day&group_by=template&start=2025-01-01
+    """
+    form = MovementReportForm(request.GET)
+    if not form.is_valid():
+        return HttpResponseBadRequest(form.errors.as_text())
+    return JsonResponse({"results": movement_totals(**form.cleaned_data)})
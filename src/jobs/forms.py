@@ -0,0 +1,22 @@
+from django import forms
+
+from jobs.registry import job_names
+
+
+class JobForm(forms.Form):
+    name = forms.ChoiceField(choices=())
+    kwargs = forms.JSONField(
+        initial=dict,
+        required=False,
+        help_text='Keyword arguments of the job, ex: {"customer": 1}',
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["name"].choices = [(name, name) for name in job_names()]
+
+    def clean_kwargs(self) -> dict:
+        kwargs = self.cleaned_data["kwargs"] or {}
+        if not isinstance(kwargs, dict):
+            raise forms.ValidationError("Must be a JSON object.")
+        return kwargs
@@ -0,0 +1,49 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from jobs.runner import Worker
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs queued jobs in a pool of worker processes. Start one per machine, they share the queue in the "
+        "database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processes", type=int, default=2, help="Jobs run at the same time."
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=1.0,
+            help="Seconds between checks for new jobs.",
+        )
+        parser.add_argument(
+            "--stale-after",
+            type=int,
+            default=300,
+            help="Seconds without a heartbeat after which a running job's worker is presumed dead.",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once no due jobs are left, instead of waiting for more.",
+        )
+
+    def handle(self, *args, **options):
+        worker = Worker(
+            processes=options["processes"],
+            poll_interval=options["poll_interval"],
+            stale_after=timedelta(seconds=options["stale_after"]),
+            log=self.stdout.write,
+        )
+        self.stdout.write(f"Worker {worker.name} started.")
+        try:
+            worker.run(once=options["once"])
+        except KeyboardInterrupt:
+            self.stdout.write(
+                "Stopped, interrupted jobs are queued again once their heartbeat is stale."
+            )
@@ -0,0 +1,131 @@
+from django.db import models
+from django.utils import timezone
+
+from jobs.registry import get_job_function, is_cancellable
+
+
+class JobManager(models.Manager):
+    def enqueue(self, name: str, max_attempts: int = 3, **kwargs) -> "Job":
+        """
+        Queues a registered job for the run_jobs workers, the keyword arguments must be JSON serializable.
+
+        :raises ValueError: If no job is registered under the name.
+        """
+        get_job_function(name)
+        return self.create(name=name, kwargs=kwargs, max_attempts=max_attempts)
+
+
+class Job(models.Model):
+    """
+    Represents a long operation, such as an export or a rebuild, run outside of requests by the run_jobs command.
+    Failed jobs are retried automatically until they've used max_attempts, and can be retried or cancelled by hand.
+    """
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    STATUSES = [
+        (QUEUED, "Queued"),
+        (RUNNING, "Running"),
+        (SUCCEEDED, "Succeeded"),
+        (FAILED, "Failed"),
+        (CANCELLED, "Cancelled"),
+    ]
+
+    name = models.TextField(help_text="Name of the job function, see jobs.registry")
+    kwargs = models.JSONField(default=dict, blank=True)
+    status = models.TextField(choices=STATUSES, default=QUEUED)
+
+    progress_done = models.BigIntegerField(default=0)
+    progress_total = models.BigIntegerField(blank=True, null=True)
+    message = models.TextField(blank=True)
+    result = models.JSONField(blank=True, null=True)
+    error = models.TextField(blank=True)
+
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    cancel_requested = models.BooleanField(default=False)
+    # hostname:pid of the worker running the job
+    worker = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    run_after = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    # Refreshed by the worker while the job runs, a stale heartbeat means the worker died
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+
+    objects = JobManager()
+
+    class Meta:
+        # Workers take the queued jobs that are due, oldest first
+        indexes = [
+            models.Index(
+                fields=["run_after", "id"],
+                condition=models.Q(status="queued"),
+                name="job_queue_idx",
+            )
+        ]
+
+    @property
+    def is_active(self) -> bool:
+        return self.status in (Job.QUEUED, Job.RUNNING)
+
+    @property
+    def can_cancel(self) -> bool:
+        return self.status == Job.QUEUED or (
+            self.status == Job.RUNNING and is_cancellable(self.name)
+        )
+
+    @property
+    def percent(self) -> int | None:
+        if not self.progress_total:
+            return None
+        return min(100, round(100 * self.progress_done / self.progress_total))
+
+    def retry(self) -> bool:
+        """
+        Queues a failed or cancelled job again, with all its attempts.
+
+        :return: Whether the job was queued, it may have changed status meanwhile.
+        """
+        return bool(
+            Job.objects.filter(
+                pk=self.pk, status__in=[Job.FAILED, Job.CANCELLED]
+            ).update(
+                status=Job.QUEUED,
+                attempts=0,
+                cancel_requested=False,
+                error="",
+                message="",
+                progress_done=0,
+                progress_total=None,
+                run_after=timezone.now(),
+                finished_at=None,
+            )
+        )
+
+    def cancel(self) -> bool:
+        """
+        Cancels a queued job at once. A running job is asked to stop, and stops the next time it reports progress. Jobs
+        that don't report progress, such as commands, can't be cancelled once running.
+
+        :return: Whether the job was cancelled or asked to stop.
+        """
+        if Job.objects.filter(pk=self.pk, status=Job.QUEUED).update(
+            status=Job.CANCELLED, finished_at=timezone.now()
+        ):
+            return True
+        if not is_cancellable(self.name):
+            return False
+        return bool(
+            Job.objects.filter(pk=self.pk, status=Job.RUNNING).update(
+                cancel_requested=True
+            )
+        )
+
+    def __str__(self) -> str:
+        return f"{self.name} #{self.pk} ({self.status})"
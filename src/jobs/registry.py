@@ -0,0 +1,62 @@
+import io
+from typing import Callable
+
+from django.core.management import call_command
+
+# Job functions by name, each called with a JobContext and the job's keyword arguments
+_registry: dict[str, Callable] = {}
+
+
+def register(name: str) -> Callable[[Callable], Callable]:
+    """
+    Registers a job function under a name, ex:
+
+        @register("rebuild_search_index")
+        def rebuild_search_index(job, **kwargs): ...
+
+    The function receives a JobContext to report progress through and returns a JSON serializable result. Reporting
+    progress is also when a cancelled job stops.
+    """
+
+    def decorator(function: Callable) -> Callable:
+        _registry[name] = function
+        return function
+
+    return decorator
+
+
+def register_command(name: str, command: str | None = None) -> None:
+    """
+    Registers a job running a management command, with the job's keyword arguments as options. Commands don't report
+    progress, so they can't be cancelled once running, their output becomes the job's result.
+    """
+
+    def run(job, **options) -> str:
+        job.progress(0, 1, f"Running {command or name}")
+        stdout = io.StringIO()
+        call_command(command or name, stdout=stdout, **options)
+        return stdout.getvalue()
+
+    run.cancellable = False
+    _registry[name] = run
+
+
+def get_job_function(name: str) -> Callable:
+    """
+    :raises ValueError: If no job is registered under the name.
+    """
+    try:
+        return _registry[name]
+    except KeyError:
+        raise ValueError(f"{name!r} is not a registered job.")
+
+
+def is_cancellable(name: str) -> bool:
+    """
+    Whether a running job of the name stops when cancelled, queued jobs always can be.
+    """
+    return getattr(_registry.get(name), "cancellable", True)
+
+
+def job_names() -> list[str]:
+    return sorted(_registry)
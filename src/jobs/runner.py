@@ -0,0 +1,280 @@
+import os
+import socket
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from multiprocessing import get_context
+
+import django
+from pathlib import Path
+
+from django.conf import settings
+from django.db import OperationalError, connection
+from django.db.models import F
+from django.db.transaction import atomic
+from django.utils import timezone
+
+from jobs.models import Job
+from jobs.registry import get_job_function
+
+# Seconds between progress writes, progress reported more often is only kept in memory
+PROGRESS_INTERVAL = 1.0
+
+# Seconds before the first automatic retry of a failed job, doubled on every further attempt
+RETRY_DELAY = 30
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobContext:
+    """
+    Handed to job functions to report progress through, which is also when cancellation is noticed.
+    """
+
+    def __init__(self, job: Job):
+        self.job = job
+        self.last_write = 0.0
+
+    @property
+    def pk(self) -> int:
+        return self.job.pk
+
+    def progress(
+        self,
+        done: int,
+        total: int | None = None,
+        message: str | None = None,
+        force: bool = False,
+    ) -> None:
+        """
+        Records how far the job got, at most once every PROGRESS_INTERVAL seconds unless forced.
+
+        :raises JobCancelled: If the job was asked to stop.
+        """
+        self.job.progress_done = done
+        if total is not None:
+            self.job.progress_total = total
+        if message is not None:
+            self.job.message = message
+        now = time.monotonic()
+        if not force and now - self.last_write < PROGRESS_INTERVAL:
+            return
+        self.last_write = now
+
+        try:
+            Job.objects.filter(pk=self.job.pk).update(
+                progress_done=self.job.progress_done,
+                progress_total=self.job.progress_total,
+                message=self.job.message,
+            )
+        except OperationalError:
+            # SQLite refuses a write from a connection in the middle of a read while another process writes. Progress
+            # is informational, it's written again at the next report.
+            pass
+        if Job.objects.filter(pk=self.job.pk, cancel_requested=True).exists():
+            raise JobCancelled()
+
+    def output_path(self, suffix: str) -> Path:
+        """
+        Returns where to write a file the job produces, downloadable from the job page when it's in the result as
+        {"file": path.name}.
+        """
+        directory = Path(settings.JOB_FILES_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        return directory / f"{self.job.name}-{self.job.pk}{suffix}"
+
+
+def worker_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim_job(worker: str) -> Job | None:
+    """
+    Takes the oldest due job off the queue for a worker. On databases with SKIP LOCKED, workers lock the job they
+    claim and skip the ones other workers hold, so they never wait on each other. Elsewhere, a job is claimed by a
+    conditional update, only one worker's update can match a queued job.
+    """
+    now = timezone.now()
+    queued = Job.objects.filter(status=Job.QUEUED, run_after__lte=now).order_by(
+        "run_after", "pk"
+    )
+    claim = {
+        "status": Job.RUNNING,
+        "worker": worker,
+        "started_at": now,
+        "heartbeat_at": now,
+        "attempts": F("attempts") + 1,
+    }
+
+    if connection.features.has_select_for_update_skip_locked:
+        with atomic():
+            pk = (
+                queued.select_for_update(skip_locked=True)
+                .values_list("pk", flat=True)
+                .first()
+            )
+            if pk is None:
+                return None
+            Job.objects.filter(pk=pk).update(**claim)
+    else:
+        for pk in queued.values_list("pk", flat=True)[:10]:
+            if Job.objects.filter(pk=pk, status=Job.QUEUED).update(**claim):
+                break
+        else:
+            return None
+    return Job.objects.get(pk=pk)
+
+
+def finish_job(job: Job, **fields) -> None:
+    """
+    Records the outcome of a job, unless it was taken away from its worker, ex: after being requeued as stale.
+    """
+    Job.objects.filter(pk=job.pk, status=Job.RUNNING, worker=job.worker).update(
+        **fields
+    )
+
+
+def fail_job(job: Job, error: str) -> None:
+    """
+    Queues a failed job again with a growing delay, until it has used max_attempts.
+    """
+    if job.attempts < job.max_attempts:
+        finish_job(
+            job,
+            status=Job.QUEUED,
+            error=error,
+            run_after=timezone.now()
+            + timedelta(seconds=RETRY_DELAY * 2 ** (job.attempts - 1)),
+        )
+    else:
+        finish_job(job, status=Job.FAILED, error=error, finished_at=timezone.now())
+
+
+def run_job(job_id: int) -> None:
+    """
+    Runs a claimed job and records its outcome.
+    """
+    job = Job.objects.get(pk=job_id)
+    context = JobContext(job)
+    try:
+        if job.cancel_requested:
+            raise JobCancelled()
+        result = get_job_function(job.name)(context, **job.kwargs)
+    except JobCancelled:
+        finish_job(job, status=Job.CANCELLED, finished_at=timezone.now())
+    except Exception:
+        fail_job(job, traceback.format_exc())
+    else:
+        finish_job(
+            job,
+            status=Job.SUCCEEDED,
+            result=result,
+            progress_done=job.progress_total or job.progress_done,
+            finished_at=timezone.now(),
+        )
+
+
+def requeue_stale(stale_after: timedelta) -> int:
+    """
+    Queues running jobs whose worker stopped sending heartbeats again, or fails them when out of attempts.
+
+    :return: The number of jobs recovered.
+    """
+    stale = Job.objects.filter(
+        status=Job.RUNNING, heartbeat_at__lt=timezone.now() - stale_after
+    )
+    error = "The worker running the job stopped responding."
+    failed = stale.filter(attempts__gte=F("max_attempts")).update(
+        status=Job.FAILED, error=error, finished_at=timezone.now()
+    )
+    requeued = stale.update(status=Job.QUEUED, error=error, worker="")
+    return failed + requeued
+
+
+class Worker:
+    """
+    Claims jobs and runs them in a pool of processes, refreshing the heartbeat of the jobs it runs. Several workers,
+    on one or many machines, can share the queue.
+    """
+
+    def __init__(
+        self,
+        processes: int = 2,
+        poll_interval: float = 1.0,
+        stale_after: timedelta = timedelta(minutes=5),
+        log=print,
+    ):
+        self.processes = processes
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.log = log
+        self.name = worker_name()
+        self.running: dict[Future, int] = {}
+        self.pool: ProcessPoolExecutor | None = None
+
+    def start_pool(self) -> None:
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.processes,
+            # Spawned processes start fresh, without copies of the parent's open connections.
+            mp_context=get_context("spawn"),
+            initializer=django.setup,
+        )
+
+    def run(self, once: bool = False) -> None:
+        """
+        Runs jobs until interrupted, or with once until the queue has no due jobs left.
+        """
+        self.start_pool()
+        try:
+            while True:
+                self.collect()
+                if requeued := requeue_stale(self.stale_after):
+                    self.log(f"Recovered {requeued} stale jobs.")
+                Job.objects.filter(pk__in=self.running.values()).update(
+                    heartbeat_at=timezone.now()
+                )
+
+                claimed = False
+                while len(self.running) < self.processes:
+                    job = claim_job(self.name)
+                    if job is None:
+                        break
+                    claimed = True
+                    self.log(f"Running {job}.")
+                    self.running[self.pool.submit(run_job, job.pk)] = job.pk
+
+                if once and not claimed and not self.running:
+                    return
+                if self.running:
+                    wait(
+                        self.running,
+                        timeout=self.poll_interval,
+                        return_when=FIRST_COMPLETED,
+                    )
+                else:
+                    time.sleep(self.poll_interval)
+        finally:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+
+    def collect(self) -> None:
+        """
+        Forgets finished jobs. Jobs whose process died couldn't record their outcome, so it's recorded for them.
+        """
+        broken = False
+        for future in [future for future in self.running if future.done()]:
+            job_id = self.running.pop(future)
+            error = future.exception()
+            if error is None:
+                self.log(f"Finished job #{job_id}.")
+                continue
+            self.log(f"Job #{job_id} crashed: {error!r}")
+            fail_job(Job.objects.get(pk=job_id), repr(error))
+            broken = broken or isinstance(error, BrokenProcessPool)
+        if broken:
+            # A dead process breaks the whole pool, the jobs still in it crash too and are recorded above.
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.start_pool()
@@ -0,0 +1,193 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from jobs.models import Job
+from jobs.registry import register, register_command
+from jobs.runner import RETRY_DELAY, claim_job, fail_job, requeue_stale, run_job
+
+
+@register("test_succeed")
+def succeed(job, total: int = 4) -> dict:
+    for done in range(total):
+        job.progress(done, total, "Counting")
+    return {"counted": total}
+
+
+@register("test_fail")
+def fail(job) -> None:
+    raise RuntimeError("Out of coffee")
+
+
+@register("test_cancel")
+def cancel_midway(job) -> None:
+    Job.objects.filter(pk=job.pk).update(cancel_requested=True)
+    job.progress(1, 2, force=True)
+    raise AssertionError("The job should have stopped.")
+
+
+register_command("test_command", "check")
+
+
+class ClaimJobTests(TransactionTestCase):
+    def test_workers_claim_distinct_jobs(self):
+        jobs = [Job.objects.enqueue("test_succeed") for _ in range(3)]
+        start = threading.Barrier(8)
+
+        def claim(worker: int) -> int | None:
+            start.wait()
+            try:
+                job = claim_job(f"worker-{worker}")
+                return job and job.pk
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            claimed = [pk for pk in executor.map(claim, range(8)) if pk]
+
+        self.assertCountEqual(claimed, [job.pk for job in jobs])
+        self.assertEqual(
+            list(Job.objects.values_list("status", "attempts").distinct()),
+            [(Job.RUNNING, 1)],
+        )
+
+    def test_skips_jobs_not_due(self):
+        Job.objects.enqueue("test_succeed")
+        Job.objects.update(run_after=timezone.now() + timedelta(minutes=1))
+        self.assertIsNone(claim_job("worker"))
+
+
+class RunJobTests(TestCase):
+    def run_claimed(self, name: str, **kwargs) -> Job:
+        job = Job.objects.enqueue(name, **kwargs)
+        claim_job("worker")
+        run_job(job.pk)
+        job.refresh_from_db()
+        return job
+
+    def test_succeeds(self):
+        job = self.run_claimed("test_succeed", total=4)
+        self.assertEqual(job.status, Job.SUCCEEDED)
+        self.assertEqual(job.result, {"counted": 4})
+        self.assertEqual(job.percent, 100)
+        self.assertIsNotNone(job.finished_at)
+
+    def test_failure_is_retried_later(self):
+        job = self.run_claimed("test_fail")
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertIn("RuntimeError: Out of coffee", job.error)
+        self.assertGreater(job.run_after, timezone.now())
+
+    def test_cancelled_when_reporting_progress(self):
+        job = self.run_claimed("test_cancel")
+        self.assertEqual(job.status, Job.CANCELLED)
+        self.assertEqual(job.error, "")
+
+    def test_cancelled_before_start(self):
+        job = Job.objects.enqueue("test_succeed")
+        claim_job("worker")
+        Job.objects.filter(pk=job.pk).update(cancel_requested=True)
+        run_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.CANCELLED)
+        self.assertIsNone(job.result)
+
+    def test_outcome_of_requeued_job_is_dropped(self):
+        job = Job.objects.enqueue("test_succeed")
+        claim_job("worker")
+        Job.objects.filter(pk=job.pk).update(status=Job.QUEUED, worker="")
+        run_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+
+
+class FailJobTests(TestCase):
+    def test_backoff_until_max_attempts(self):
+        job = Job.objects.enqueue("test_fail", max_attempts=3)
+        for attempt in range(1, 4):
+            before = timezone.now()
+            Job.objects.filter(pk=job.pk).update(run_after=before)
+            job = claim_job("worker")
+            self.assertEqual(job.attempts, attempt)
+            fail_job(job, "Out of coffee")
+            job.refresh_from_db()
+            if attempt < 3:
+                self.assertEqual(job.status, Job.QUEUED)
+                delay = timedelta(seconds=RETRY_DELAY * 2 ** (attempt - 1))
+                self.assertGreaterEqual(job.run_after, before + delay)
+                self.assertLess(job.run_after, timezone.now() + delay)
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.error, "Out of coffee")
+        self.assertIsNotNone(job.finished_at)
+        self.assertIsNone(claim_job("worker"))
+
+
+class RequeueStaleTests(TestCase):
+    def test_requeues_or_fails_stale_jobs(self):
+        stale, exhausted, alive = [
+            Job.objects.enqueue("test_succeed", max_attempts=max_attempts)
+            for max_attempts in (3, 1, 3)
+        ]
+        for _ in range(3):
+            claim_job("worker")
+        Job.objects.exclude(pk=alive.pk).update(
+            heartbeat_at=timezone.now() - timedelta(minutes=10)
+        )
+
+        self.assertEqual(requeue_stale(timedelta(minutes=5)), 2)
+        statuses = dict(Job.objects.values_list("pk", "status"))
+        self.assertEqual(
+            statuses,
+            {stale.pk: Job.QUEUED, exhausted.pk: Job.FAILED, alive.pk: Job.RUNNING},
+        )
+        stale.refresh_from_db()
+        self.assertEqual(stale.worker, "")
+
+
+class CancelRetryTests(TestCase):
+    def test_cancel(self):
+        queued = Job.objects.enqueue("test_succeed")
+        self.assertTrue(queued.cancel())
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, Job.CANCELLED)
+        self.assertFalse(queued.cancel())
+
+        Job.objects.enqueue("test_succeed")
+        running = claim_job("worker")
+        self.assertTrue(running.can_cancel)
+        self.assertTrue(running.cancel())
+        running.refresh_from_db()
+        self.assertEqual(running.status, Job.RUNNING)
+        self.assertTrue(running.cancel_requested)
+
+    def test_running_command_cant_be_cancelled(self):
+        Job.objects.enqueue("test_command")
+        job = claim_job("worker")
+        self.assertFalse(job.can_cancel)
+        self.assertFalse(job.cancel())
+        job.refresh_from_db()
+        self.assertFalse(job.cancel_requested)
+
+        staff = get_user_model().objects.create_user(username="staff", is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(reverse("jobs:job_list"))
+        self.assertNotContains(response, reverse("jobs:job_cancel", args=[job.pk]))
+
+    def test_retry(self):
+        job = Job.objects.enqueue("test_fail", max_attempts=1)
+        claim_job("worker")
+        self.assertFalse(job.retry())
+        fail_job(Job.objects.get(pk=job.pk), "Out of coffee")
+        self.assertTrue(job.retry())
+        job.refresh_from_db()
+        self.assertEqual(
+            (job.status, job.attempts, job.error, job.finished_at),
+            (Job.QUEUED, 0, "", None),
+        )
+        self.assertEqual(claim_job("worker"), job)
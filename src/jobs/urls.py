@@ -0,0 +1,17 @@
+from django.urls import path
+
+from jobs.views import (
+    job_cancel_view,
+    job_download_view,
+    job_list_view,
+    job_retry_view,
+)
+
+app_name = "jobs"
+
+urlpatterns = [
+    path("", job_list_view, name="job_list"),
+    path("<int:pk>/retry/", job_retry_view, name="job_retry"),
+    path("<int:pk>/cancel/", job_cancel_view, name="job_cancel"),
+    path("<int:pk>/download/", job_download_view, name="job_download"),
+]
@@ -0,0 +1,77 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import FileResponse, Http404
+from django.shortcuts import get_object_or_404, redirect, render
+from django.views.decorators.http import require_POST
+
+from jobs.forms import JobForm
+from jobs.models import Job
+
+# Most recent jobs shown on the status page
+JOB_LIST_SIZE = 50
+
+
+def job_rows(request):
+    jobs = list(Job.objects.order_by("-pk")[:JOB_LIST_SIZE])
+    return render(
+        request,
+        "jobs/partials/job_rows.html",
+        {"jobs": jobs, "polling": any(job.is_active for job in jobs)},
+    )
+
+
+@staff_member_required
+def job_list_view(request):
+    """
+    Lists recent jobs and queues new ones. htmx polls the rows while any job is queued or running.
+    """
+    if request.headers.get("HX-Request"):
+        return job_rows(request)
+
+    form = JobForm(request.POST or None)
+    if request.method == "POST" and form.is_valid():
+        Job.objects.enqueue(form.cleaned_data["name"], **form.cleaned_data["kwargs"])
+        return redirect("jobs:job_list")
+
+    jobs = list(Job.objects.order_by("-pk")[:JOB_LIST_SIZE])
+    return render(
+        request,
+        "jobs/job_list.html",
+        {
+            "form": form,
+            "jobs": jobs,
+            "polling": any(job.is_active for job in jobs),
+        },
+    )
+
+
+@staff_member_required
+@require_POST
+def job_retry_view(request, pk: int):
+    get_object_or_404(Job, pk=pk).retry()
+    return job_rows(request)
+
+
+@staff_member_required
+@require_POST
+def job_cancel_view(request, pk: int):
+    get_object_or_404(Job, pk=pk).cancel()
+    return job_rows(request)
+
+
+@staff_member_required
+def job_download_view(request, pk: int):
+    """
+    Downloads the file a succeeded job produced.
+    """
+    job = get_object_or_404(Job, pk=pk, status=Job.SUCCEEDED)
+    name = (job.result or {}).get("file") if isinstance(job.result, dict) else None
+    if not name:
+        raise Http404("The job produced no file.")
+    # Only the name is stored, so a result can't point outside the job files directory.
+    path = Path(settings.JOB_FILES_DIR) / Path(name).name
+    if not path.exists():
+        raise Http404("The file was removed.")
+    return FileResponse(path.open("rb"), as_attachment=True, filename=path.name)
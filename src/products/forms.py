@@ -0,0 +1,45 @@
+from django import forms
+
+from products.models import Product
+
+
+class ProductPickerWidget(forms.SelectMultiple):
+    """
+    Renders only the selected products as checked boxes, with a search box that loads more products to pick from
+    a paginated endpoint. Rendering costs one query no matter how many products exist. products/product_picker.js
+    moves checked results to the selected products, so they survive the next search.
+    """
+
+    template_name = "products/widgets/product_picker.html"
+
+    def optgroups(self, name, value, attrs=None):
+        selected = [pk for pk in value if str(pk).isdigit()]
+        products = self.choices.queryset.filter(pk__in=selected).order_by("pk")
+        options = [
+            self.create_option(
+                name,
+                product.pk,
+                self.choices.field.label_from_instance(product),
+                True,
+                index,
+                attrs=attrs,
+            )
+            for index, product in enumerate(products)
+        ]
+        return [(None, options, 0)]
+
+
+class ProductMultipleChoiceField(forms.ModelMultipleChoiceField):
+    """
+    Multiple choice field labelling products with their display name, loaded without a query per product.
+    """
+
+    widget = ProductPickerWidget
+
+    def __init__(self, queryset=None, **kwargs):
+        if queryset is None:
+            queryset = Product.objects.all()
+        super().__init__(queryset=queryset.with_labels(), **kwargs)
+
+    def label_from_instance(self, obj: Product) -> str:
+        return obj.display_name or obj.template.name
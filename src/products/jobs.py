@@ -0,0 +1,35 @@
+from inventory.models import InventoryChangeFieldValue
+from jobs.registry import register, register_command
+from products.management.commands.backfill_measure_mm import (
+    Command as BackfillMeasureCommand,
+)
+from products.models import ProductFieldValue
+
+register_command("rebuild_search_index")
+register_command("rebuild_product_attributes")
+
+
+@register("backfill_measure_mm")
+def backfill_measure_mm(
+    job, only_missing: bool = False, chunk_size: int = 2000
+) -> dict:
+    """
+    Recomputes value_measure_mm like the backfill_measure_mm command, reporting progress after every chunk.
+    """
+    querysets = [
+        BackfillMeasureCommand.measure_values(model, only_missing)
+        for model in (ProductFieldValue, InventoryChangeFieldValue)
+    ]
+    total = sum(values.count() for values in querysets)
+    result = {}
+    done = 0
+    for values in querysets:
+        name = values.model.__name__
+        checked, updated = BackfillMeasureCommand.backfill(
+            values,
+            chunk_size,
+            lambda checked: job.progress(done + checked, total, f"Backfilling {name}"),
+        )
+        done += checked
+        result[name] = {"checked": checked, "updated": updated}
+    return result
@@ -0,0 +1,71 @@
+from typing import Callable
+
+from django.core.management.base import BaseCommand
+
+from inventory.models import InventoryChangeFieldValue
+from products.models import ProductFieldValue
+from utils.measure import convert_measures_to_mm
+from utils.model_commons import BaseTemplateField
+
+
+class Command(BaseCommand):
+    help = "Recomputes value_measure_mm for measure field values of products and inventory changes."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--only-missing",
+            action="store_true",
+            help="Only fill in values that have no value_measure_mm yet.",
+        )
+        parser.add_argument("--chunk-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        for model in (ProductFieldValue, InventoryChangeFieldValue):
+            values = self.measure_values(model, options["only_missing"])
+            checked, updated = self.backfill(values, options["chunk_size"])
+            self.stdout.write(
+                f"{model.__name__}: checked {checked}, updated {updated}."
+            )
+
+    @staticmethod
+    def measure_values(model, only_missing: bool = False):
+        values = model.objects.filter(
+            field__field_type=BaseTemplateField.MEASURE,
+            value_measure__isnull=False,
+        )
+        if only_missing:
+            values = values.filter(value_measure_mm__isnull=True)
+        return values
+
+    @staticmethod
+    def backfill(
+        values, chunk_size: int, progress: Callable[[int], None] | None = None
+    ) -> tuple[int, int]:
+        """
+        Walks the values in primary key order, one chunk at a time, and saves only the rows that changed. progress is
+        called with the number of values checked after each chunk.
+        """
+        checked = 0
+        updated = 0
+        last_pk = 0
+        while True:
+            chunk = list(
+                values.filter(pk__gt=last_pk)
+                .order_by("pk")
+                .only("pk", "value_measure", "value_measure_mm")[:chunk_size]
+            )
+            if not chunk:
+                return checked, updated
+            last_pk = chunk[-1].pk
+            checked += len(chunk)
+
+            changed = []
+            millimeters = convert_measures_to_mm(value.value_measure for value in chunk)
+            for value, mm in zip(chunk, millimeters):
+                if value.value_measure_mm != mm:
+                    value.value_measure_mm = mm
+                    changed.append(value)
+            values.model.objects.bulk_update(changed, ["value_measure_mm"])
+            updated += len(changed)
+            if progress is not None:
+                progress(checked)
@@ -0,0 +1,121 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.transaction import atomic, set_rollback
+from django.test.utils import CaptureQueriesContext
+
+from products.models import (
+    ProductTemplate,
+    ProductTemplateField,
+    Product,
+    ProductFieldValue,
+)
+from utils.model_commons import BaseTemplateField
+
+COUPLINGS = ["ERW", "Seamless", "Buttress", "LTC", "STC"]
+DIAMETERS = ['2 3/8"', '2 7/8"', '3 1/2"', '4 1/2"', '5 1/2"', '6 5/8"', '7"', '8 5/8"']
+
+
+class Command(BaseCommand):
+    help = (
+        "Times attribute filtering and sorting against a generated catalog. Everything is created inside a "
+        "transaction that is rolled back, so the database is left untouched."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=100_000)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        with atomic():
+            template = self.generate(options["products"], options["batch_size"])
+            self.run(
+                "filter coupling",
+                options["repeat"],
+                lambda: Product.objects.filter_attrs(template, coupling="ERW"),
+            )
+            self.run(
+                "filter od range and coupling",
+                options["repeat"],
+                lambda: Product.objects.filter_attrs(
+                    template, od__gte='6 5/8"', coupling="ERW"
+                ),
+            )
+            self.run(
+                "filter and order by weight, first page",
+                options["repeat"],
+                lambda: Product.objects.filter_attrs(template, coupling="ERW")
+                .order_by_attr("-weight_per_foot")
+                .values_list("pk", flat=True)[:50],
+            )
+            set_rollback(True)
+
+    def generate(self, count: int, batch_size: int) -> ProductTemplate:
+        start = time.perf_counter()
+        template = ProductTemplate.objects.create(
+            name="Benchmark Pipe", format_string="{{od}} {{coupling}}"
+        )
+        fields = {
+            "od": ProductTemplateField.objects.create(
+                template=template, name="OD", field_type=BaseTemplateField.MEASURE
+            ),
+            "coupling": ProductTemplateField.objects.create(
+                template=template,
+                name="Coupling",
+                field_type=BaseTemplateField.CHOICES,
+                choices=COUPLINGS,
+            ),
+            "weight": ProductTemplateField.objects.create(
+                template=template,
+                name="Weight per Foot",
+                field_type=BaseTemplateField.DECIMAL,
+            ),
+        }
+
+        for offset in range(0, count, batch_size):
+            products = Product.objects.bulk_create(
+                Product(template=template)
+                for _ in range(min(batch_size, count - offset))
+            )
+            values = []
+            for product in products:
+                od = ProductFieldValue(product=product, field=fields["od"])
+                od.value = random.choice(DIAMETERS)
+                values.append(od)
+                values.append(
+                    ProductFieldValue(
+                        product=product,
+                        field=fields["coupling"],
+                        value_choice=random.choice(COUPLINGS),
+                    )
+                )
+                values.append(
+                    ProductFieldValue(
+                        product=product,
+                        field=fields["weight"],
+                        value_decimal=round(random.uniform(4, 60), 2),
+                    )
+                )
+            ProductFieldValue.objects.bulk_create(values)
+
+        self.stdout.write(
+            f"Generated {count} products in {time.perf_counter() - start:.2f}s"
+        )
+        return template
+
+    def run(self, name: str, repeat: int, build_queryset) -> None:
+        timings = []
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                rows = len(list(build_queryset()))
+                timings.append(time.perf_counter() - start)
+
+        timings.sort()
+        self.stdout.write(
+            f"{name}: {rows} rows, {len(queries)} queries, "
+            f"median {timings[len(timings) // 2] * 1000:.1f}ms, best {timings[0] * 1000:.1f}ms"
+        )
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = "Rebuilds product attribute snapshots from their field values, or checks them with --verify."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Report products whose snapshot differs without changing anything.",
+        )
+        parser.add_argument("--chunk-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        checked = 0
+        changed = 0
+        last_pk = 0
+        while True:
+            pks = list(
+                Product.objects.filter(pk__gt=last_pk)
+                .order_by("pk")
+                .values_list("pk", flat=True)[: options["chunk_size"]]
+            )
+            if not pks:
+                break
+            last_pk = pks[-1]
+            checked += len(pks)
+
+            products = Product.objects.filter(pk__in=pks)
+            if options["verify"]:
+                expected = products.build_attributes()
+                for pk, attributes in products.values_list("pk", "attributes"):
+                    if attributes != expected[pk]:
+                        changed += 1
+                        self.stdout.write(
+                            f"product={pk}: snapshot={attributes} values={expected[pk]}"
+                        )
+            else:
+                changed += products.rebuild_attributes()
+
+        if options["verify"]:
+            if changed:
+                raise CommandError(f"{changed} of {checked} snapshots are out of date.")
+            self.stdout.write(self.style.SUCCESS(f"Verified {checked} snapshots."))
+        else:
+            self.stdout.write(
+                self.style.SUCCESS(f"Rebuilt {changed} of {checked} snapshots.")
+            )
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from products.models import Product
+from products.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates the product search index if needed, brings every product's search document up to date and "
+        "repopulates the index."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        checked = 0
+        changed = 0
+        last_pk = 0
+        while True:
+            pks = list(
+                Product.objects.filter(pk__gt=last_pk)
+                .order_by("pk")
+                .values_list("pk", flat=True)[: options["chunk_size"]]
+            )
+            if not pks:
+                break
+            last_pk = pks[-1]
+            checked += len(pks)
+            # Search documents are derived from attribute snapshots, so both are rebuilt together.
+            changed += Product.objects.filter(pk__in=pks).rebuild_attributes()
+
+        rebuild_search_index()
+        self.stdout.write(
+            self.style.SUCCESS(f"Indexed {checked} products, {changed} changed.")
+        )
@@ -1,6 +1,38 @@
+import re
+from decimal import Decimal
+
+from django.core.exceptions import FieldError
 from django.db import models
+from django.db.models import F, OuterRef, Subquery
+from django.db.transaction import atomic
 
+from utils.format_string import render_format_string
+from utils.measure import parse_measure
 from utils.model_commons import BaseTemplateField, BaseFieldValue
+from utils.schema_cache import FieldDescriptor, get_template_schema
+
+# Marks an attribute to be removed from a product's snapshot.
+REMOVE = object()
+
+# Words of a search document or query, ex: "6 5/8\" ERW" is 6, 5, 8 and erw
+SEARCH_TOKEN = re.compile(r"\w+")
+
+
+def build_search_document(
+    format_string: str, template_name: str, attributes: dict
+) -> str:
+    """
+    Returns the text a product is found by: its rendered label, template name and attribute values, normalized to
+    lowercase words so every search backend tokenizes it the same way.
+    """
+    text = " ".join(
+        [
+            render_format_string(format_string, attributes),
+            template_name,
+            *(str(value) for value in attributes.values() if value is not None),
+        ]
+    )
+    return " ".join(SEARCH_TOKEN.findall(text.lower()))
 
 
 class ProductTemplate(models.Model):
@@ -26,6 +58,24 @@ class ProductTemplate(models.Model):
     )
     counting_type = models.TextField(choices=COUNTING_TYPES, default=DISCRETE)
 
+    def save(self, *args, **kwargs) -> None:
+        with atomic():
+            previous = None
+            if self.pk is not None:
+                previous = (
+                    ProductTemplate.objects.filter(pk=self.pk)
+                    .values("name", "format_string")
+                    .first()
+                )
+            super().save(*args, **kwargs)
+
+            # Search documents include the rendered label and template name.
+            if previous is not None and previous != {
+                "name": self.name,
+                "format_string": self.format_string,
+            }:
+                Product.objects.filter(template_id=self.pk).rebuild_attributes()
+
     def __str__(self) -> str:
         return self.name
 
@@ -39,6 +89,232 @@ class ProductTemplateField(BaseTemplateField):
         ProductTemplate, on_delete=models.CASCADE, related_name="fields"
     )
 
+    def save(self, *args, **kwargs) -> None:
+        with atomic():
+            previous = None
+            if self.pk is not None:
+                previous = (
+                    ProductTemplateField.objects.filter(pk=self.pk)
+                    .values("name", "field_type", "static_text")
+                    .first()
+                )
+            super().save(*args, **kwargs)
+
+            # Attribute snapshots are keyed by field name, so they're rebuilt when it changes.
+            current = {
+                "name": self.name,
+                "field_type": self.field_type,
+                "static_text": self.static_text,
+            }
+            if previous is not None and previous != current:
+                Product.objects.filter(
+                    template_id=self.template_id
+                ).rebuild_attributes()
+
+
+class ProductQuerySet(models.QuerySet):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Template whose fields filter_attrs and order_by_attr resolve names against.
+        self._attr_template = None
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._attr_template = self._attr_template
+        return clone
+
+    def _attr_field(self, name: str, template=None) -> FieldDescriptor:
+        """
+        :raises FieldError: If no template was given or the template has no field with this name.
+        """
+        template = template or self._attr_template
+        if template is None:
+            raise FieldError(
+                f"Can't resolve attribute {name!r} without a template, call filter_attrs first."
+            )
+        for field in get_template_schema(template):
+            if field.attr_name == name:
+                return field
+        raise FieldError(f"{template} has no attribute {name!r}.")
+
+    @staticmethod
+    def _attr_value(field: FieldDescriptor, value):
+        """
+        Converts a lookup value to the type stored in the field's sort column.
+
+        :raises ValueError: If the value can't be converted to the field's type.
+        """
+        if isinstance(value, (list, tuple, set)):
+            return [ProductQuerySet._attr_value(field, item) for item in value]
+        if value is None or isinstance(value, bool):
+            return value
+        if field.field_type == BaseTemplateField.INT:
+            return int(value)
+        if field.field_type == BaseTemplateField.DECIMAL:
+            return Decimal(str(value))
+        if field.field_type == BaseTemplateField.MEASURE and isinstance(value, str):
+            return round(parse_measure(value))
+        return value
+
+    def filter_attrs(self, template, **lookups) -> "ProductQuerySet":
+        """
+        Filters products of a template by their typed field values, ex:
+        Product.objects.filter_attrs(template, od__gte="6 5/8in", coupling="ERW")
+
+        Attribute names are the template's field names as identifiers (see BaseTemplateField.attr_name), lookups are
+        any Django lookup on the field's sort column. Each attribute compiles to a subquery driven by the
+        (field, value) indexes on ProductFieldValue.
+
+        :raises FieldError: If the template has no field with a given name.
+        :raises ValueError: If a lookup value can't be converted to its field's type.
+        """
+        queryset = self.filter(template=template)
+        queryset._attr_template = template
+
+        for key, value in lookups.items():
+            name, _, lookup = key.partition("__")
+            field = queryset._attr_field(name)
+            column = BaseFieldValue.SORT_COLUMNS[field.field_type]
+            matches = ProductFieldValue.objects.filter(
+                field_id=field.pk,
+                **{f"{column}__{lookup or 'exact'}": self._attr_value(field, value)},
+            )
+            queryset = queryset.filter(pk__in=matches.values("product_id"))
+
+        return queryset
+
+    def order_by_attr(self, *names: str, template=None) -> "ProductQuerySet":
+        """
+        Orders products by typed field values, prefix a name with "-" for descending order. Products without a value
+        sort last, ties are broken by primary key.
+
+        :raises FieldError: If the template has no field with a given name.
+        """
+        queryset = self
+        ordering = []
+        for name in names:
+            descending = name.startswith("-")
+            field = queryset._attr_field(name.lstrip("-"), template)
+            alias = f"attr_{field.attr_name}"
+            column = BaseFieldValue.SORT_COLUMNS[field.field_type]
+            queryset = queryset.alias(
+                **{
+                    alias: Subquery(
+                        ProductFieldValue.objects.filter(
+                            product=OuterRef("pk"), field_id=field.pk
+                        ).values(column)[:1]
+                    )
+                }
+            )
+            if descending:
+                ordering.append(F(alias).desc(nulls_last=True))
+            else:
+                ordering.append(F(alias).asc(nulls_last=True))
+
+        return queryset.order_by(*ordering, "pk")
+
+    def with_labels(self) -> "ProductQuerySet":
+        """
+        Loads templates up front, so display_name doesn't query per product.
+        """
+        return self.select_related("template")
+
+    def labels(self) -> dict[int, str]:
+        """
+        Renders the display name of every product in the queryset, keyed by product id. Reads plain rows from the
+        attribute snapshots in a single query, without instantiating models.
+        """
+        return {
+            pk: render_format_string(format_string, attributes)
+            for pk, format_string, attributes in self.values_list(
+                "pk", "template__format_string", "attributes"
+            ).iterator()
+        }
+
+    def build_attributes(self) -> dict[int, dict]:
+        """
+        Builds the attribute snapshot of every product in the queryset from its field values, keyed by product id.
+        """
+        attributes = {pk: {} for pk in self.values_list("pk", flat=True)}
+        columns = set(BaseFieldValue.VALUE_COLUMNS.values())
+        rows = ProductFieldValue.objects.filter(product_id__in=attributes).values(
+            "product_id",
+            "field__name",
+            "field__field_type",
+            "field__static_text",
+            *columns,
+        )
+        for row in rows.iterator():
+            field_type = row["field__field_type"]
+            if field_type == BaseTemplateField.STATIC:
+                value = row["field__static_text"]
+            else:
+                value = BaseFieldValue.to_json(
+                    row[BaseFieldValue.VALUE_COLUMNS[field_type]]
+                )
+            attributes[row["product_id"]][row["field__name"]] = value
+        return attributes
+
+    def rebuild_attributes(self, batch_size: int = 1000) -> int:
+        """
+        Rebuilds the attribute snapshots and search documents of every product in the queryset, saving only the
+        ones that changed.
+
+        :return: The number of products that changed.
+        """
+        changed = []
+        attributes = self.build_attributes()
+        products = self.select_related("template").only(
+            "pk",
+            "attributes",
+            "search_document",
+            "template__name",
+            "template__format_string",
+        )
+        for product in products.iterator():
+            document = build_search_document(
+                product.template.format_string,
+                product.template.name,
+                attributes[product.pk],
+            )
+            if (
+                product.attributes != attributes[product.pk]
+                or product.search_document != document
+            ):
+                product.attributes = attributes[product.pk]
+                product.search_document = document
+                changed.append(product)
+        Product.objects.bulk_update(
+            changed, ["attributes", "search_document"], batch_size=batch_size
+        )
+        return len(changed)
+
+    def set_attribute(self, product_id: int, name: str, value=REMOVE) -> None:
+        """
+        Updates a single attribute in a product's snapshot, or removes it when no value is given. The product's
+        search document follows.
+        """
+        with atomic():
+            row = (
+                self.select_for_update(of=("self",))
+                .filter(pk=product_id)
+                .values_list("attributes", "template__format_string", "template__name")
+                .first()
+            )
+            if row is None:
+                return
+            attributes, format_string, template_name = row
+            if value is REMOVE:
+                attributes.pop(name, None)
+            else:
+                attributes[name] = value
+            self.filter(pk=product_id).update(
+                attributes=attributes,
+                search_document=build_search_document(
+                    format_string, template_name, attributes
+                ),
+            )
+
 
 class Product(models.Model):
     """
@@ -49,9 +325,38 @@ class Product(models.Model):
     """
 
     template = models.ForeignKey(ProductTemplate, on_delete=models.PROTECT)
+    attributes = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        help_text="Snapshot of the product's field values keyed by field name, kept in sync by ProductFieldValue.",
+    )
+    search_document = models.TextField(
+        blank=True,
+        editable=False,
+        help_text="Words the product is found by, kept in sync with its attributes. See products.search.",
+    )
+
+    objects = ProductQuerySet.as_manager()
+
+    def save(self, *args, **kwargs) -> None:
+        self.search_document = build_search_document(
+            self.template.format_string, self.template.name, self.attributes
+        )
+        # Changing the template moves the product's daily movements to it, see inventory.signals.
+        with atomic():
+            super().save(*args, **kwargs)
+
+    @property
+    def display_name(self) -> str:
+        """
+        Returns the product rendered with its template's format string. Use Product.objects.with_labels() when
+        rendering many products.
+        """
+        return render_format_string(self.template.format_string, self.attributes)
 
     def __str__(self) -> str:
-        return f"{self.template.name}"
+        return self.display_name or f"{self.template.name}"
 
 
 class ProductFieldValue(BaseFieldValue):
@@ -72,6 +377,28 @@ class ProductFieldValue(BaseFieldValue):
                 name="unique_product_field",
             )
         ]
+        # Attribute filtering and sorting seek on (field, value), see ProductQuerySet.filter_attrs
+        indexes = [
+            models.Index(fields=["field", "value_int"], name="product_value_int_idx"),
+            models.Index(
+                fields=["field", "value_decimal"], name="product_value_decimal_idx"
+            ),
+            models.Index(
+                fields=["field", "value_measure_mm"], name="product_value_measure_idx"
+            ),
+            models.Index(
+                fields=["field", "value_choice"], name="product_value_choice_idx"
+            ),
+        ]
+
+    def save(self, *args, **kwargs) -> None:
+        with atomic():
+            super().save(*args, **kwargs)
+            Product.objects.set_attribute(
+                self.product_id, self.field.name, self.json_value
+            )
+        if ProductFieldValue.product.is_cached(self):
+            self.product.attributes[self.field.name] = self.json_value
 
     def get_owner(self):
         return self.product
@@ -0,0 +1,190 @@
+import time
+
+from django.db import DEFAULT_DB_ALIAS, connections, router
+
+from products.models import SEARCH_TOKEN, Product
+
+# SQLite FTS5 index over Product.search_document, kept in sync by triggers
+FTS_TABLE = "products_product_fts"
+
+SQLITE_INDEX = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        search_document, content='products_product', content_rowid='id'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON products_product BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, search_document) VALUES (new.id, new.search_document);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON products_product BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_document)
+        VALUES ('delete', old.id, old.search_document);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE OF search_document ON products_product BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_document)
+        VALUES ('delete', old.id, old.search_document);
+        INSERT INTO {FTS_TABLE}(rowid, search_document) VALUES (new.id, new.search_document);
+    END
+    """,
+]
+
+POSTGRES_INDEX = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """
+    CREATE INDEX IF NOT EXISTS product_search_tsv_idx ON products_product
+    USING gin (to_tsvector('simple', search_document))
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS product_search_trgm_idx ON products_product
+    USING gin (search_document gin_trgm_ops)
+    """,
+]
+
+# Most words of a query that are searched for
+MAX_TOKENS = 10
+
+# Seconds until a database found without a search index is checked again, so an index installed by another process
+# is picked up without a restart.
+RECHECK_SECONDS = 60
+
+# Databases with their search index installed, they keep it for the life of the process
+_installed: set[str] = set()
+
+# When each database was last found without a search index, by time.monotonic()
+_missing_since: dict[str, float] = {}
+
+
+def install_search_index(using: str = DEFAULT_DB_ALIAS) -> bool:
+    """
+    Creates the search index of the database's backend if it doesn't exist yet. Databases other than SQLite and
+    Postgres have no index and search with LIKE scans.
+
+    :return: Whether the database has a search index.
+    """
+    connection = connections[using]
+    statements = {"sqlite": SQLITE_INDEX, "postgresql": POSTGRES_INDEX}.get(
+        connection.vendor
+    )
+    if statements is None:
+        return False
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+    _installed.add(using)
+    _missing_since.pop(using, None)
+    return True
+
+
+def rebuild_search_index(using: str = DEFAULT_DB_ALIAS) -> None:
+    """
+    Repopulates the SQLite index from the product table. Postgres indexes are always complete.
+    """
+    connection = connections[using]
+    if install_search_index(using) and connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def has_search_index(using: str = DEFAULT_DB_ALIAS) -> bool:
+    """
+    Checks whether the database has its search index. Only finding one is remembered for good, a missing index is
+    checked again after RECHECK_SECONDS.
+    """
+    if using in _installed:
+        return True
+    checked = _missing_since.get(using)
+    if checked is not None and time.monotonic() - checked < RECHECK_SECONDS:
+        return False
+
+    connection = connections[using]
+    if connection.vendor == "sqlite":
+        installed = FTS_TABLE in connection.introspection.table_names()
+    elif connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM pg_indexes WHERE indexname = 'product_search_tsv_idx'"
+            )
+            installed = cursor.fetchone() is not None
+    else:
+        installed = False
+
+    if installed:
+        _installed.add(using)
+        _missing_since.pop(using, None)
+    else:
+        _missing_since[using] = time.monotonic()
+    return installed
+
+
+def search_tokens(query: str) -> list[str]:
+    return SEARCH_TOKEN.findall(query.lower())[:MAX_TOKENS]
+
+
+def search_products(
+    query: str,
+    limit: int = 20,
+    offset: int = 0,
+    template_id: int | None = None,
+    using: str | None = None,
+) -> list[int]:
+    """
+    Finds products whose search document contains every word of the query, the last word as a prefix so results
+    narrow as the query is typed. Results are ranked by relevance, best first. Searches the database the router
+    reads products from unless given one.
+
+    :return: A page of product ids.
+    """
+    tokens = search_tokens(query)
+    if not tokens:
+        return []
+
+    using = using or router.db_for_read(Product)
+    connection = connections[using]
+    if not has_search_index(using):
+        return _search_like(tokens, limit, offset, template_id, using)
+
+    template_filter = ""
+    template_params = []
+    if template_id is not None:
+        template_filter = "AND p.template_id = %s"
+        template_params = [template_id]
+
+    if connection.vendor == "sqlite":
+        # Quoted, so words like "and" and "or" aren't parsed as operators.
+        match = " ".join(f'"{token}"' for token in tokens) + "*"
+        sql = f"""
+            SELECT p.id FROM {FTS_TABLE} f JOIN products_product p ON p.id = f.rowid
+            WHERE {FTS_TABLE} MATCH %s {template_filter}
+            ORDER BY f.rank, p.id LIMIT %s OFFSET %s
+        """
+        params = [match, *template_params, limit, offset]
+    else:
+        tsquery = " & ".join(tokens) + ":*"
+        sql = f"""
+            SELECT p.id FROM products_product p
+            WHERE to_tsvector('simple', p.search_document) @@ to_tsquery('simple', %s) {template_filter}
+            ORDER BY ts_rank(to_tsvector('simple', p.search_document), to_tsquery('simple', %s))
+                + similarity(p.search_document, %s) DESC, p.id
+            LIMIT %s OFFSET %s
+        """
+        params = [tsquery, *template_params, tsquery, " ".join(tokens), limit, offset]
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _search_like(tokens, limit, offset, template_id, using) -> list[int]:
+    products = Product.objects.using(using)
+    for token in tokens:
+        products = products.filter(search_document__contains=token)
+    if template_id is not None:
+        products = products.filter(template_id=template_id)
+    return list(
+        products.order_by("pk").values_list("pk", flat=True)[offset : offset + limit]
+    )
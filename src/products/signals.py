@@ -0,0 +1,19 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from products.models import Product, ProductFieldValue, ProductTemplateField
+
+
+@receiver(post_delete, sender=ProductFieldValue)
+def remove_value_from_attributes(sender, instance, origin=None, **kwargs) -> None:
+    """
+    Removes a deleted value from its product's attribute snapshot, unless the product itself is being deleted.
+    """
+    if isinstance(origin, Product) or getattr(origin, "model", None) is Product:
+        return
+    Product.objects.set_attribute(instance.product_id, instance.field.name)
+
+
+@receiver(post_delete, sender=ProductTemplateField)
+def invalidate_product_schema(sender, instance, **kwargs) -> None:
+    instance.invalidate_schema()
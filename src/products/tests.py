@@ -1,3 +1,72 @@
+import re
+import time
+from unittest import mock
+
+from django.db import connection
 from django.test import TestCase
+from django.urls import reverse
+
+from customers.tests import MALFORMED_CURSORS
+from inventory.tests import make_product
+from products import search
+from products.forms import ProductMultipleChoiceField
+
+
+class ProductPickerTests(TestCase):
+    def setUp(self):
+        self.products = [make_product() for _ in range(3)]
+
+    def test_lists_products(self):
+        url = reverse("products:product_picker")
+        response = self.client.get(url, {"name": "products"})
+        self.assertEqual(list(response.context["products"]), self.products)
+
+    def test_malformed_cursor_returns_first_page(self):
+        url = reverse("products:product_picker")
+        for cursor in MALFORMED_CURSORS:
+            with self.subTest(cursor):
+                response = self.client.get(url, {"name": "products", "cursor": cursor})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.context["products"]), 3)
+
+
+class ProductPickerWidgetTests(TestCase):
+    def test_renders_selected_products(self):
+        products = [make_product() for _ in range(3)]
+        field = ProductMultipleChoiceField()
+        with self.assertNumQueries(1):
+            html = field.widget.render("products", [products[0].pk, products[2].pk])
+        self.assertInHTML(
+            f'<input type="checkbox" name="products" value="{products[2].pk}" checked>',
+            html,
+        )
+        self.assertNotIn(f'value="{products[1].pk}"', html)
+        # The search box must not be posted with the form
+        search_box = re.search(r'<input type="search"[^>]*>', html)[0]
+        self.assertNotRegex(search_box, r"\sname=")
+
+
+class HasSearchIndexTests(TestCase):
+    def setUp(self):
+        for state in [search._installed, search._missing_since]:
+            state.clear()
+            self.addCleanup(state.clear)
+
+    def test_rechecks_missing_index(self):
+        self.assertFalse(search.has_search_index())
+
+        # Installed by another process, ex: the rebuild_search_index command
+        with connection.cursor() as cursor:
+            for statement in search.SQLITE_INDEX:
+                cursor.execute(statement)
+        self.assertFalse(search.has_search_index())
+
+        later = time.monotonic() + search.RECHECK_SECONDS
+        with mock.patch("products.search.time.monotonic", return_value=later):
+            self.assertTrue(search.has_search_index())
+        self.assertTrue(search.has_search_index())
 
-# Create your tests here.
+    def test_install_is_remembered(self):
+        self.assertFalse(search.has_search_index())
+        self.assertTrue(search.install_search_index())
+        self.assertTrue(search.has_search_index())
@@ -0,0 +1,17 @@
+from django.urls import path
+
+from products.views import (
+    product_autocomplete_view,
+    product_picker_view,
+    product_search_view,
+    schema_cache_stats_view,
+)
+
+app_name = "products"
+
+urlpatterns = [
+    path("schema-cache/", schema_cache_stats_view, name="schema_cache_stats"),
+    path("search/", product_search_view, name="product_search"),
+    path("autocomplete/", product_autocomplete_view, name="product_autocomplete"),
+    path("picker/", product_picker_view, name="product_picker"),
+]
@@ -1,3 +1,129 @@
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponseBadRequest, JsonResponse
 from django.shortcuts import render
+from django.views.decorators.http import require_GET
 
-# Create your views here.
+from products.models import Product
+from products.search import search_products
+from utils.db_routing import replica_reads
+from utils.formsets import PREFIX
+from utils.pagination import keyset_paginate
+from utils.schema_cache import schema_cache_stats
+
+SEARCH_PAGE_SIZE = 20
+AUTOCOMPLETE_SIZE = 10
+PICKER_PAGE_SIZE = 25
+
+
+@staff_member_required
+def schema_cache_stats_view(request):
+    """
+    Reports the template schema cache counters of the process serving the request.
+    """
+    return JsonResponse(schema_cache_stats())
+
+
+def ranked_products(product_ids: list[int]) -> list[Product]:
+    products = Product.objects.with_labels().in_bulk(product_ids)
+    return [products[pk] for pk in product_ids if pk in products]
+
+
+@require_GET
+@replica_reads()
+def product_search_view(request):
+    """
+    Returns a page of products matching the q query parameter as JSON, best matches first. Optionally narrowed to
+    the template query parameter.
+    """
+    try:
+        page = max(int(request.GET.get("page", 1)), 1)
+        template_id = (
+            int(request.GET["template"]) if request.GET.get("template") else None
+        )
+    except ValueError:
+        return HttpResponseBadRequest("page and template must be integers.")
+
+    # One extra result tells whether there's a next page.
+    product_ids = search_products(
+        request.GET.get("q", ""),
+        limit=SEARCH_PAGE_SIZE + 1,
+        offset=(page - 1) * SEARCH_PAGE_SIZE,
+        template_id=template_id,
+    )
+    products = ranked_products(product_ids[:SEARCH_PAGE_SIZE])
+    return JsonResponse(
+        {
+            "results": [
+                {
+                    "id": product.pk,
+                    "label": str(product),
+                    "template": product.template.name,
+                }
+                for product in products
+            ],
+            "page": page,
+            "has_next": len(product_ids) > SEARCH_PAGE_SIZE,
+        }
+    )
+
+
+@require_GET
+@replica_reads()
+def product_autocomplete_view(request):
+    """
+    Renders the best matches for the q query parameter as a list of options, for htmx to swap in as the user types.
+    """
+    products = ranked_products(
+        search_products(request.GET.get("q", ""), limit=AUTOCOMPLETE_SIZE)
+    )
+    return render(
+        request, "products/partials/autocomplete.html", {"products": products}
+    )
+
+
+@require_GET
+def product_picker_view(request):
+    """
+    Renders a page of products for a ProductPickerWidget to pick from, as unchecked boxes for the field given by
+    the name query parameter. Searches when given q, otherwise lists every product.
+    """
+    name = request.GET.get("name", "")
+    if not PREFIX.match(name):
+        return HttpResponseBadRequest("name must be a form field name.")
+
+    query = request.GET.get("q", "").strip()
+    following = request.GET.copy()
+    if query:
+        try:
+            page = max(int(request.GET.get("page", 1)), 1)
+        except ValueError:
+            return HttpResponseBadRequest("page must be an integer.")
+        product_ids = search_products(
+            query,
+            limit=PICKER_PAGE_SIZE + 1,
+            offset=(page - 1) * PICKER_PAGE_SIZE,
+        )
+        products = ranked_products(product_ids[:PICKER_PAGE_SIZE])
+        has_next = len(product_ids) > PICKER_PAGE_SIZE
+        following["page"] = page + 1
+    else:
+        page = keyset_paginate(
+            Product.objects.with_labels(),
+            ("pk",),
+            request.GET.get("cursor"),
+            PICKER_PAGE_SIZE,
+        )
+        products = page.object_list
+        has_next = page.has_next
+        following["cursor"] = page.next_cursor or ""
+
+    return render(
+        request,
+        "products/partials/product_picker_rows.html",
+        {
+            "name": name,
+            "products": products,
+            "has_next": has_next,
+            "next_query": following.urlencode(),
+        },
+    )
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -36,18 +37,24 @@ INSTALLED_APPS = [
     "django.contrib.contenttypes",
     "django.contrib.sessions",
     "django.contrib.messages",
+    # Before staticfiles, so runserver serves static files through WhiteNoise like production does.
+    "whitenoise.runserver_nostatic",
     "django.contrib.staticfiles",
+    "django.forms",
     "customers",
     "products",
     "inventory",
+    "jobs",
 ]
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "utils.db_routing.ReplicaMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -69,6 +76,12 @@ TEMPLATES = [
     },
 ]
 
+# Notification group formsets post a few fields per address, customers can have hundreds of addresses.
+DATA_UPLOAD_MAX_NUMBER_FIELDS = 10000
+
+# Widgets render with the project's templates, so they can be overridden in templates/
+FORM_RENDERER = "django.forms.renderers.TemplatesSetting"
+
 WSGI_APPLICATION = "runnersutah.wsgi.application"
 
 
@@ -79,9 +92,70 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        # SQLite can't lock rows, writers take the database lock when their transaction starts instead, so stock
+        # checked inside a transaction can't change before it's written. See inventory.services.
+        "OPTIONS": {"transaction_mode": "IMMEDIATE", "timeout": 20},
+        # A file rather than memory, so tests of concurrent writers take the database lock like production does.
+        "TEST": {"NAME": BASE_DIR / "test_db.sqlite3"},
     }
 }
 
+# Reports, exports and searches read from this replica when it's configured, see utils.db_routing. Locally, point
+# REPLICA_DATABASE at a copy of the database kept up to date by the simulate_replication command.
+if os.environ.get("REPLICA_DATABASE"):
+    DATABASES["replica"] = {
+        "ENGINE": "django.db.backends.sqlite3",
+        # Opened read only, so a misrouted write fails instead of being lost at the next copy.
+        "NAME": f"file:{os.environ['REPLICA_DATABASE']}?mode=ro",
+        "OPTIONS": {"uri": True, "timeout": 20},
+    }
+
+DATABASE_ROUTERS = ["utils.db_routing.ReplicaRouter"]
+
+# Seconds a session reads from the primary after writing, should exceed the replication lag.
+REPLICA_PIN_SECONDS = int(os.environ.get("REPLICA_PIN_SECONDS", 5))
+
+# Set REPLICA_READS=0 to send every read to the primary, ex: while the replica lags too far behind.
+REPLICA_READS = os.environ.get("REPLICA_READS", "1") != "0"
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Template schema version stamps live here. The cache is a table of the primary database, so Gunicorn workers, run_jobs
+# processes and commands all see a field saved in any of them. Create it with createcachetable, tests create it
+# themselves.
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "django_cache",
+    }
+}
+
+
+# Email
+# https://docs.djangoproject.com/en/5.2/topics/email/
+# Notifications are sent by the send_notifications command, never during a request.
+
+EMAIL_BACKEND = os.environ.get(
+    "EMAIL_BACKEND", "django.core.mail.backends.smtp.EmailBackend"
+)
+EMAIL_HOST = os.environ.get("EMAIL_HOST", "localhost")
+EMAIL_PORT = int(os.environ.get("EMAIL_PORT", 25))
+EMAIL_HOST_USER = os.environ.get("EMAIL_HOST_USER", "")
+EMAIL_HOST_PASSWORD = os.environ.get("EMAIL_HOST_PASSWORD", "")
+EMAIL_USE_TLS = os.environ.get("EMAIL_USE_TLS", "") == "1"
+EMAIL_TIMEOUT = 10
+DEFAULT_FROM_EMAIL = os.environ.get(
+    "DEFAULT_FROM_EMAIL", "notifications@runnersutah.com"
+)
+
+
+# Jobs
+# Files produced by background jobs, such as exports, downloadable from the jobs page.
+
+JOB_FILES_DIR = BASE_DIR.parent / "media" / "jobs"
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -118,6 +192,20 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
 STATIC_URL = "static/"
+STATIC_ROOT = BASE_DIR.parent / "staticfiles"
+STATICFILES_DIRS = [BASE_DIR.parent / "static"]
+
+# collectstatic fingerprints every file and writes gzip and brotli variants next to it. WhiteNoise serves the
+# fingerprinted files with far-future cache headers, and the smallest variant the browser accepts.
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {
+        "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage"
+    },
+}
+
+# Tests render templates without the manifest collectstatic writes
+TEST_RUNNER = "utils.test_runner.TestRunner"
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
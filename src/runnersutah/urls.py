@@ -22,4 +22,7 @@ from django.urls.conf import include
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("customers/", include("customers.urls")),
+    path("inventory/", include("inventory.urls")),
+    path("products/", include("products.urls")),
+    path("jobs/", include("jobs.urls")),
 ]
@@ -0,0 +1,168 @@
+import logging
+import time
+from collections import Counter
+from contextlib import ContextDecorator, ExitStack
+from contextvars import Context, ContextVar, copy_context
+from typing import Iterable, Iterator
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+logger = logging.getLogger("runnersutah.db")
+
+# Alias of the read replica, reads only go there when it's configured in DATABASES
+REPLICA_DB_ALIAS = "replica"
+
+# App label of the DatabaseCache table, which must be current and isn't data users read back
+CACHE_APP_LABEL = "django_cache"
+
+# Session key holding the time until which the session reads from the primary, so it sees its own writes
+PIN_SESSION_KEY = "_db_pinned_until"
+
+# Whether the code running may read from the replica
+_replica_reads: ContextVar[bool] = ContextVar("replica_reads", default=False)
+
+# Whether the current request must see recent writes of its session, so it reads from the primary
+_pinned: ContextVar[bool] = ContextVar("pinned_to_primary", default=False)
+
+# Whether the current request or block wrote, so it reads its own writes from the primary
+_wrote: ContextVar[bool] = ContextVar("wrote", default=False)
+
+
+class replica_reads(ContextDecorator):
+    """
+    Lets reads inside the block, or the decorated view, go to the replica. Only for code that can tolerate data a few
+    seconds old, such as reports and exports. Reads after a write, or in a request pinned by a recent write, still go
+    to the primary.
+    """
+
+    def _recreate_cm(self):
+        # A decorated view can run in several threads at once, each needs its own token.
+        return type(self)()
+
+    def __enter__(self):
+        self._token = _replica_reads.set(True)
+        return self
+
+    def __exit__(self, *exc_info):
+        _replica_reads.reset(self._token)
+        return False
+
+
+def replica_iterator(iterable: Iterable) -> Iterator:
+    """
+    Iterates inside replica_reads, for streaming responses that query after their view has returned. Must be called
+    inside the request: ReplicaMiddleware resets the request's routing state before the response is iterated, so the
+    iteration runs in a copy of the context taken here, and a request pinned to the primary keeps reading from it.
+    """
+    context = copy_context()
+    context.run(_replica_reads.set, True)
+    return _iterate_in(context, iter(iterable))
+
+
+def _iterate_in(context: Context, iterator: Iterator) -> Iterator:
+    while True:
+        try:
+            item = context.run(next, iterator)
+        except StopIteration:
+            return
+        yield item
+
+
+def has_replica() -> bool:
+    return REPLICA_DB_ALIAS in settings.DATABASES
+
+
+class ReplicaRouter:
+    """
+    Sends writes to the primary and reads to the replica, for code that opted in with replica_reads, unless
+    REPLICA_READS is off. A write pins the rest of the request to the primary, and ReplicaMiddleware keeps its session
+    pinned for REPLICA_PIN_SECONDS. The cache table is always read from the primary, and writing it pins nothing.
+    """
+
+    def db_for_read(self, model, **hints) -> str:
+        if (
+            model._meta.app_label != CACHE_APP_LABEL
+            and _replica_reads.get()
+            and not (_pinned.get() or _wrote.get())
+            and has_replica()
+            and getattr(settings, "REPLICA_READS", True)
+        ):
+            return REPLICA_DB_ALIAS
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints) -> str:
+        if model._meta.app_label != CACHE_APP_LABEL:
+            _wrote.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints) -> bool:
+        # Both aliases hold the same data.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints) -> bool:
+        # The replica receives its schema through replication.
+        return db != REPLICA_DB_ALIAS
+
+
+class AliasCounter:
+    """
+    Counts the queries each database alias serves, see connection.execute_wrapper.
+    """
+
+    def __init__(self):
+        self.queries = Counter()
+
+    def wrapper(self, alias: str):
+        def execute(execute, sql, params, many, context):
+            self.queries[alias] += 1
+            logger.debug("[%s] %s", alias, sql)
+            return execute(sql, params, many, context)
+
+        return execute
+
+    def __str__(self) -> str:
+        return ", ".join(
+            f"{alias}={count}" for alias, count in sorted(self.queries.items())
+        )
+
+
+class ReplicaMiddleware:
+    """
+    Pins requests to the primary when they may write, or follow a write of their session within REPLICA_PIN_SECONDS,
+    so users always see their own changes. When DEBUG is on, responses report the queries served by each alias in the
+    X-DB-Aliases header. Must come after SessionMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        # Context variables outlive requests in a worker thread, so every request starts over.
+        unsafe = request.method not in ("GET", "HEAD", "OPTIONS")
+        replica_token = _replica_reads.set(False)
+        wrote_token = _wrote.set(False)
+        pinned_token = _pinned.set(
+            unsafe or request.session.get(PIN_SESSION_KEY, 0) > time.time()
+        )
+        counter = AliasCounter()
+        try:
+            with ExitStack() as stack:
+                if settings.DEBUG:
+                    for alias in connections:
+                        stack.enter_context(
+                            connections[alias].execute_wrapper(counter.wrapper(alias))
+                        )
+                response = self.get_response(request)
+            if unsafe or _wrote.get():
+                request.session[PIN_SESSION_KEY] = time.time() + getattr(
+                    settings, "REPLICA_PIN_SECONDS", 5
+                )
+        finally:
+            _pinned.reset(pinned_token)
+            _wrote.reset(wrote_token)
+            _replica_reads.reset(replica_token)
+
+        if settings.DEBUG:
+            response["X-DB-Aliases"] = str(counter)
+        return response
@@ -0,0 +1,39 @@
+import re
+from functools import lru_cache
+from typing import Any, Mapping
+
+# Matches placeholders like {{diameter}} or {{ weight per foot }}
+PLACEHOLDER = re.compile(r"{{\s*(.+?)\s*}}")
+
+# A compiled format string, as (literal text, placeholder name or None) pairs.
+Plan = tuple[tuple[str, str | None], ...]
+
+
+@lru_cache(maxsize=1024)
+def compile_format_string(format_string: str) -> Plan:
+    """
+    Splits a template format string into literal text and placeholder names, once per distinct string. Plans are
+    cached by the string itself, so editing a template's format_string compiles a new plan on next use.
+    """
+    plan = []
+    position = 0
+    for match in PLACEHOLDER.finditer(format_string):
+        plan.append((format_string[position : match.start()], match.group(1)))
+        position = match.end()
+    if position < len(format_string):
+        plan.append((format_string[position:], None))
+    return tuple(plan)
+
+
+def render_format_string(format_string: str, values: Mapping[str, Any]) -> str:
+    """
+    Renders a template format string, placeholders without a value are left blank.
+    """
+    parts = []
+    for literal, name in compile_format_string(format_string):
+        parts.append(literal)
+        if name is not None:
+            value = values.get(name)
+            if value is not None:
+                parts.append(str(value))
+    return "".join(parts)
@@ -0,0 +1,129 @@
+import re
+from functools import lru_cache
+from pathlib import Path
+
+from django.core.exceptions import ValidationError
+from django.dispatch import receiver
+from django.forms import BaseFormSet, ModelChoiceField
+from django.template.loader import render_to_string
+from django.utils.autoreload import file_changed
+
+# Formset classes the "Add Form" button may ask for, by name.
+FORMSET_REGISTRY: dict[str, type[BaseFormSet]] = {}
+
+# Formset prefixes, ex: notification_group_formset-2-emails
+PREFIX = re.compile(r"^[\w-]+$")
+
+PLACEHOLDER = "__prefix__"
+
+
+class ExistingObjectField(ModelChoiceField):
+    """
+    Primary key field of a model formset's forms, resolved among the objects the formset already loaded instead of
+    with a query per form.
+    """
+
+    def __init__(self, formset, **kwargs):
+        super().__init__(**kwargs)
+        self.formset = formset
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        instance = self.formset._existing_object(
+            self.formset.model._meta.pk.to_python(value)
+        )
+        if instance is None:
+            raise ValidationError(
+                self.error_messages["invalid_choice"], code="invalid_choice"
+            )
+        return instance
+
+
+class ExistingObjectsMixin:
+    """
+    Model formset mixin that validates submitted primary keys without a query per form, see ExistingObjectField.
+    """
+
+    def add_fields(self, form, index):
+        super().add_fields(form, index)
+        name = self.model._meta.pk.name
+        field = form.fields[name]
+        form.fields[name] = ExistingObjectField(
+            self,
+            queryset=field.queryset,
+            initial=field.initial,
+            required=False,
+            widget=field.widget,
+        )
+
+
+def register_formset(name: str, formset_class: type[BaseFormSet]) -> None:
+    FORMSET_REGISTRY[name] = formset_class
+
+
+def get_formset_name(formset: BaseFormSet) -> str:
+    """
+    :raises LookupError: If the formset's class isn't registered.
+    """
+    for name, formset_class in FORMSET_REGISTRY.items():
+        if type(formset) is formset_class:
+            return name
+    raise LookupError(f"{type(formset).__name__} is not a registered formset.")
+
+
+def assign_formset_names(formset: BaseFormSet) -> None:
+    """
+    Sets formset_class on a formset and every formset nested in its forms, the name the "Add Form" button sends.
+    """
+    formset.formset_class = get_formset_name(formset)
+
+    for form in formset.forms:
+        for nested in getattr(form, "nested", ()):
+            assign_formset_names(nested)
+
+    for nested in getattr(formset.empty_form, "nested", ()):
+        assign_formset_names(nested)
+
+
+@lru_cache(maxsize=256)
+def _empty_form_parts(name: str, prefix: str) -> tuple[str, ...]:
+    """
+    Renders the empty form of a registered formset once, split around the index placeholder.
+    """
+    formset = FORMSET_REGISTRY[name](prefix=prefix)
+    empty_form = formset.empty_form
+    for nested in getattr(empty_form, "nested", ()):
+        assign_formset_names(nested)
+
+    html = render_to_string("base/partials/form.html", {"form": empty_form})
+    return tuple(html.split(PLACEHOLDER))
+
+
+def render_empty_form(name: str, prefix: str, index: int) -> str:
+    """
+    Returns the HTML of a new form for a registered formset at the given index. Only the first render of each
+    formset and prefix does any form work, later ones just substitute the index.
+
+    :raises LookupError: If the formset isn't registered.
+    :raises ValueError: If the prefix isn't a valid formset prefix.
+    """
+    if name not in FORMSET_REGISTRY:
+        raise LookupError(f"{name!r} is not a registered formset.")
+    if not PREFIX.match(prefix):
+        raise ValueError(f"{prefix!r} is not a valid formset prefix.")
+    return str(index).join(_empty_form_parts(name, prefix))
+
+
+def clear_empty_form_cache() -> None:
+    _empty_form_parts.cache_clear()
+
+
+@receiver(file_changed)
+def clear_empty_form_cache_on_template_change(sender, file_path: Path, **kwargs):
+    """
+    Drops rendered forms when a template is edited under the development server. Form definitions are Python, so
+    changing them restarts the process and empties the cache anyway.
+    """
+    if file_path.suffix == ".html":
+        clear_empty_form_cache()
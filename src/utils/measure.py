@@ -1,4 +1,124 @@
+import re
+from fractions import Fraction
+from functools import lru_cache
+from typing import Iterable
 
-def convert_measure_to_mm(measure: str) -> float:
-    """todo add functionality"""
-    return 0.0
+# Length of one unit in millimeters.
+UNITS = {
+    "mm": 1,
+    "millimeter": 1,
+    "millimeters": 1,
+    "cm": 10,
+    "centimeter": 10,
+    "centimeters": 10,
+    "m": 1000,
+    "meter": 1000,
+    "meters": 1000,
+    "in": 25.4,
+    "inch": 25.4,
+    "inches": 25.4,
+    '"': 25.4,
+    "''": 25.4,
+    "″": 25.4,
+    "ft": 304.8,
+    "foot": 304.8,
+    "feet": 304.8,
+    "'": 304.8,
+    "′": 304.8,
+    "yd": 914.4,
+    "yard": 914.4,
+    "yards": 914.4,
+}
+
+# One number and its unit, ex: 6 5/8", 3-1/2in, 5/8, 168.3 mm, 2', 1,219.2 mm. Commas separate thousands in groups
+# of three, or follow a unit to separate components, ex: 2', 3".
+COMPONENT = re.compile(
+    r"""
+    \s*
+    (?:
+        (?P<numerator>\d+)\s*/\s*(?P<denominator>\d+)
+        |
+        (?P<whole>(?:\d{1,3}(?:,\d{3})+(?!\d)|\d+)(?:\.\d*)?|\.\d+)
+        (?:[\s-]+(?P<fraction_numerator>\d+)\s*/\s*(?P<fraction_denominator>\d+))?
+    )
+    \s*
+    (?P<unit>[a-z]+|''|["'″′])?
+    \.?(?P<separator>[\s,]*)
+    """,
+    re.VERBOSE,
+)
+
+FOOT = UNITS["ft"]
+INCH = UNITS["in"]
+
+
+@lru_cache(maxsize=4096)
+def parse_measure(measure: str, default_unit: str = "in") -> float:
+    """
+    Parses a measurement to millimeters. Accepts imperial fractions, decimals and metric units, ex: 6 5/8",
+    2' 3-1/2", 6.625in, 168.3 mm, 1,219.2 mm. A number without a unit is read as inches after feet, otherwise as
+    default_unit. Results are cached since the same sizes are parsed over and over.
+
+    :raises ValueError: If the measurement can't be parsed.
+    """
+    text = measure.strip().lower()
+    if not text:
+        raise ValueError("Empty measurement.")
+
+    total = 0.0
+    previous_unit = None
+    position = 0
+    while position < len(text):
+        match = COMPONENT.match(text, position)
+        if match is None or match.end() == position:
+            raise ValueError(f"Can't parse measurement {measure!r}.")
+        position = match.end()
+
+        if match["numerator"]:
+            if int(match["denominator"]) == 0:
+                raise ValueError(f"Division by zero in measurement {measure!r}.")
+            number = Fraction(int(match["numerator"]), int(match["denominator"]))
+        else:
+            number = Fraction(match["whole"].replace(",", ""))
+            if match["fraction_numerator"]:
+                if int(match["fraction_denominator"]) == 0:
+                    raise ValueError(f"Division by zero in measurement {measure!r}.")
+                number += Fraction(
+                    int(match["fraction_numerator"]), int(match["fraction_denominator"])
+                )
+
+        unit = match["unit"]
+        if unit is None and "," in match["separator"] and position < len(text):
+            raise ValueError(f"Ambiguous comma in measurement {measure!r}.")
+        if unit is None:
+            unit_mm = INCH if previous_unit == FOOT else UNITS[default_unit]
+        elif unit in UNITS:
+            unit_mm = UNITS[unit]
+        else:
+            raise ValueError(f"Unknown unit {unit!r} in measurement {measure!r}.")
+
+        total += float(number) * unit_mm
+        previous_unit = unit_mm
+
+    return total
+
+
+def convert_measure_to_mm(measure: str) -> int | None:
+    """
+    Converts a measurement to whole millimeters for the value_measure_mm sort column.
+
+    :return: The rounded length in millimeters, or None if the measurement can't be parsed.
+    """
+    try:
+        return round(parse_measure(measure))
+    except ValueError:
+        return None
+
+
+def convert_measures_to_mm(measures: Iterable[str]) -> list[int | None]:
+    """
+    Converts many measurements at once, parsing each distinct string only once.
+    """
+    measures = list(measures)
+    converted = {measure: convert_measure_to_mm(measure) for measure in set(measures)}
+    return [converted[measure] for measure in measures]
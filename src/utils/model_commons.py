@@ -1,9 +1,39 @@
-from decimal import Decimal
+import re
+from decimal import Decimal, InvalidOperation
 
 from django.db import models
+from django.db.models.fields.files import FieldFile
 from django.db.models.fields.related import ForeignKey
+from django.db.transaction import on_commit
 
-from utils.measure import convert_measure_to_mm
+from utils.measure import convert_measure_to_mm, parse_measure
+from utils.schema_cache import invalidate_template_schema
+
+# Decimal values are stored with 4 decimal places.
+DECIMAL_QUANTUM = Decimal("0.0001")
+
+
+def parse_decimal(value: str | int | Decimal) -> Decimal:
+    """
+    Converts a value to a finite decimal, Decimal() alone also accepts "NaN" and "Infinity".
+
+    :raises ValueError: If the value isn't a finite decimal number.
+    """
+    try:
+        parsed = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise ValueError(f"{value!r} is not a decimal.")
+    if not parsed.is_finite():
+        raise ValueError(f"{value!r} is not a decimal.")
+    return parsed
+
+
+def quantize_sum(value) -> Decimal:
+    """
+    Rounds a database sum of decimal values to the stored decimal places. SQLite sums decimals as floats, ex: a sum
+    of 942.18 can come back as 942.180000000001.
+    """
+    return Decimal(value or 0).quantize(DECIMAL_QUANTUM)
 
 
 class BaseTemplateField(models.Model):
@@ -47,6 +77,25 @@ class BaseTemplateField(models.Model):
     def __str__(self) -> str:
         return f"{self.template.name}_{self.name}"
 
+    def save(self, *args, **kwargs) -> None:
+        super().save(*args, **kwargs)
+        self.invalidate_schema()
+
+    def invalidate_schema(self) -> None:
+        """
+        Drops the cached schema of this field's template in every process, once the change is committed.
+        """
+        template_model = self._meta.get_field("template").related_model
+        template_pk = self.template_id
+        on_commit(lambda: invalidate_template_schema(template_model, template_pk))
+
+    @property
+    def attr_name(self) -> str:
+        """
+        Returns the field name as an identifier, ex: "Weight per Foot" -> "weight_per_foot"
+        """
+        return re.sub(r"\W+", "_", self.name.strip().lower()).strip("_")
+
 
 class BaseFieldValue(models.Model):
     """
@@ -66,6 +115,22 @@ class BaseFieldValue(models.Model):
     # Hidden fields (for sorting and similar additional functionality)
     value_measure_mm = models.IntegerField(blank=True, null=True)
 
+    # Column holding the value of each field type, static values live on the template field instead.
+    VALUE_COLUMNS = {
+        BaseTemplateField.TEXT: "value_text",
+        BaseTemplateField.INT: "value_int",
+        BaseTemplateField.DECIMAL: "value_decimal",
+        BaseTemplateField.CHOICES: "value_choice",
+        BaseTemplateField.MEASURE: "value_measure",
+        BaseTemplateField.FILE: "value_file",
+    }
+
+    # Column used to filter and sort by each field type, measures compare by their length in millimeters.
+    SORT_COLUMNS = {
+        **VALUE_COLUMNS,
+        BaseTemplateField.MEASURE: "value_measure_mm",
+    }
+
     class Meta:
         abstract = True
 
@@ -89,16 +154,72 @@ class BaseFieldValue(models.Model):
         super().save(*args, **kwargs)
 
     @property
-    def value(self) -> str | int | Decimal:
+    def value(self) -> str | int | Decimal | None:
         """
         Returns the value of the field.
         """
-        return {
-            "text": self.value_text,
-            "int": self.value_int,
-            "decimal": self.value_decimal,
-            "choices": self.value_choice,
-            "measure": self.value_measure,
-            "static": self.field.static_text,
-            "file": self.value_file.url,
-        }[self.field.field_type]
+        field_type = self.field.field_type
+        if field_type == BaseTemplateField.STATIC:
+            return self.field.static_text
+        if field_type == BaseTemplateField.FILE:
+            return self.value_file.url if self.value_file else None
+        return getattr(self, self.VALUE_COLUMNS[field_type])
+
+    @staticmethod
+    def to_json(value: str | int | Decimal | FieldFile | None) -> str | int | None:
+        """
+        Converts a stored value to a JSON serializable one. Decimals become text to keep their precision and files
+        become their name.
+        """
+        if isinstance(value, Decimal):
+            return str(value.quantize(DECIMAL_QUANTUM))
+        if isinstance(value, FieldFile):
+            return value.name or None
+        return value
+
+    @property
+    def json_value(self) -> str | int | None:
+        """
+        Returns the value of the field in a JSON serializable form, see to_json.
+        """
+        field_type = self.field.field_type
+        if field_type == BaseTemplateField.STATIC:
+            return self.field.static_text
+        return self.to_json(getattr(self, self.VALUE_COLUMNS[field_type]))
+
+    @value.setter
+    def value(self, value: str | int | Decimal) -> None:
+        """
+        Stores a value in the column matching the field's type, converting it from text if needed.
+
+        :raises ValueError: If the value can't be converted to the field's type.
+        """
+        for column, converted in self.parse_value(self.field, value).items():
+            setattr(self, column, converted)
+
+    @classmethod
+    def parse_value(cls, field, value: str | int | Decimal) -> dict:
+        """
+        Converts a value for a template field, or the FieldDescriptor of one, so it can be validated without loading
+        the field.
+
+        :return: The value of each column storing it.
+        :raises ValueError: If the value can't be converted to the field's type.
+        """
+        field_type = field.field_type
+        if field_type == BaseTemplateField.TEXT:
+            return {"value_text": value}
+        if field_type == BaseTemplateField.INT:
+            return {"value_int": int(value)}
+        if field_type == BaseTemplateField.DECIMAL:
+            return {"value_decimal": parse_decimal(value)}
+        if field_type == BaseTemplateField.CHOICES:
+            if field.choices and value not in field.choices:
+                raise ValueError(f"{value!r} is not one of {list(field.choices)}.")
+            return {"value_choice": value}
+        if field_type == BaseTemplateField.MEASURE:
+            return {
+                "value_measure": value,
+                "value_measure_mm": round(parse_measure(value)),
+            }
+        raise ValueError(f"{field_type} fields can't be assigned a value.")
@@ -0,0 +1,110 @@
+import base64
+import binascii
+import json
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Field, Model, Q, QuerySet
+from django.db.models.constants import LOOKUP_SEP
+
+
+def encode_cursor(values: list) -> str:
+    return base64.urlsafe_b64encode(
+        json.dumps(values, cls=DjangoJSONEncoder).encode()
+    ).decode()
+
+
+def ordering_field(model: type[Model], path: str) -> Field:
+    """
+    Returns the model field an ordering refers to, following relations, ex: "location__name". Foreign keys resolve to
+    the field they point to.
+    """
+    opts = model._meta
+    *relations, name = path.split(LOOKUP_SEP)
+    for relation in relations:
+        opts = opts.get_field(relation).related_model._meta
+    field = opts.pk if name == "pk" else opts.get_field(name)
+    return field.target_field if field.is_relation else field
+
+
+def decode_cursor(cursor: str | None, fields: list[Field]) -> list | None:
+    """
+    Decodes the values of a cursor, converted to the Python types of the fields it orders by.
+
+    :return: The values encoded in the cursor, or None if the cursor is missing or malformed.
+    """
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, ValueError):
+        return None
+    if not isinstance(values, list) or len(values) != len(fields):
+        return None
+    try:
+        values = [field.to_python(value) for field, value in zip(fields, values)]
+        for field, value in zip(fields, values):
+            field.run_validators(value)
+    except (ValidationError, TypeError, ValueError):
+        return None
+    # NULL can't be seeked past, ordering fields aren't nullable.
+    if None in values:
+        return None
+    return values
+
+
+class KeysetPage:
+    """
+    One page of a keyset paginated queryset.
+    """
+
+    def __init__(self, object_list: list, next_cursor: str | None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self) -> int:
+        return len(self.object_list)
+
+
+def keyset_paginate(
+    queryset: QuerySet, ordering: tuple[str, ...], cursor: str | None, per_page: int
+) -> KeysetPage:
+    """
+    Returns the page of rows following the cursor, in ascending order of the given fields. Rows are found by seeking
+    past the last row of the previous page, so every page costs the same no matter how deep it is. The last ordering
+    field must be unique, ex: ("display_name", "pk"). A malformed cursor returns the first page.
+    """
+    queryset = queryset.order_by(*ordering)
+
+    after = decode_cursor(
+        cursor, [ordering_field(queryset.model, field) for field in ordering]
+    )
+    if after is not None:
+        # (a > x) or (a = x and b > y) or ...
+        conditions = []
+        for index, field in enumerate(ordering):
+            equal = {ordering[i]: after[i] for i in range(index)}
+            conditions.append(Q(**equal, **{f"{field}__gt": after[index]}))
+        queryset = queryset.filter(reduce(or_, conditions))
+
+    rows = list(queryset[: per_page + 1])
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        last = rows[-1]
+        next_cursor = encode_cursor(
+            [
+                last[field] if isinstance(last, dict) else getattr(last, field)
+                for field in ordering
+            ]
+        )
+    return KeysetPage(rows, next_cursor)
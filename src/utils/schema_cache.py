@@ -0,0 +1,103 @@
+import uuid
+
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import models
+
+# In-process schemas, keyed by (template model label, template pk), as (version, fields)
+_schemas: dict[tuple[str, int], tuple[str, tuple["FieldDescriptor", ...]]] = {}
+_stats = {"hits": 0, "misses": 0}
+
+# Backends whose version stamps other processes can't see, schemas aren't kept in process memory with them
+_UNSHARED_BACKENDS = (DummyCache, LocMemCache)
+
+
+class FieldDescriptor:
+    """
+    Immutable description of a template field, safe to share between requests.
+    """
+
+    __slots__ = (
+        "pk",
+        "name",
+        "attr_name",
+        "field_type",
+        "required",
+        "static_text",
+        "choices",
+    )
+
+    def __init__(self, field):
+        set_attr = super().__setattr__
+        set_attr("pk", field.pk)
+        set_attr("name", field.name)
+        set_attr("attr_name", field.attr_name)
+        set_attr("field_type", field.field_type)
+        set_attr("required", field.required)
+        set_attr("static_text", field.static_text)
+        set_attr("choices", tuple(field.choices) if field.choices else ())
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable.")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable.")
+
+    def __repr__(self) -> str:
+        return f"<FieldDescriptor {self.name} ({self.field_type})>"
+
+
+def _version_key(template_model: type[models.Model], template_pk: int) -> str:
+    return f"template_schema:{template_model._meta.label_lower}:{template_pk}"
+
+
+def get_template_schema(template: models.Model) -> tuple[FieldDescriptor, ...]:
+    """
+    Returns the fields of a ProductTemplate or InventoryChangeTemplate, in creation order.
+
+    Schemas are kept in process memory and checked against a version stamp in the Django cache, so every process
+    sharing the cache drops its copy when a field of the template is saved or deleted. With a cache other processes
+    can't see, such as local memory, the schema is loaded on every call instead.
+    """
+    if isinstance(caches[DEFAULT_CACHE_ALIAS], _UNSHARED_BACKENDS):
+        _stats["misses"] += 1
+        return _load_fields(template)
+
+    key = (template._meta.label_lower, template.pk)
+    version_key = _version_key(type(template), template.pk)
+
+    version = cache.get(version_key)
+    if version is None:
+        cache.add(version_key, uuid.uuid4().hex, None)
+        version = cache.get(version_key)
+
+    entry = _schemas.get(key)
+    if entry is not None and entry[0] == version:
+        _stats["hits"] += 1
+        return entry[1]
+
+    _stats["misses"] += 1
+    fields = _load_fields(template)
+    _schemas[key] = (version, fields)
+    return fields
+
+
+def _load_fields(template: models.Model) -> tuple[FieldDescriptor, ...]:
+    return tuple(FieldDescriptor(field) for field in template.fields.order_by("pk"))
+
+
+def invalidate_template_schema(
+    template_model: type[models.Model], template_pk: int
+) -> None:
+    """
+    Bumps the version stamp of a template's schema, every process reloads it on next use.
+    """
+    cache.set(_version_key(template_model, template_pk), uuid.uuid4().hex, None)
+
+
+def schema_cache_stats() -> dict[str, int]:
+    """
+    Returns hit and miss counters of this process' schema cache, for monitoring.
+    """
+    return {**_stats, "size": len(_schemas)}
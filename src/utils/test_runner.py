@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.db import connections
+from django.test.runner import DiscoverRunner
+
+from utils.db_routing import REPLICA_DB_ALIAS
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Serves static files unfingerprinted, so templates render without running collectstatic before the tests. Stands
+    a second local database in for the replica, which tests of database routing fill with simulate_replication and
+    read from with REPLICA_READS on. Other tests read everything from the primary.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        settings.DATABASES[REPLICA_DB_ALIAS] = {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": settings.BASE_DIR / "test_replica.sqlite3",
+            "OPTIONS": {"timeout": 20},
+            "TEST": {"NAME": settings.BASE_DIR / "test_replica.sqlite3"},
+        }
+        # Fills in the defaults of the new alias, django.db.connections has already read DATABASES.
+        connections.settings = connections.configure_settings(settings.DATABASES)
+        settings.REPLICA_READS = False
+        settings.STORAGES = {
+            **settings.STORAGES,
+            "staticfiles": {
+                "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"
+            },
+        }
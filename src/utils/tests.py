@@ -0,0 +1,97 @@
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from products.models import ProductTemplate, ProductTemplateField
+from utils.measure import convert_measure_to_mm, parse_measure
+from utils.schema_cache import get_template_schema
+
+
+class ParseMeasureTests(SimpleTestCase):
+    def test_formats(self):
+        measures = {
+            '6 5/8"': 168.275,
+            "6-5/8in": 168.275,
+            "6.625 inches": 168.275,
+            "5/8": 15.875,
+            ".5 in": 12.7,
+            "168.3 mm": 168.3,
+            "16.83cm": 168.3,
+            "2'": 609.6,
+            "2' 3-1/2\"": 698.5,
+            "2', 3 1/2": 698.5,
+            "2 ft. 3 in.": 685.8,
+            "1 yd": 914.4,
+            "1,000 mm": 1000,
+            "1,219.2 mm": 1219.2,
+            "12,345,678mm": 12345678,
+            "3": 76.2,
+        }
+        for measure, mm in measures.items():
+            with self.subTest(measure):
+                self.assertAlmostEqual(parse_measure(measure), mm)
+
+    def test_default_unit(self):
+        self.assertAlmostEqual(parse_measure("168.3", default_unit="mm"), 168.3)
+
+    def test_invalid(self):
+        for measure in [
+            "",
+            "  ",
+            "abc",
+            "3 parsecs",
+            "1/0",
+            "1 1/0",
+            "1,5 mm",
+            "1,0000 mm",
+            "12,34,567 mm",
+            "1,000,00 mm",
+        ]:
+            with self.subTest(measure):
+                with self.assertRaises(ValueError):
+                    parse_measure(measure)
+
+    def test_convert_to_mm(self):
+        self.assertEqual(convert_measure_to_mm('6 5/8"'), 168)
+        self.assertIsNone(convert_measure_to_mm("1,5 mm"))
+
+
+class TemplateSchemaTests(TestCase):
+    def setUp(self):
+        self.template = ProductTemplate.objects.create(
+            name="Pipe", format_string="{{OD}}"
+        )
+        self.add_field("OD")
+
+    def add_field(self, name: str) -> None:
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductTemplateField.objects.create(
+                template=self.template, name=name, field_type=ProductTemplateField.TEXT
+            )
+
+    def field_names(self) -> list[str]:
+        return [field.name for field in get_template_schema(self.template)]
+
+    def test_field_save_invalidates(self):
+        self.assertEqual(self.field_names(), ["OD"])
+        # Only the version stamp is read
+        with self.assertNumQueries(1):
+            self.assertEqual(self.field_names(), ["OD"])
+        self.add_field("Weight")
+        self.assertEqual(self.field_names(), ["OD", "Weight"])
+
+    def test_version_stamps_are_shared(self):
+        self.field_names()
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT cache_key FROM django_cache")
+            keys = [row[0] for row in cursor.fetchall()]
+        self.assertIn(
+            f":1:template_schema:products.producttemplate:{self.template.pk}", keys
+        )
+
+    @override_settings(
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+    )
+    def test_local_memory_cache_isnt_trusted(self):
+        for _ in range(2):
+            with self.assertNumQueries(1):
+                self.assertEqual(self.field_names(), ["OD"])
@@ -0,0 +1,18 @@
+// Counts forms htmx appends to a formset, so Django sees them in TOTAL_FORMS.
+document.addEventListener('DOMContentLoaded', () => {
+    document.body.addEventListener('htmx:afterSwap', function(event) {
+        const formsDiv = event.target;
+
+        if (!formsDiv.id || !formsDiv.id.endsWith('-forms')) return;
+
+        const prefix = formsDiv.id.replace('-forms', '');
+        const formsetDiv = formsDiv.closest('.formset');
+        if (!formsetDiv) return;
+
+        const totalFormsInput = formsetDiv.querySelector(`input[name="${prefix}-TOTAL_FORMS"]`);
+        if (totalFormsInput) {
+            totalFormsInput.value = parseInt(totalFormsInput.value) + 1;
+            console.log(`Incremented TOTAL_FORMS for ${prefix} to ${totalFormsInput.value}`);
+        }
+    });
+});
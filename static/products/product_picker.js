@@ -0,0 +1,33 @@
+// Keeps the products picked in a ProductPickerWidget across searches, and out of its results.
+document.addEventListener('DOMContentLoaded', () => {
+    // The search box has no name, so it isn't posted with the form. Its query is added to the requests it makes here.
+    document.body.addEventListener('htmx:configRequest', function(event) {
+        const search = event.detail.elt;
+        if (!search.classList.contains('product-picker-search')) return;
+
+        event.detail.parameters.q = search.value;
+    });
+
+    // Checking a result moves it to the selected products, which searches don't replace.
+    document.body.addEventListener('change', function(event) {
+        const checkbox = event.target;
+        const results = checkbox.closest('.product-picker-results');
+        if (!results || !checkbox.checked) return;
+
+        const selected = results.closest('.product-picker').querySelector('.product-picker-selected');
+        selected.appendChild(checkbox.closest('label'));
+    });
+
+    // Results that are already selected, checked or not, are dropped so they aren't listed twice.
+    document.body.addEventListener('htmx:afterSwap', function(event) {
+        const picker = event.target.closest('.product-picker');
+        if (!picker) return;
+
+        const selected = new Set(
+            Array.from(picker.querySelectorAll('.product-picker-selected input'), input => input.value)
+        );
+        picker.querySelectorAll('.product-picker-results input').forEach(input => {
+            if (selected.has(input.value)) input.closest('label').remove();
+        });
+    });
+});